@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+description = '''
+Compare benchmark results saved by run_benchmarks.py against a stored
+baseline (an earlier run, on the same machine), and report the change in
+the time spent in each phase of each workload.  A phase has regressed if
+its median time has gone up by more than --threshold (as a fraction of the
+baseline), and by more than --noise times the run-to-run spread of the
+repeats.  Exits with status 1 if anything has regressed.
+
+Run from the top of the repository, as
+
+    python -m benchmarks.compare baseline.json results.json
+'''
+
+import collections
+import json
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+
+Comparison = collections.namedtuple("Comparison",
+                                    ["benchmark", "params", "phase",
+                                     "baseline", "current", "ratio", "noise",
+                                     "status"])
+Comparison.__doc__ = '''
+The change in one phase of one workload: ``baseline`` and ``current`` are
+the median times, ``noise`` the run-to-run spread of the difference, and
+``status`` is one of ``'regressed'``, ``'improved'`` or ``'same'``.
+'''
+
+
+def load_results(path):
+    """
+    Read results saved by run_benchmarks.py.
+
+    :param str path: The JSON file.
+    :return dict: The environment, number of repeats and results.
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _key(result):
+    return (result['benchmark'], json.dumps(result['params'], sort_keys=True))
+
+
+def _spread(x):
+    # a robust estimate of the standard deviation: the scaled median
+    # absolute deviation
+    return 1.4826 * np.median(np.abs(x - np.median(x)))
+
+
+def compare_phase(baseline, current, threshold=0.1, noise=3.0, min_time=0.01):
+    """
+    Decide whether the time spent in a phase has changed significantly
+    between two sets of repeated runs.
+
+    :param list baseline: The times of the baseline runs.
+    :param list current: The times of the current runs.
+    :param float threshold: The smallest relative change that counts.
+    :param float noise: The number of times the spread of the runs a change
+        must be to count.
+    :param float min_time: Changes smaller than this many seconds don't count.
+    :return tuple: The two medians, their ratio, the noise in the difference,
+        and the status.
+    """
+    baseline = np.asarray(baseline, dtype=np.float64)
+    current = np.asarray(current, dtype=np.float64)
+    base = float(np.median(baseline))
+    cur = float(np.median(current))
+    ratio = cur / base if base > 0 else (1.0 if cur == 0 else float('inf'))
+    spread = float(np.hypot(_spread(baseline), _spread(current)))
+    diff = cur - base
+    big_enough = (abs(diff) > max(threshold * base, noise * spread, min_time))
+    if big_enough and diff > 0:
+        status = 'regressed'
+    elif big_enough and diff < 0:
+        status = 'improved'
+    else:
+        status = 'same'
+    return base, cur, ratio, spread, status
+
+
+def compare(baseline, current, **kwargs):
+    """
+    Compare each phase of each workload in ``current`` with the same phase
+    of the same workload (with the same parameters) in ``baseline``.
+    Workloads or phases missing from either are skipped.  Other arguments
+    are passed to ``compare_phase``.
+
+    :param dict baseline: Results, as from ``load_results``.
+    :param dict current: Results, as from ``load_results``.
+    :return list: A list of :class:`Comparison`.
+    """
+    base_results = {_key(r): r for r in baseline['results']}
+    out = []
+    for result in current['results']:
+        base = base_results.get(_key(result))
+        if base is None:
+            continue
+        for phase, times in result['phases'].items():
+            if phase not in base['phases']:
+                continue
+            out.append(Comparison(result['benchmark'], result['params'], phase,
+                                  *compare_phase(base['phases'][phase], times,
+                                                 **kwargs)))
+    return out
+
+
+def _format_params(params):
+    return " ".join("{}={}".format(k, v) for k, v in sorted(params.items()))
+
+
+def report(comparisons, baseline, current, show_all=False, file=sys.stdout):
+    """
+    Print a table of the comparisons: by default only of phases that changed,
+    and any differences in the versions the two were run with.
+    """
+    for key in sorted(set(baseline['environment']) | set(current['environment'])):
+        if key == 'date':
+            continue
+        a = baseline['environment'].get(key)
+        b = current['environment'].get(key)
+        if a != b:
+            print("{}: {} -> {}".format(key, a, b), file=file)
+    print("{:<10} {:<14} {:>10} {:>10} {:>7} {:>9}  {}".format(
+          "benchmark", "phase", "baseline", "current", "ratio", "noise",
+          "parameters"), file=file)
+    for c in comparisons:
+        if not (show_all or c.status != 'same'):
+            continue
+        print("{:<10} {:<14} {:>10.4f} {:>10.4f} {:>7.2f} {:>9.4f}  {}{}".format(
+              c.benchmark, c.phase, c.baseline, c.current, c.ratio, c.noise,
+              _format_params(c.params),
+              "  ** REGRESSED **" if c.status == 'regressed' else
+              "  (improved)" if c.status == 'improved' else ""),
+              file=file)
+    regressed = sum(c.status == 'regressed' for c in comparisons)
+    improved = sum(c.status == 'improved' for c in comparisons)
+    print("{} phases compared: {} regressed, {} improved.".format(
+          len(comparisons), regressed, improved), file=file)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=description)
+    parser.add_argument("baseline", type=str,
+            help="the stored baseline results")
+    parser.add_argument("current", type=str,
+            help="the results to compare to the baseline")
+    parser.add_argument("-t", "--threshold", dest="threshold", type=float,
+            help="relative increase in time that counts as a regression",
+            default=0.1)
+    parser.add_argument("--noise", dest="noise", type=float,
+            help="number of times the spread of repeated runs an increase "
+                 "must be to count", default=3.0)
+    parser.add_argument("--min_time", dest="min_time", type=float,
+            help="increases of fewer seconds than this don't count",
+            default=0.01)
+    parser.add_argument("-p", "--phases", dest="phases", nargs="+",
+            help="only compare these phases (default: all)", default=None)
+    parser.add_argument("-a", "--all", dest="show_all", action="store_true",
+            help="show phases that did not change too")
+    args = parser.parse_args(argv)
+
+    baseline = load_results(args.baseline)
+    current = load_results(args.current)
+    comparisons = compare(baseline, current, threshold=args.threshold,
+                          noise=args.noise, min_time=args.min_time)
+    if args.phases is not None:
+        comparisons = [c for c in comparisons if c.phase in args.phases]
+    report(comparisons, baseline, current, show_all=args.show_all)
+    if any(c.status == 'regressed' for c in comparisons):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
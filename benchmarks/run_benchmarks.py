@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+description = '''
+Time the main steps of recording a simulation with ftprime: adding
+individuals and records to an ARGrecorder, parsing simuPOP Recombinator
+output with a RecombCollector (in text and binary modes), and updating
+times, sorting and simplifying, across a grid of population sizes, numbers
+of generations, recombination rates and simplify intervals.  simuPOP is not
+needed: the ARGrecorder workloads use the Wright-Fisher driver in tests/wf,
+and the RecombCollector workloads are fed synthetic Recombinator output,
+from ftprime.RecombGenerator.
+Each workload is run --repeats times, and the time spent in each phase
+(CPU seconds, as in Timings.times) in each run is saved as JSON.
+
+Run from the top of the repository, as
+
+    python -m benchmarks.run_benchmarks -o results.json
+'''
+
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time as timer
+from argparse import ArgumentParser
+
+import msprime
+import numpy as np
+
+import ftprime
+from ftprime.benchmarker import Timings
+from tests.wf import wf
+from tests.wf.breakpoints import random_breakpoint
+
+BENCHMARKS = ('recording', 'wf', 'parsing', 'simplify')
+
+
+def _cpu_times(timings, total):
+    times = timings.times
+    times['total'] = total
+    return times
+
+
+def time_recording(N, generations, seed):
+    '''
+    Time adding ``N`` new haploid individuals and their records per generation
+    to an ARGrecorder, one at a time with ``add_individual`` and
+    ``add_record`` and all at once with ``add_individuals`` and
+    ``add_records``, without simplifying.
+    '''
+    random.seed(seed)
+    init_ts = msprime.simulate(N, random_seed=seed)
+    times = dict.fromkeys(['add_individual', 'add_record', 'add_individuals',
+                           'add_records'], 0.0)
+    single = ftprime.ARGrecorder(ts=init_ts,
+                                 node_ids={k: k for k in range(N)})
+    batch = ftprime.ARGrecorder(ts=init_ts,
+                                node_ids={k: k for k in range(N)})
+    pop = list(range(N))
+    for t in range(1, generations + 1):
+        children = np.arange(t * N, (t + 1) * N)
+        lparents = [random.choice(pop) for _ in range(N)]
+        rparents = [random.choice(pop) for _ in range(N)]
+        bps = [random_breakpoint() for _ in range(N)]
+        start = timer.process_time()
+        for child in children.tolist():
+            single.add_individual(child, t)
+        mid = timer.process_time()
+        for child, lp, rp, bp in zip(children.tolist(), lparents,
+                                     rparents, bps):
+            single.add_record(0.0, bp, lp, (child,))
+            single.add_record(bp, 1.0, rp, (child,))
+        end = timer.process_time()
+        times['add_individual'] += mid - start
+        times['add_record'] += end - mid
+        start = timer.process_time()
+        batch.add_individuals(children, t)
+        mid = timer.process_time()
+        batch.add_records(lefts=np.concatenate([np.zeros(N), bps]),
+                          rights=np.concatenate([bps, np.ones(N)]),
+                          parents=np.concatenate([lparents, rparents]),
+                          children=np.concatenate([children, children]))
+        end = timer.process_time()
+        times['add_individuals'] += mid - start
+        times['add_records'] += end - mid
+        pop = children.tolist()
+    times['total'] = sum(times.values())
+    return times, {'edges': batch.num_edges}
+
+
+def time_wf(N, generations, simplify_interval, seed):
+    '''
+    Time the Wright-Fisher simulation of tests/wf.
+    '''
+    timings = Timings()
+    start = timer.process_time()
+    wf(N=N, ngens=generations, nsamples=min(N, 10),
+       simplify_interval=simplify_interval, seed=seed, timings=timings)
+    return _cpu_times(timings, timer.process_time() - start), {}
+
+
+def _collector(gen, mode, seed):
+    init_ts = msprime.simulate(2 * gen.N, length=gen.num_loci - 1,
+                               random_seed=seed)
+    return ftprime.RecombCollector(ts=init_ts, node_ids=gen.node_ids,
+                                   locus_position=list(range(gen.num_loci)),
+                                   benchmark=Timings(), mode=mode, seed=seed)
+
+
+def time_parsing(N, generations, num_loci, recomb_rate, mode, seed):
+    '''
+    Time ``RecombCollector.collect_recombs`` on synthetic output for
+    ``generations`` generations of ``N`` diploids, without simplifying.  The
+    output is all made before timing starts.
+    '''
+    gen = ftprime.RecombGenerator(N, num_loci, recomb_rate, seed=seed)
+    rc = _collector(gen, mode, seed)
+    outputs = list(gen.generate(generations, binary=(mode == 'binary')))
+    start = timer.process_time()
+    for lines in outputs:
+        rc.increment_time()
+        rc.collect_recombs(lines)
+    times = _cpu_times(rc.args.timings, timer.process_time() - start)
+    return times, {'bytes': sum(len(x) for x in outputs)}
+
+
+def time_simplify(N, generations, num_loci, recomb_rate, simplify_interval,
+                  seed):
+    '''
+    Time a RecombCollector fed synthetic output for ``generations``
+    generations of ``N`` diploids, which updates times and simplifies every
+    ``simplify_interval`` generations.  The time to make the output is not
+    counted.
+    '''
+    gen = ftprime.RecombGenerator(N, num_loci, recomb_rate, seed=seed)
+    rc = _collector(gen, 'binary', seed)
+    update_time = total = 0.0
+    for t in range(1, generations + 1):
+        lines = gen.next_output(binary=True)
+        start = timer.process_time()
+        rc.increment_time()
+        rc.collect_recombs(lines)
+        if t % simplify_interval == 0:
+            mid = timer.process_time()
+            rc.args.update_times()
+            update_time += timer.process_time() - mid
+            rc.simplify(gen.population)
+        total += timer.process_time() - start
+    times = _cpu_times(rc.args.timings, total)
+    times['update_times'] = update_time
+    return times, {'edges': rc.args.num_edges}
+
+
+def _grid(**params):
+    keys = sorted(params)
+    for values in itertools.product(*[params[k] for k in keys]):
+        yield dict(zip(keys, values))
+
+
+def workloads(args):
+    '''
+    The workloads to run: a list of (benchmark name, function, parameters).
+    '''
+    out = []
+    if 'recording' in args.benchmarks:
+        for params in _grid(N=args.popsize, generations=args.generations):
+            out.append(('recording', time_recording, params))
+    if 'wf' in args.benchmarks:
+        for params in _grid(N=args.popsize, generations=args.generations,
+                            simplify_interval=args.simplify_interval):
+            out.append(('wf', time_wf, params))
+    if 'parsing' in args.benchmarks:
+        for params in _grid(N=args.popsize, generations=args.generations,
+                            num_loci=args.nloci, recomb_rate=args.recomb_rate,
+                            mode=['text', 'binary']):
+            out.append(('parsing', time_parsing, params))
+    if 'simplify' in args.benchmarks:
+        for params in _grid(N=args.popsize, generations=args.generations,
+                            num_loci=args.nloci, recomb_rate=args.recomb_rate,
+                            simplify_interval=args.simplify_interval):
+            out.append(('simplify', time_simplify, params))
+    return out
+
+
+def environment():
+    '''
+    Describe the versions of things that the results depend on.
+    '''
+    try:
+        commit = subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': timer.strftime("%Y-%m-%dT%H:%M:%S"),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'msprime': msprime.__version__,
+            'numpy': np.__version__}
+
+
+def run(args):
+    '''
+    Run every workload ``args.repeats`` times, and return the results: for
+    each, a dict giving the benchmark, the parameters, and lists of the
+    time spent in each phase and of the sizes of things (numbers of edges,
+    bytes of output), with one entry per repeat.
+    '''
+    results = []
+    for name, fn, params in workloads(args):
+        phases = {}
+        sizes = {}
+        for rep in range(args.repeats):
+            times, size = fn(seed=args.seed + rep, **params)
+            for phase, value in times.items():
+                phases.setdefault(phase, []).append(value)
+            for key, value in size.items():
+                sizes.setdefault(key, []).append(value)
+        results.append({'benchmark': name, 'params': params,
+                        'phases': phases, 'sizes': sizes})
+        print(name, " ".join("{}={}".format(k, v) for k, v in
+                             sorted(params.items())),
+              "total: {:.4f}".format(float(np.median(phases['total']))),
+              file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=description)
+    parser.add_argument("-o", "--outfile", dest="outfile", type=str,
+            help="name of the JSON file to save results to (default: stdout)",
+            default=None)
+    parser.add_argument("-b", "--benchmarks", dest="benchmarks", nargs="+",
+            choices=BENCHMARKS, help="which benchmarks to run (default: all)",
+            default=list(BENCHMARKS))
+    parser.add_argument("-N", "--popsize", dest="popsize", type=int,
+            nargs="+", help="population sizes", default=[100, 1000])
+    parser.add_argument("-T", "--generations", dest="generations", type=int,
+            nargs="+", help="numbers of generations", default=[50])
+    parser.add_argument("-r", "--recomb_rate", dest="recomb_rate",
+            type=float, nargs="+",
+            help="probabilities of crossover between adjacent loci",
+            default=[0.001, 0.01])
+    parser.add_argument("-l", "--nloci", dest="nloci", type=int, nargs="+",
+            help="numbers of loci", default=[1000])
+    parser.add_argument("--gc", "-G", dest="simplify_interval", type=int,
+            nargs="+", help="intervals between simplify steps",
+            default=[10, 50])
+    parser.add_argument("-n", "--repeats", dest="repeats", type=int,
+            help="number of times to run each workload", default=3)
+    parser.add_argument("-s", "--seed", dest="seed", type=int,
+            help="random seed of the first repeat", default=1)
+    args = parser.parse_args(argv)
+
+    out = {'environment': environment(),
+           'repeats': args.repeats,
+           'results': run(args)}
+    if args.outfile is None:
+        json.dump(out, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.outfile, 'w') as f:
+            json.dump(out, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,13 @@ Simulate a chromosome with a single selected loci using simuPOP.
 '''
 
 import gzip
+import os
 import sys
 from argparse import ArgumentParser
 import math
 import time
 import random
-from ftprime import RecombCollector
+from ftprime import RecombCollector, SimplifyPolicy
 import msprime
 
 REPORTING_STEP = 50
@@ -39,6 +40,14 @@ parser.add_argument("-o","--outfile", dest="outfile", type=str,
         help="name of output PED file (default: not output)", default=None)
 parser.add_argument("--gc", "-G", dest="simplify_interval", type=int,
         help="Interval between simplify steps.", default=500)
+parser.add_argument("--max_edges", dest="max_edges", type=int,
+        help="simplify whenever this many edges have been added since the last "
+             "simplify step, instead of every --gc generations", default=None)
+parser.add_argument("--checkpoint", dest="checkpoint", type=str,
+        help="directory to save the population and the recorder to every "
+             "--checkpoint_interval generations (default: none)", default=None)
+parser.add_argument("--checkpoint_interval", dest="checkpoint_interval", type=int,
+        help="Interval between checkpoints.", default=1000)
 parser.add_argument("-g","--logfile", dest="logfile", type=str,
         help="name of log file (or '-' for stdout)", default="-")
 parser.add_argument("-s","--selloci_file", dest="selloci_file", type=str,
@@ -140,8 +149,29 @@ init_ts = msprime.simulate(2*len(first_gen),
 haploid_labels = [(k,p) for k in first_gen
                         for p in (0,1)]
 node_ids = {x:j for x, j in zip(haploid_labels, init_ts.samples())}
+if args.max_edges is None:
+    simplify_policy = None
+else:
+    simplify_policy = SimplifyPolicy(max_unsimplified_edges=args.max_edges)
 rc = RecombCollector(ts=init_ts, node_ids=node_ids,
-                     locus_position=locus_position)
+                     locus_position=locus_position,
+                     simplify_policy=simplify_policy)
+
+if simplify_policy is None:
+    simplify_op = sim.PyOperator(lambda pop: rc.simplify(pop.indInfo("ind_id")) or True,
+                                 step=args.simplify_interval)
+else:
+    simplify_op = sim.PyOperator(lambda pop: rc.maybe_simplify(pop.indInfo("ind_id")) or True)
+
+def checkpoint(pop):
+    rc.save(args.checkpoint)
+    pop.save(os.path.join(args.checkpoint, "population.pop"))
+    return True
+
+if args.checkpoint is None:
+    checkpoint_ops = []
+else:
+    checkpoint_ops = [sim.PyOperator(checkpoint, step=args.checkpoint_interval)]
 
 # initially, population is monogenic
 init_geno=[sim.InitGenotype(freq=1.0)]
@@ -167,9 +197,8 @@ pop.evolve(
         sim.Stat(numOfSegSites=sim.ALL_AVAIL, step=REPORTING_STEP,
                  vars=['numOfSegSites', 'numOfFixedSites']),
         sim.PyEval(r"'Gen: %2d #seg/#fixed sites: %d / %d\n' % (gen, numOfSegSites, numOfFixedSites)", step=REPORTING_STEP),
-        sim.PyOperator(lambda pop: rc.simplify(pop.indInfo("ind_id")) or True,
-                       step=args.simplify_interval),
-    ],
+        simplify_op,
+    ] + checkpoint_ops,
     gen = args.generations
 )
 
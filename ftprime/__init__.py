@@ -1,2 +1,9 @@
 from .argrecorder import *
+from .edge_buffer import *
+from .id_map import *
 from .recomb_collector import *
+from .recomb_generator import *
+from .recomb_parser import *
+from .scheduler import *
+from .server import *
+from .sharded import *
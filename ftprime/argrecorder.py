@@ -1,8 +1,152 @@
+import collections
+import concurrent.futures
+import json
+import numbers
+import os
+import shutil
+import tempfile
 import msprime
 import time as timer  # otherwise name clash
 import numpy as np
 
-NULL_ID = -1
+from .edge_buffer import EdgeBuffer, DEFAULT_CHUNK_SIZE
+from .id_map import DenseIdMap, NULL_ID
+from . import storage
+
+# rough memory used per row of the tables, and per entry of a dict
+_NODE_BYTES = 16
+_EDGE_BYTES = 24
+_DICT_ENTRY_BYTES = 100
+
+# the cost of changing one row of a table in place, relative to the cost per
+# row of rewriting a whole column
+_ROW_UPDATE_COST = 1000
+
+# the order that msprime requires edges to be sorted in
+_EDGE_KEY_DTYPE = np.dtype([('time', np.float64), ('parent', np.int32),
+                            ('child', np.int32), ('left', np.float64)])
+
+
+def _id_array(input_ids):
+    """
+    Return the input IDs as a numpy array of int64, raising a ValueError if
+    any are not integers.
+    """
+    input_ids = np.asarray(input_ids)
+    if input_ids.size == 0:
+        return input_ids.astype(np.int64).reshape(input_ids.shape)
+    if input_ids.dtype.kind not in 'iu':
+        raise ValueError("Input IDs must be integers, not " +
+                         repr(input_ids.ravel()[0]) + ".")
+    return input_ids.astype(np.int64, copy=False)
+
+
+def _edge_keys(time, left, parent, child):
+    """
+    Return a structured array of the keys that edges are sorted by.
+    """
+    keys = np.empty(len(left), dtype=_EDGE_KEY_DTYPE)
+    keys['time'] = time[parent]
+    keys['parent'] = parent
+    keys['child'] = child
+    keys['left'] = left
+    return keys
+
+
+def _keys_in_order(a, b):
+    """
+    Elementwise test of whether the edge keys in ``a`` are less than or equal
+    to those in ``b``.
+    """
+    less = np.zeros(len(a), dtype=bool)
+    equal = np.ones(len(a), dtype=bool)
+    for name in _EDGE_KEY_DTYPE.names:
+        less |= equal & (a[name] < b[name])
+        equal &= (a[name] == b[name])
+    return less | equal
+
+
+# the process that simplifies in the background, shared by all ARGrecorders
+_simplify_executor = None
+
+
+def _sort_edges(time, edges, start):
+    """
+    Sort an EdgeTable whose first ``start`` edges are already sorted: the
+    rest are sorted, and then merged with those if they don't all belong
+    after them.
+
+    :param array time: The node times.
+    :param EdgeTable edges: The edges.
+    :param int start: The number of edges already sorted.
+    :return int: The first row of the table that was changed.
+    """
+    num_edges = edges.num_rows
+    left = edges.left
+    right = edges.right
+    parent = edges.parent
+    child = edges.child
+    tail = _edge_keys(time, left[start:], parent[start:], child[start:])
+    if not np.all(_keys_in_order(tail[:-1], tail[1:])):
+        order = np.lexsort([tail[name] for name in
+                            reversed(_EDGE_KEY_DTYPE.names)])
+        tail = tail[order]
+        order += start
+        left[start:] = left[order]
+        right[start:] = right[order]
+        parent[start:] = parent[order]
+        child[start:] = child[order]
+        reordered = True
+    else:
+        reordered = False
+    if start > 0:
+        last = _edge_keys(time, left[start-1:start],
+                          parent[start-1:start], child[start-1:start])
+        merge = not _keys_in_order(last, tail[:1])[0]
+    else:
+        merge = False
+    if merge:
+        # positions of the new edges among the already sorted ones
+        head = _edge_keys(time, left[:start], parent[:start], child[:start])
+        pos = np.searchsorted(head, tail, side='right')
+        new_index = np.empty(num_edges, dtype=np.int64)
+        new_index[start:] = pos + np.arange(num_edges - start)
+        new_index[:start] = (np.arange(start) +
+                             np.searchsorted(pos, np.arange(start),
+                                             side='right'))
+        out = [np.empty_like(x) for x in (left, right, parent, child)]
+        for x, y in zip(out, (left, right, parent, child)):
+            x[new_index] = y
+        edges.set_columns(left=out[0], right=out[1],
+                          parent=out[2], child=out[3])
+        return int(pos[0])
+    elif reordered:
+        edges.truncate(start)
+        edges.append_columns(left=left[start:], right=right[start:],
+                             parent=parent[start:], child=child[start:])
+        return start
+    return num_edges
+
+
+def _background_executor():
+    global _simplify_executor
+    if _simplify_executor is None:
+        _simplify_executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+    return _simplify_executor
+
+
+def _simplify_file(in_path, out_path, samples, **kwargs):
+    """
+    Simplify the tree sequence stored in ``in_path`` and write the result to
+    ``out_path``, returning the map from old to new node IDs.  This is run in
+    another process by ``ARGrecorder.simplify(background=True)``; other
+    arguments are passed on to ``simplify``.
+    """
+    tables = msprime.load(in_path).dump_tables()
+    node_map = tables.simplify(samples=samples, **kwargs)
+    tables.tree_sequence().dump(out_path)
+    return node_map
+
 
 def null_tree_sequence():
     return msprime.load_tables(nodes=msprime.NodeTable(),
@@ -18,16 +162,29 @@ class ARGrecorder(object):
     individual IDs always equal to the (output) node IDs is to allow periodic
     simplification, which decouples the two.
 
-    Between simplification steps, the EdgeTable is appended to, so it is
-    always "up to date".  However, the NodeTable is *not* kept up to date,
+    Between simplification steps, new edges are collected in an
+    :class:`ftprime.EdgeBuffer`, which is moved into the EdgeTable at the next
+    ``simplify`` or ``tree_sequence`` (or whenever ``self.edges`` is accessed),
+    so the EdgeTable is "up to date" whenever it is looked at.  With
+    ``max_edge_bytes``, the buffer moves older edges to disk, so that
+    simplifying less often need not use more memory.  However, the
+    NodeTable is *not* kept up to date,
     because its `time` fields are recorded in *time ago*; we also keep track of
         - a list of birth times of individual IDs
     which are translated to time-ago at each simplification step, and appended
-    to the Node Table.
+    to the Node Table.  Alternatively, if ``relative_times`` is True, node
+    times are stored as time before the start of the simulation (which is
+    negative for individuals born since), so that they never need updating;
+    the tree sequences returned by ``tree_sequence`` are shifted to time ago
+    as usual.
 
     The internal state is stored using
         - ``self.node_ids[k]`` : the output Node ID corresponding to the input
-          individual ID ``k``.
+          individual ID ``k``.  This is a dict, or if ``dense_ids`` is True a
+          :class:`ftprime.DenseIdMap`, which uses much less memory if input IDs
+          are allocated in increasing order.  Either way, input IDs must be
+          integers (nonnegative, for a DenseIdMap), and a ValueError is
+          raised for any that are not.
 
     Must be initialized with a set of tables which will serve as the history of
     this first generation of individuals.
@@ -44,10 +201,21 @@ class ARGrecorder(object):
 
         b. how their chromosome was inherited from her parents with ``add_record``.
 
+        A whole generation may be recorded at once using the array-valued
+        ``add_individuals`` and ``add_records``.
+
     2. Periodically, run ``simplify(samples)`` to remove unnecessary
         information from the recorded tables.  ``samples`` should be a list of
         input IDs of all individuals whose history may be needed in the future:
-        the current generation, and any ancestral samples.
+        the current generation, and any ancestral samples.  Alternatively,
+        provide a :class:`ftprime.SimplifyPolicy` and call
+        ``maybe_simplify(samples)`` every generation.
+
+    Simplification may be run in a separate process, with
+    ``simplify(samples, background=True)``, while recording continues.  In the
+    meantime, individuals that are added get provisional node IDs, which are
+    updated (along with ``self.nodes``) when the simplify finishes; this
+    happens automatically when needed, or can be done with ``wait()``.
 
     Note: at any time, individuals for whom we have complete information are
     marked as samples in the Node Table; however, this is not consulted when
@@ -57,7 +225,11 @@ class ARGrecorder(object):
 
     def __init__(self, node_ids=None, nodes=None, edges=None, sites=None, 
                  mutations=None, migrations=None, ts=None, time=0.0,
-                 sequence_length=None, timings=None):
+                 sequence_length=None, timings=None, dense_ids=False,
+                 expected_edges_per_generation=None, relative_times=False,
+                 simplify_policy=None, background_simplify=False,
+                 max_edge_bytes=None, spill_dir=None, executor=None,
+                 snapshot_cache_size=8):
         """
         The tables passed in define history before the simulation begins.  If
         these are missing, then the input IDs specified in ``node_ids`` must be
@@ -77,34 +249,63 @@ class ARGrecorder(object):
             the simulation.
         :param float sequence_length: The total length of the sequence (derived
             from input if not provided).
-        :param ftprime.benchmarker.Timings timings:  An object to record timing
-        information.
+        :param ftprime.benchmarker.Timings timings:  An object to record an
+            event for each step of work done (sorting, simplifying, etc).
+        :param bool dense_ids: Whether to store the map from input IDs to
+            output IDs in a :class:`ftprime.DenseIdMap` rather than a dict
+            (input IDs must then be nonnegative integers).
+        :param int expected_edges_per_generation: The (rough) number of edges
+            expected to be added per generation, used to size the chunks of
+            the buffer that edges are collected in between simplifications.
+        :param bool relative_times: Whether to store node times in the
+            NodeTable relative to the start of the simulation, rather than
+            updating them to be times ago at each simplification.
+        :param SimplifyPolicy simplify_policy: Decides when
+            ``maybe_simplify`` actually simplifies.
+        :param bool background_simplify: Whether ``simplify`` runs in the
+            background by default.
+        :param int max_edge_bytes: If given, once the edges added since the
+            last simplify take up more than this much memory, older ones are
+            moved to memory-mapped files until the next simplify.
+        :param str spill_dir: Where to put those files (by default, the
+            system's temporary directory).
+        :param concurrent.futures.Executor executor: A process pool to run
+            background simplifies in (by default, a single process shared by
+            all ARGrecorders).
+        :param int snapshot_cache_size: The number of tree sequences returned
+            by ``tree_sequence`` to keep, for repeated calls.
         """
+        self.timings = timings
         if timings is not None:
-            self.timings = timings
-            start = timer.process_time()
-        else:
-            self.timings = None
+            start = (timer.perf_counter(), timer.process_time(), 0, 0)
 
         # this is the largest (forwards) time seen so far
         self.max_time = time  # T
+        # the (forwards) time that node times are measured back from,
+        # if relative_times; otherwise this moves forwards with max_time
+        self.relative_times = relative_times
+        self.epoch = time
         # dict of output node IDs indexed by input labels
-        if node_ids is None:
+        self.dense_ids = dense_ids
+        if dense_ids:
+            self.node_ids = DenseIdMap(node_ids)
+        elif node_ids is None:
             self.node_ids = {}
         else:
             self.node_ids = dict(node_ids)
+            _id_array(list(self.node_ids.keys()))
         # the actual tables that get updated
         #  DON'T actually store ts, just the tables:
         if ts is None:
             tables = msprime.TableCollection()
             for j, k in enumerate(sorted(self.node_ids.keys())):
                 assert j == self.node_ids[k]
-                tables.nodes.add_row(population=msprime.NULL_POPULATION, time=time)
+                tables.nodes.add_row(population=msprime.NULL_POPULATION,
+                                     time=(0.0 if relative_times else time))
         else:
             tables = ts.dump_tables()
         self.table_collection = tables
         self.nodes = tables.nodes
-        self.edges = tables.edges
         self.sites = tables.sites
         self.mutations = tables.mutations
         self.migrations = tables.migrations
@@ -122,6 +323,14 @@ class ARGrecorder(object):
             else:
                 raise ValueError("If prior history is not specified, sequence",
                                  "length must be provided.")
+        # edges added since they were last moved into the EdgeTable
+        if expected_edges_per_generation is None:
+            expected_edges_per_generation = DEFAULT_CHUNK_SIZE
+        self.edge_buffer = EdgeBuffer(chunk_size=expected_edges_per_generation,
+                                      max_bytes=max_edge_bytes,
+                                      spill_dir=spill_dir)
+        # number of edges at the start of the EdgeTable known to be sorted
+        self.num_sorted_edges = self._sorted_prefix() if ts is not None else 0
         # last (forwards) time we updated node times
         self.last_update_time = time  # T_0
         # number of nodes that have the time right
@@ -131,10 +340,54 @@ class ARGrecorder(object):
         self.site_positions = {p:k for k, p in enumerate(self.sites.position)}
         # for bookkeeping
         self.num_simplifies = 0
+        self.simplify_policy = simplify_policy
+        # number of edges after the last simplify, and when it happened
+        self.last_simplify_edges = tables.edges.num_rows
+        self.last_simplify_end = timer.perf_counter()
+        # wall-clock time taken by the last simplify
+        self.last_simplify_cost = None
+        self.background_simplify = background_simplify
+        # while simplifying in the background, this is the number of nodes
+        # before simplification, and new nodes are stored in a separate table
+        self.node_offset = 0
+        self._pending_simplify = None
+        self.executor = executor
+        # extra arguments to TableCollection.simplify
+        self._simplify_kwargs = {}
+        # the map from node IDs before the last simplify to those after it
+        self.node_map = None
+        # for incremental checkpoints: the numbers of leading rows of the
+        # NodeTable and EdgeTable unchanged since the last checkpoint, and
+        # what was written then
+        self.checkpoint_nodes = 0
+        self.checkpoint_edges = 0
+        self._checkpoint = None
+        # incremented whenever anything is recorded, and the most recently
+        # used tree sequences, by (version, sample nodes)
+        self.version = 0
+        self.snapshot_cache_size = snapshot_cache_size
+        self._snapshots = collections.OrderedDict()
+        # the nodes flagged as samples among the first _num_tracked_nodes
+        # nodes, or None if these need to be found from the flags; the flags
+        # of nodes added since then are read from the NodeTable when needed
+        self._sample_nodes = None
+        self._num_tracked_nodes = 0
         if self.timings is not None:
-            self.timings.time_prepping += timer.process_time() - start
+            self.timings.instrument(self, self._TIMED_METHODS, self)
+            self.timings.record('prepping', self, start)
+
+    # the methods that record an event with the Timings, if there is one,
+    # and the kind of event
+    _TIMED_METHODS = {
+        'add_records': 'appending',
+        'sort_tables': 'sorting',
+        '_simplify_tables': 'simplifying',
+        '_collect_background_simplify': 'simplifying',
+        '_export': 'exporting',
+    }
 
     def __str__(self):
+        self.wait()
         ret = "\n---------\n"
         ret += "Max time so far:\n"
         ret += str(self.max_time) + "\n"
@@ -173,16 +426,28 @@ class ARGrecorder(object):
     def check_ids(self, input_ids):
         """
         Check that all ``input_ids`` are valid.
+
+        :param array input_ids: The input IDs to check.
         """
-        for u in input_ids:
-            if u not in self.node_ids:
-                raise ValueError("Input ID " + str(u) + " not recorded.")
+        input_ids = _id_array(input_ids)
+        if self.dense_ids:
+            recorded = self.node_ids.contains(input_ids)
+        else:
+            recorded = np.fromiter(map(self.node_ids.__contains__,
+                                       input_ids.tolist()),
+                                   dtype=bool, count=len(input_ids))
+        missing = input_ids[~recorded]
+        if len(missing) > 0:
+            raise ValueError("Input ID " + str(missing[0]) + " not recorded.")
 
     def get_nodes(self, input_ids):
         """
         Return the output node IDs corresponding to a list of input IDs.
+
+        :param array input_ids: The input IDs.
+        :return array: A numpy array of the corresponding node IDs.
         """
-        return [self.node_ids[j] for j in input_ids]
+        return self._node_array(input_ids)
 
     def add_individual(self, input_id, time,
                        flags=msprime.NODE_IS_SAMPLE,
@@ -198,11 +463,18 @@ class ARGrecorder(object):
         :param population int: The population ID of birth of the indivdiual
             (may be omitted).  
         '''
+        if not isinstance(input_id, numbers.Integral):
+            raise ValueError("Input IDs must be integers, not " +
+                             repr(input_id) + ".")
         if input_id not in self.node_ids:
-            self.node_ids[input_id] = self.nodes.num_rows
+            self.version += 1
+            node = self.node_offset + self.nodes.num_rows
+            self.node_ids[input_id] = node
+            self.max_time = max(self.max_time, time)
+            if self.relative_times:
+                time = self.epoch - time
             self.nodes.add_row(flags=flags, population=population,
                                time=time)
-            self.max_time = max(self.max_time, time)
         else:
             # nothing bad happens if we try to add an individual more than once,
             # but this is helpful for debugging
@@ -226,11 +498,161 @@ class ARGrecorder(object):
                              ".add_individual().")
         out_parent = self.node_ids[parent]
         out_children = tuple([self.node_ids[u] for u in children])
+        self.version += 1
         for child in out_children:
-            self.edges.add_row(parent=out_parent,
-                               child=child,
-                               left=left,
-                               right=right)
+            self.edge_buffer.add_row(parent=out_parent,
+                                     child=child,
+                                     left=left,
+                                     right=right)
+
+    def add_individuals(self, input_ids, times,
+                        flags=msprime.NODE_IS_SAMPLE,
+                        populations=msprime.NULL_POPULATION):
+        '''
+        Add many new individuals at once: equivalent to calling
+        ``add_individual`` for each entry of ``input_ids`` in turn, but appends
+        the new rows to the NodeTable in a single step.  ``times``, ``flags``
+        and ``populations`` may each be either a single value or an array of
+        the same length as ``input_ids``.
+
+        :param array input_ids: The input IDs of the new individuals.
+        :param array times: The times of birth of the individuals.
+        :param array flags: Any msprime flags to record (probably not needed).
+        :param array populations: The population IDs of birth of the
+            individuals (may be omitted).
+        '''
+        input_ids = _id_array(input_ids)
+        num_new = len(input_ids)
+        if num_new == 0:
+            return
+        times = np.broadcast_to(np.asarray(times, dtype=np.float64), (num_new,))
+        flags = np.broadcast_to(np.asarray(flags, dtype=np.uint32), (num_new,))
+        populations = np.broadcast_to(np.asarray(populations, dtype=np.int32),
+                                      (num_new,))
+        if len(np.unique(input_ids)) < num_new:
+            raise ValueError("Attempted to add the same individual more than "
+                             "once in a single call to add_individuals().")
+        if self.dense_ids:
+            existing = input_ids[self.node_ids.contains(input_ids)]
+        else:
+            existing = [u for u in input_ids.tolist() if u in self.node_ids]
+        if len(existing) > 0:
+            raise ValueError("Attempted to add " + str(existing[0]) +
+                             ", who already exits, as a new individual.")
+        self.version += 1
+        first_node = self.node_offset + self.nodes.num_rows
+        if self.dense_ids:
+            self.node_ids.assign(input_ids, np.arange(first_node,
+                                                      first_node + num_new))
+        else:
+            self.node_ids.update(zip(input_ids.tolist(),
+                                     range(first_node, first_node + num_new)))
+        self.max_time = max(self.max_time, float(times.max()))
+        if self.relative_times:
+            times = self.epoch - times
+        self.nodes.append_columns(flags=flags, population=populations,
+                                  time=times)
+
+    def add_records(self, lefts, rights, parents, children):
+        '''
+        Add many edges at once: the k-th edge records that ``children[k]``
+        inherits from ``parents[k]`` on the interval ``[lefts[k], rights[k])``.
+        This is equivalent to calling ``add_record`` once per edge with a
+        single child, but appends all the edges to the EdgeTable in a single
+        step.
+
+        :param array lefts: The left endpoints of the segments inherited.
+        :param array rights: The right endpoints of the segments inherited.
+        :param array parents: The input IDs of the parents.
+        :param array children: The input IDs of the children.
+        '''
+        lefts = np.asarray(lefts, dtype=np.float64)
+        rights = np.asarray(rights, dtype=np.float64)
+        num_edges = len(lefts)
+        if not (len(rights) == len(parents) == len(children) == num_edges):
+            raise ValueError("lefts, rights, parents and children must all "
+                             "have the same length.")
+        if num_edges == 0:
+            return
+        out_parents = self._node_array(parents, "Parent")
+        out_children = self._node_array(children, "Child")
+        self.version += 1
+        self.edge_buffer.append_columns(left=lefts, right=rights,
+                                        parent=out_parents, child=out_children)
+
+    def _node_array(self, input_ids, what="Input ID"):
+        """
+        Return a numpy array of the output node IDs corresponding to
+        ``input_ids``, raising a ValueError if any are not recorded.
+        """
+        node_ids = self.node_ids
+        input_ids = _id_array(input_ids)
+        if self.dense_ids:
+            out = node_ids.lookup(input_ids)
+            missing = input_ids[out == NULL_ID]
+            if len(missing) > 0:
+                raise ValueError(what + " " + str(missing[0]) +
+                                 "'s birth time has not been recorded with " +
+                                 ".add_individual().")
+            return out
+        input_ids = input_ids.tolist()
+        try:
+            return np.fromiter(map(node_ids.__getitem__, input_ids),
+                               dtype=np.int32, count=len(input_ids))
+        except KeyError as e:
+            raise ValueError(what + " " + str(e.args[0]) +
+                             "'s birth time has not been recorded with " +
+                             ".add_individual().")
+
+    @property
+    def edges(self):
+        """
+        The EdgeTable, including any edges added since the last
+        simplification.
+        """
+        self.flush_edges()
+        return self.table_collection.edges
+
+    @property
+    def num_edges(self):
+        """
+        The total number of edges recorded, including those not yet moved
+        into the EdgeTable.
+        """
+        return (self.table_collection.edges.num_rows +
+                self.edge_buffer.num_rows)
+
+    @property
+    def num_unsimplified_edges(self):
+        """
+        The number of edges added since the last simplification.
+        """
+        if self._pending_simplify is not None:
+            return self.edge_buffer.num_rows
+        return self.num_edges - self.last_simplify_edges
+
+    @property
+    def nbytes(self):
+        """
+        An estimate of the memory used by the NodeTable, the EdgeTable, the
+        buffer of new edges, and the map from input IDs to node IDs, in bytes.
+        """
+        if self.dense_ids:
+            id_bytes = self.node_ids.nodes.nbytes
+        else:
+            id_bytes = _DICT_ENTRY_BYTES * len(self.node_ids)
+        return (_NODE_BYTES * (self.node_offset + self.nodes.num_rows) +
+                _EDGE_BYTES * self.table_collection.edges.num_rows +
+                self.edge_buffer.nbytes + id_bytes)
+
+    def flush_edges(self):
+        """
+        Move any buffered edges into the EdgeTable.  This is done
+        automatically by ``simplify`` and ``tree_sequence``.
+        """
+        self.wait()
+        if self.edge_buffer.num_rows > 0:
+            self.edge_buffer.flush(self.table_collection.edges)
 
     def update_times(self):
         """
@@ -239,24 +661,102 @@ class ARGrecorder(object):
         NodeTable must be in reverse time (time since the end of the
         simulation).  Therefore, this needs to (a) add an increment to any
         already-updated times in the NodeTable, and (b) reverse any times added
-        since the last update.
+        since the last update.  If no time has passed since the last update,
+        only the rows added since then are rewritten.
+
+        If ``relative_times`` is True, node times are already stored in
+        reverse time, relative to ``self.epoch``, so nothing needs to be done.
         """
+        self.wait()
+        first = self.last_update_node
+        num_rows = self.nodes.num_rows
         dt = self.max_time - self.last_update_time
-        times = self.nodes.time
-        times[:self.last_update_node] = times[:self.last_update_node] + dt
-        times[self.last_update_node:] = self.max_time - times[self.last_update_node:]
-        self.nodes.set_columns(flags=self.nodes.flags,
-                               population=self.nodes.population,
-                               time=times)
+        if not self.relative_times:
+            if dt != 0:
+                self.checkpoint_nodes = 0
+                times = self.nodes.time
+                times[:first] = times[:first] + dt
+                times[first:] = self.max_time - times[first:]
+                self.nodes.set_columns(flags=self.nodes.flags,
+                                       population=self.nodes.population,
+                                       time=times)
+            elif first < num_rows:
+                self.checkpoint_nodes = min(self.checkpoint_nodes, first)
+                times = self.max_time - self.nodes.time[first:]
+                flags = self.nodes.flags[first:]
+                population = self.nodes.population[first:]
+                self.nodes.truncate(first)
+                self.nodes.append_columns(flags=flags, population=population,
+                                          time=times)
         self.last_update_time = self.max_time
-        self.last_update_node = self.nodes.num_rows
+        self.last_update_node = num_rows
 
-    def simplify(self, samples):
+    def node_times(self):
+        """
+        Return the times of all nodes in the NodeTable, in units of time ago
+        (i.e., before ``self.max_time``).  This is the same as
+        ``self.nodes.time`` after ``update_times()``, unless
+        ``relative_times`` is True.
+
+        :return array: The node times.
+        """
+        self.update_times()
+        times = self.nodes.time
+        if self.relative_times:
+            times += self.max_time - self.epoch
+        return times
+
+    def _sorted_prefix(self):
+        # The number of edges at the start of the EdgeTable that are in the
+        # order used by sort_tables.  The output of simplify is sorted by
+        # parent time, but samples are renumbered, so parents of the same
+        # age need not be in order of ID.
+        edges = self.table_collection.edges
+        if edges.num_rows == 0:
+            return 0
+        keys = _edge_keys(self.nodes.time, edges.left, edges.parent,
+                          edges.child)
+        unsorted = np.flatnonzero(~_keys_in_order(keys[:-1], keys[1:]))
+        if len(unsorted) == 0:
+            return edges.num_rows
+        return int(unsorted[0]) + 1
+
+    def sort_tables(self):
+        """
+        Sort the tables, as required by msprime before simplifying.  The first
+        ``self.num_sorted_edges`` edges are already in order (usually, all
+        the output of simplify), so only the edges added since then are sorted,
+        and these are then merged with the others if they don't all belong
+        after them.  Node times are updated first, since the order depends
+        on them: nodes added since the last ``update_times`` still have
+        forwards times.  (After that, ``update_times`` shifts all the times
+        by the same amount, which does not change the order.)
+        """
+        self.update_times()
+        self.flush_edges()
+        edges = self.table_collection.edges
+        start = self.num_sorted_edges
+        if (start > edges.num_rows or self.sites.num_rows > 0
+                or self.mutations.num_rows > 0):
+            self.checkpoint_edges = 0
+            self.table_collection.sort()
+        elif start < edges.num_rows:
+            first = _sort_edges(self.nodes.time, edges, start)
+            self.checkpoint_edges = min(self.checkpoint_edges, first)
+        self.num_sorted_edges = edges.num_rows
+
+    def simplify(self, samples, background=None):
         """
         Simplifies the underlying tables.  `samples` should be a list of all
         "currently living" input individual IDs: i.e., anyone who might be a
         parent or a sample in the future.
 
+        If ``background`` is True, the tables are instead handed to another
+        process to be simplified, and this returns immediately.  Until that
+        finishes, new individuals and records may be added as usual, but only
+        individuals in ``samples`` (or born since) may be parents, and node
+        IDs are provisional: see ``wait()``.
+
         Note: to get the tree sequence for a set of samples use
         :meth:``ARGrecorder.tree_sequence``.
 
@@ -267,32 +767,154 @@ class ARGrecorder(object):
         :param list samples: A list of the input IDs whose entire history
             should be kept; information not relevant to the history of these
             samples will be discarded.
+        :param bool background: Whether to simplify in another process
+            (defaults to ``self.background_simplify``).
         """
-        self.check_ids(samples)
-        self.update_times()
+        if background is None:
+            background = self.background_simplify
+        self.wait()
+        wall_start = timer.perf_counter()
+        samples = _id_array(samples)
         sample_nodes = self.get_nodes(samples)
-        if self.timings is not None:
-            start = timer.process_time()
-        self.table_collection.sort()
-        if self.timings is not None:
-            start2 = timer.process_time()
-            self.timings.time_sorting += start2 - start
-        self.table_collection.simplify(samples=sample_nodes)
-        if self.timings is not None:
-            self.timings.time_simplifying += timer.process_time() - start2
-        # update the internal state
-        self.last_update_node = self.nodes.num_rows
+        self.version += 1
+        self.update_times()
+        self.flush_edges()
+        self.sort_tables()
+        if background:
+            self._start_background_simplify(samples, sample_nodes)
+            self.last_simplify_cost = timer.perf_counter() - wall_start
+            return
+        self._simplify_tables(sample_nodes)
         # update index map: sample[k] now maps to k
-        self.node_ids = {k : v for v, k in enumerate(samples)}
+        if self.dense_ids:
+            self.node_ids.reset(samples)
+        else:
+            self.node_ids = {k : v for v, k in enumerate(samples.tolist())}
+        self._finish_simplify(wall_start)
+
+    def _simplify_tables(self, sample_nodes):
+        self.node_map = self.table_collection.simplify(
+                samples=sample_nodes, **self._simplify_kwargs)
+        # simplify flags the samples, and only them
+        self._sample_nodes = np.arange(len(sample_nodes))
+        self._num_tracked_nodes = self.nodes.num_rows
+
+    def _finish_simplify(self, wall_start):
+        # update the internal state after simplifying
+        self.num_sorted_edges = self._sorted_prefix()
+        self.last_update_node = self.nodes.num_rows
         self.num_simplifies += 1
+        self.last_simplify_edges = self.table_collection.edges.num_rows
+        self.last_simplify_end = timer.perf_counter()
+        self.last_simplify_cost = self.last_simplify_end - wall_start
+
+    def _start_background_simplify(self, samples, sample_nodes):
+        tempdir = tempfile.mkdtemp(prefix="ftprime_")
+        in_path = os.path.join(tempdir, "unsimplified.trees")
+        out_path = os.path.join(tempdir, "simplified.trees")
+        try:
+            self.table_collection.tree_sequence().dump(in_path)
+            executor = self.executor
+            if executor is None:
+                executor = _background_executor()
+            future = executor.submit(
+                    _simplify_file, in_path, out_path, sample_nodes,
+                    **self._simplify_kwargs)
+        except:
+            shutil.rmtree(tempdir, ignore_errors=True)
+            raise
+        self._pending_simplify = (future, tempdir, out_path)
+        self._sample_nodes = sample_nodes
+        self._num_tracked_nodes = self.nodes.num_rows
+        # only the samples may be parents of anyone born from now on; new
+        # nodes get IDs following the old ones, and are put in a new table
+        if self.dense_ids:
+            self.node_ids.reset(samples, sample_nodes)
+        else:
+            self.node_ids = dict(zip(samples.tolist(), sample_nodes.tolist()))
+        self.node_offset = self.nodes.num_rows
+        self.nodes = msprime.NodeTable()
+
+    def wait(self):
+        """
+        If a simplify is running in the background, wait for it to finish,
+        and then update the tables, the map from input IDs to node IDs, and
+        the node IDs of any records added since it started.  This is done
+        automatically by any method that needs the tables; but note that until
+        it is done, ``self.nodes`` contains only individuals added since the
+        simplify began.
+        """
+        if self._pending_simplify is not None:
+            self._collect_background_simplify()
+
+    def _collect_background_simplify(self):
+        wall_start = timer.perf_counter()
+        future, tempdir, out_path = self._pending_simplify
+        self._pending_simplify = None
+        try:
+            node_map = future.result()
+            tables = msprime.load(out_path).dump_tables()
+        finally:
+            shutil.rmtree(tempdir, ignore_errors=True)
+        new_nodes = self.nodes
+        self.table_collection = tables
+        self.nodes = tables.nodes
+        self.sites = tables.sites
+        self.mutations = tables.mutations
+        self.migrations = tables.migrations
+        num_simplified = self.nodes.num_rows
+        if new_nodes.num_rows > 0:
+            self.nodes.append_columns(flags=new_nodes.flags,
+                                      population=new_nodes.population,
+                                      time=new_nodes.time)
+        node_map = np.concatenate([
+            node_map, np.arange(num_simplified, self.nodes.num_rows)]
+            ).astype(np.int32)
+        self.node_offset = 0
+        self.node_map = node_map
+        self._sample_nodes = node_map[self._sample_nodes]
+        self._num_tracked_nodes = num_simplified
+        self.edge_buffer.remap_nodes(node_map)
+        if self.dense_ids:
+            self.node_ids.remap(node_map)
+        else:
+            values = np.fromiter(self.node_ids.values(), dtype=np.int64,
+                                 count=len(self.node_ids))
+            self.node_ids = dict(zip(self.node_ids.keys(),
+                                     node_map[values].tolist()))
+        # the cost is the time spent here, plus that spent starting it off
+        start_cost = self.last_simplify_cost
+        self._finish_simplify(wall_start)
+        self.last_simplify_cost += start_cost
+        self.last_update_node = num_simplified
+
+    def maybe_simplify(self, samples):
+        """
+        Simplify, as with :meth:``ARGrecorder.simplify``, but only if
+        ``self.simplify_policy`` says it is time to do so.  This should be
+        called every generation (or more often).
+
+        :param list samples: A list of the input IDs whose entire history
+            should be kept.
+        :return bool: Whether the tables were simplified.
+        """
+        if self.simplify_policy is None:
+            raise ValueError("maybe_simplify() needs a simplify_policy.")
+        if self.simplify_policy.should_simplify(self):
+            self.simplify(samples)
+            return True
+        return False
 
     def tree_sequence(self, samples=None):
         """
         Return the simplified tree sequence for a given set of input samples,
-        *without* simplifying the tables stored internally. (This *does* sort
-        them and label samples, however.) To simplify the tables stored
+        *without* simplifying the tables stored internally, or changing them
+        in any other way: this works on a copy.  To simplify the tables stored
         internally as well, use :meth:``ARGrecorder.simplify``.
 
+        The most recent results are kept, so that asking again for the same
+        samples, with nothing recorded in between, costs nothing.
+
         :param list samples: A list of the input IDs whose history is recorded
             in the resulting tree sequence.  If this is missing, all available
             individuals will be used.
@@ -300,36 +922,353 @@ class ARGrecorder(object):
             history of ``samples``; in this tree sequence, ``sample[k]``
             corresponds to Node ID ``k``.
         """
+        self.wait()
         if samples is None:
             samples = self.sample_ids()
-        else:
-            self.check_ids(samples)
-        self.update_times()
-        if self.timings is not None:
-            start = timer.process_time()
-        self.table_collection.sort()
-        self.mark_samples(samples)
-        if self.timings is not None:
-            self.timings.time_sorting += start - timer.process_time()
-        ts = self.table_collection.tree_sequence()
         sample_nodes = self.get_nodes(samples)
-        return ts.simplify(samples=sample_nodes)
+        key = (self.version, sample_nodes.tobytes())
+        ts = self._snapshots.get(key)
+        if ts is None:
+            ts = self._export(sample_nodes)
+            if self.snapshot_cache_size > 0:
+                self._snapshots[key] = ts
+                while len(self._snapshots) > self.snapshot_cache_size:
+                    self._snapshots.popitem(last=False)
+        else:
+            self._snapshots.move_to_end(key)
+        return ts
 
-    def sample_ids(self):
+    def _export(self, sample_nodes):
+        tables, _ = self._simplified_tables(sample_nodes)
+        return tables.tree_sequence()
+
+    def _current_times(self):
+        """
+        Return the times that ``update_times`` would give the nodes, without
+        changing the NodeTable.  (If ``relative_times`` is True, these are
+        just the stored times.)
+
+        :return array: The node times.
+        """
+        self.wait()
+        times = self.nodes.time
+        if not self.relative_times:
+            first = self.last_update_node
+            times[:first] += self.max_time - self.last_update_time
+            times[first:] = self.max_time - times[first:]
+        return times
+
+    def _simplified_tables(self, sample_nodes):
+        # A simplified copy of the tables, with node times measured back from
+        # max_time, and the map from node IDs to those in the copy.
+        tables = self.table_collection.copy()
+        edges = tables.edges
+        for left, right, parent, child in self.edge_buffer.columns():
+            edges.append_columns(left=left, right=right, parent=parent,
+                                 child=child)
+        nodes = tables.nodes
+        nodes.set_columns(flags=nodes.flags, population=nodes.population,
+                          time=self._current_times())
+        if (self.num_sorted_edges > edges.num_rows or tables.sites.num_rows > 0
+                or tables.mutations.num_rows > 0):
+            tables.sort()
+        elif self.num_sorted_edges < edges.num_rows:
+            _sort_edges(nodes.time, edges, self.num_sorted_edges)
+        node_map = tables.simplify(samples=sample_nodes,
+                                   **self._simplify_kwargs)
+        if self.relative_times and self.max_time != self.epoch:
+            nodes.set_columns(flags=nodes.flags, population=nodes.population,
+                              time=nodes.time + self.max_time - self.epoch)
+        return tables, node_map
+
+    def save(self, path):
+        """
+        Save the state of the recorder to the directory ``path`` (which is
+        created if necessary), so that it can be restored with
+        ``ARGrecorder.load(path)``.  Each column of the tables, and the
+        input and node IDs of the ID map, are written as a numpy ``.npy``
+        file; the rest of the state goes in ``recorder.json``.  Input IDs
+        must be integers.
+
+        :param str path: The directory to save to.
+        """
+        self.flush_edges()
+        if not os.path.exists(path):
+            os.makedirs(path)
+        storage.save_tables(self.table_collection, path)
+        if self.dense_ids:
+            input_ids = self.node_ids.keys()
+            node_ids = self.node_ids.values()
+        else:
+            input_ids = np.fromiter(self.node_ids.keys(), dtype=np.int64,
+                                    count=len(self.node_ids))
+            node_ids = np.fromiter(self.node_ids.values(), dtype=np.int32,
+                                   count=len(self.node_ids))
+        np.save(os.path.join(path, "node_ids_input.npy"), input_ids)
+        np.save(os.path.join(path, "node_ids_node.npy"), node_ids)
+        state = {
+            'sequence_length': self.sequence_length,
+            'max_time': self.max_time,
+            'epoch': self.epoch,
+            'relative_times': self.relative_times,
+            'dense_ids': self.dense_ids,
+            'last_update_time': self.last_update_time,
+            'last_update_node': self.last_update_node,
+            'num_sorted_edges': self.num_sorted_edges,
+            'num_simplifies': self.num_simplifies,
+            'last_simplify_edges': self.last_simplify_edges,
+            'chunk_size': self.edge_buffer.chunk_size,
+            'max_edge_bytes': self.edge_buffer.max_bytes,
+            'spill_dir': self.edge_buffer.spill_dir,
+            'snapshot_cache_size': self.snapshot_cache_size,
+        }
+        storage.save_state(state, path, "recorder.json")
+
+    @classmethod
+    def load(cls, path, timings=None, simplify_policy=None,
+             background_simplify=False, executor=None, mmap=False):
+        """
+        Restore a recorder saved with ``save(path)``.  The options that can
+        be saved (``max_edge_bytes``, ``spill_dir`` and
+        ``snapshot_cache_size``, as well as those that affect the tables) are
+        as they were; the others are given here.
+
+        :param str path: The directory the recorder was saved to.
+        :param ftprime.benchmarker.Timings timings:  An object to record
+            timing information.
+        :param SimplifyPolicy simplify_policy: Decides when
+            ``maybe_simplify`` actually simplifies.
+        :param bool background_simplify: Whether ``simplify`` runs in the
+            background by default.
+        :param concurrent.futures.Executor executor: A process pool to run
+            background simplifies in.
+        :param bool mmap: Whether to memory-map the saved columns, rather
+            than reading them in before copying them into the tables.
+        :return ARGrecorder: The restored recorder.
+        """
+        state = storage.load_state(path, "recorder.json")
+        out = cls(sequence_length=state['sequence_length'],
+                  time=state['epoch'], timings=timings,
+                  dense_ids=state['dense_ids'],
+                  expected_edges_per_generation=state['chunk_size'],
+                  relative_times=state['relative_times'],
+                  simplify_policy=simplify_policy,
+                  background_simplify=background_simplify,
+                  max_edge_bytes=state.get('max_edge_bytes'),
+                  spill_dir=state.get('spill_dir'), executor=executor,
+                  snapshot_cache_size=state.get('snapshot_cache_size', 8))
+        tables = msprime.TableCollection(
+                sequence_length=state['sequence_length'])
+        storage.load_tables(tables, path, mmap=mmap)
+        out.table_collection = tables
+        out.nodes = tables.nodes
+        out.sites = tables.sites
+        out.mutations = tables.mutations
+        out.migrations = tables.migrations
+        out.site_positions = {p:k for k, p in enumerate(out.sites.position)}
+        input_ids = np.load(os.path.join(path, "node_ids_input.npy"))
+        node_ids = np.load(os.path.join(path, "node_ids_node.npy"))
+        if out.dense_ids:
+            out.node_ids.reset(input_ids, node_ids)
+        else:
+            out.node_ids = dict(zip(input_ids.tolist(), node_ids.tolist()))
+        for key in ('max_time', 'last_update_time', 'last_update_node',
+                    'num_sorted_edges', 'num_simplifies',
+                    'last_simplify_edges'):
+            setattr(out, key, state[key])
+        return out
+
+    def set_populations(self, input_ids, populations):
+        """
+        Set the population of each of ``input_ids`` in the NodeTable.
+
+        :param array input_ids: Input IDs.
+        :param array populations: The corresponding population IDs.
+        """
+        self.wait()
+        node_ids = self._node_array(input_ids)
+        if len(node_ids) == 0:
+            return
+        self.version += 1
+        population = self.nodes.population
+        population[node_ids] = populations
+        self.checkpoint_nodes = min(self.checkpoint_nodes, int(node_ids.min()))
+        self.nodes.set_columns(flags=self.nodes.flags, time=self.nodes.time,
+                               population=population)
+
+    def _checkpoint_state(self):
+        return {
+            'max_time': self.max_time,
+            'last_update_time': self.last_update_time,
+            'last_update_node': self.last_update_node,
+            'num_sorted_edges': self.num_sorted_edges,
+            'last_simplify_edges': self.last_simplify_edges,
+        }
+
+    def checkpoint(self, path):
+        """
+        Save the state of the recorder to the directory ``path``,
+        incrementally.  A full copy (as written by ``save``) is written to
+        ``path/base`` the first time, and after each simplification (which
+        renumbers the nodes); otherwise only the nodes, edges, and IDs added
+        since the last checkpoint are appended to the file
+        ``path/base/deltas``.  Restore with ``ARGrecorder.restore(path)``.
+
+        Rows of the tables written to the base may not be changed by a delta,
+        so if they have been, a new base is written.  In particular, unless
+        ``relative_times`` is True, every change in ``max_time`` changes all
+        the node times, so use ``relative_times=True`` to get small deltas.
+
+        :param str path: The directory to save to.
+        """
+        self.flush_edges()
+        tables = self.table_collection
+        ck = self._checkpoint
+        if (ck is None or ck['path'] != path
+                or ck['num_simplifies'] != self.num_simplifies
+                or self.checkpoint_nodes < ck['base_nodes']
+                or self.checkpoint_edges < ck['base_edges']
+                or tables.sites.num_rows != ck['base_sites']
+                or tables.mutations.num_rows != ck['base_mutations']
+                or tables.migrations.num_rows != ck['base_migrations']):
+            self._write_base(path)
+        else:
+            nodes = self.nodes
+            edges = tables.edges
+            n = self.checkpoint_nodes
+            e = self.checkpoint_edges
+            if self.dense_ids:
+                input_ids = self.node_ids.keys()
+                node_ids = self.node_ids.values()
+            else:
+                input_ids = np.fromiter(self.node_ids.keys(), dtype=np.int64,
+                                        count=len(self.node_ids))
+                node_ids = np.fromiter(self.node_ids.values(), dtype=np.int32,
+                                       count=len(self.node_ids))
+            new = node_ids >= ck['num_nodes']
+            state = json.dumps(self._checkpoint_state()).encode('utf-8')
+            deltas = os.path.join(path, "base", "deltas")
+            storage.append_record(
+                    deltas,
+                    [np.array([n, e], dtype=np.int64),
+                     nodes.flags[n:], nodes.time[n:], nodes.population[n:],
+                     edges.left[e:], edges.right[e:],
+                     edges.parent[e:], edges.child[e:],
+                     input_ids[new], node_ids[new],
+                     np.frombuffer(state, dtype=np.uint8)],
+                    offset=ck['deltas_end'])
+            ck['deltas_end'] = os.path.getsize(deltas)
+        self._checkpoint['num_nodes'] = self.nodes.num_rows
+        self.checkpoint_nodes = self.nodes.num_rows
+        self.checkpoint_edges = tables.edges.num_rows
+
+    def _write_base(self, path):
+        # Write the new base next to the old one, move the old one aside,
+        # move the new one into place, and only then delete the old one, so
+        # that there is always a complete base (with its deltas) to restore
+        # from: see ``restore`` for what is done at each point in between.
+        base = os.path.join(path, "base")
+        new_base = os.path.join(path, "base.new")
+        old_base = os.path.join(path, "base.old")
+        for x in (new_base, old_base):
+            if os.path.exists(x):
+                shutil.rmtree(x)
+        self.save(new_base)
+        if os.path.exists(base):
+            os.rename(base, old_base)
+        os.rename(new_base, base)
+        if os.path.exists(old_base):
+            shutil.rmtree(old_base)
+        self._set_base(path)
+
+    @classmethod
+    def restore(cls, path, **kwargs):
         """
-        Return a list of the input IDs corresponding to the samples in the
-        internal tables.
+        Restore a recorder from the checkpoints written by
+        ``checkpoint(path)``: the base, and then each delta in turn.  Further
+        checkpoints to ``path`` carry on adding deltas to the same base.
 
-        :return list: A list of input IDs.
+        :param str path: The directory the checkpoints were written to.
+        :param kwargs: Passed on to ``ARGrecorder.load``.
+        :return ARGrecorder: The restored recorder.
         """
-        flags = self.nodes.flags
-        out = []
-        for input_id in self.node_ids:
-            j = self.node_ids[input_id]
-            if flags[j] & msprime.NODE_IS_SAMPLE:
-                out.append(input_id)
+        base = os.path.join(path, "base")
+        new_base = os.path.join(path, "base.new")
+        old_base = os.path.join(path, "base.old")
+        if not os.path.exists(base):
+            if not os.path.exists(old_base):
+                # no base was ever moved into place
+                raise ValueError("No checkpoint to restore in " + path + ".")
+            # interrupted after moving the old base aside, so the new one
+            # is complete
+            os.rename(new_base, base)
+        # anything else left over is an incomplete new base, or an old base
+        # that was being deleted
+        for x in (new_base, old_base):
+            if os.path.exists(x):
+                shutil.rmtree(x)
+        out = cls.load(base, **kwargs)
+        out._set_base(path)
+        nodes = out.nodes
+        edges = out.table_collection.edges
+        # anything after the last complete delta is only removed by the next
+        # checkpoint, so that restoring doesn't change the checkpoint
+        records, out._checkpoint['deltas_end'] = storage.scan_records(
+                os.path.join(base, "deltas"))
+        for record in records:
+            ((n, e), flags, time, population, left, right, parent, child,
+             input_ids, node_ids, state) = record
+            nodes.truncate(n)
+            nodes.append_columns(flags=flags, time=time, population=population)
+            edges.truncate(e)
+            edges.append_columns(left=left, right=right, parent=parent,
+                                 child=child)
+            if out.dense_ids:
+                out.node_ids.assign(input_ids, node_ids)
+            else:
+                out.node_ids.update(zip(input_ids.tolist(), node_ids.tolist()))
+            for key, value in json.loads(bytes(state).decode('utf-8')).items():
+                setattr(out, key, value)
+        out._checkpoint['num_nodes'] = nodes.num_rows
+        out.checkpoint_nodes = nodes.num_rows
+        out.checkpoint_edges = edges.num_rows
         return out
 
+    def _set_base(self, path):
+        # the bookkeeping for checkpoints, for a base just written or loaded
+        tables = self.table_collection
+        self._checkpoint = {
+            'path': path,
+            'num_simplifies': self.num_simplifies,
+            'base_nodes': self.nodes.num_rows,
+            'base_edges': tables.edges.num_rows,
+            'base_sites': tables.sites.num_rows,
+            'base_mutations': tables.mutations.num_rows,
+            'base_migrations': tables.migrations.num_rows,
+            # the length of the complete deltas in path/base/deltas
+            'deltas_end': 0,
+        }
+
+    def sample_ids(self):
+        """
+        Return the input IDs corresponding to the samples in the internal
+        tables.
+
+        :return array: A numpy array of input IDs.
+        """
+        self.wait()
+        if self.dense_ids:
+            input_ids = self.node_ids.keys()
+            nodes = self.node_ids.values()
+        else:
+            num_ids = len(self.node_ids)
+            input_ids = np.fromiter(self.node_ids.keys(), dtype=np.int64,
+                                    count=num_ids)
+            nodes = np.fromiter(self.node_ids.values(), dtype=np.int64,
+                                count=num_ids)
+        is_sample = (self.nodes.flags[nodes] & msprime.NODE_IS_SAMPLE) != 0
+        return input_ids[is_sample]
+
     def mark_samples(self, samples):
         """
         Mark these individuals as samples internally (but do not simplify).
@@ -338,13 +1277,43 @@ class ARGrecorder(object):
             the msprime flag for samples in the underlying NodeTable.  This
             does not affect what happens at the next ``simplify``, and is
             provided mainly for convenience.  
+
+        Only the rows whose flags change are touched, using the record kept
+        of which nodes are currently flagged as samples, unless there are so
+        many that rewriting the whole column of flags is quicker.
         """
-        self.check_ids(samples)
-        sample_nodes = self.get_nodes(samples)
-        sample_flag = np.array(msprime.NODE_IS_SAMPLE, dtype='uint32')
-        new_flags = self.nodes.flags & ~sample_flag
-        new_flags[sample_nodes] |= sample_flag
-        self.nodes.set_columns(time=self.nodes.time,
-                               population=self.nodes.population,
-                               flags=new_flags)
+        self.wait()
+        sample_nodes = np.unique(self.get_nodes(samples))
+        if self._sample_nodes is None:
+            flagged = np.flatnonzero(self.nodes.flags & msprime.NODE_IS_SAMPLE)
+        else:
+            first_new = self._num_tracked_nodes
+            new_flags = self.nodes.flags[first_new:]
+            flagged = np.concatenate([
+                self._sample_nodes,
+                first_new + np.flatnonzero(new_flags & msprime.NODE_IS_SAMPLE)])
+        unmark = np.setdiff1d(flagged, sample_nodes)
+        mark = np.setdiff1d(sample_nodes, flagged)
+        self._sample_nodes = sample_nodes
+        self._num_tracked_nodes = self.nodes.num_rows
+        num_changed = len(unmark) + len(mark)
+        if num_changed == 0:
+            return
+        first = int(np.concatenate([unmark, mark]).min())
+        self.checkpoint_nodes = min(self.checkpoint_nodes, first)
+        sample_flag = msprime.NODE_IS_SAMPLE
+        nodes = self.nodes
+        if num_changed * _ROW_UPDATE_COST < nodes.num_rows:
+            for j in unmark.tolist():
+                row = nodes[j]
+                nodes[j] = row.replace(flags=row.flags & ~sample_flag)
+            for j in mark.tolist():
+                row = nodes[j]
+                nodes[j] = row.replace(flags=row.flags | sample_flag)
+        else:
+            flags = nodes.flags
+            flags[unmark] &= ~np.uint32(sample_flag)
+            flags[mark] |= np.uint32(sample_flag)
+            nodes.set_columns(time=nodes.time, population=nodes.population,
+                              flags=flags)
 
@@ -1,49 +1,182 @@
+import collections
+import functools
+import json
+import time as timer
+
+Event = collections.namedtuple("Event",
+                               ["kind", "generation", "wall_time", "cpu_time",
+                                "nodes_before", "nodes_after",
+                                "edges_before", "edges_after"])
+Event.__doc__ = '''
+A record of one step of the work of an ARGrecorder: ``kind`` is one of
+``Timings.PHASES``, ``generation`` is the (forwards) time of the recorder
+when it happened, the times are in seconds, and the numbers of nodes and
+edges are from before and after the step.
+'''
+
+
 class Timings(object):
-    def __init__(self):
-        self.__time_sorting = 0.0
-        self.__time_appending = 0.0
-        self.__time_simplifying = 0.0
-        self.__time_prepping = 0.0
+    '''
+    Records an :class:`Event` for each step of work done by an ARGrecorder
+    (or RecombCollector) that it is passed to: each sort, simplify, batch of
+    edges appended, batch of recombination output parsed, and tree sequence
+    exported.  The most recent ``max_events`` are kept in ``self.events``,
+    and if ``path`` is given every event is also appended to that file, as a
+    line of JSON.  Total times for each kind of event are kept as well, in
+    ``times`` (CPU time) and ``wall_times``.
+
+    A simplify done in the background is recorded when it is collected by
+    ``ARGrecorder.wait()``, and only the time spent there is counted.
+
+    The methods that do each step are instrumented when the recorder is
+    created with a Timings (see ``instrument``): a recorder without one runs
+    the plain methods, with no checks for timing at all.  With
+    ``sample_every`` greater than one, only every so many steps of each
+    kind are timed and recorded, and the rest are just counted (in
+    ``counts``), so that the cost of leaving timing on is small.
+    '''
+
+    PHASES = ('prepping', 'sorting', 'appending', 'parsing', 'simplifying',
+              'exporting')
+
+    def __init__(self, max_events=10000, path=None, sample_every=1):
+        """
+        :param int max_events: The number of most recent events to keep.
+        :param str path: A file to append each event to, as JSON lines.
+        :param int sample_every: Record one in this many steps of each kind.
+        """
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1.")
+        self.sample_every = sample_every
+        self.events = collections.deque(maxlen=max_events)
+        self.path = path
+        self._file = None if path is None else open(path, 'a')
+        self._wall = dict.fromkeys(self.PHASES, 0.0)
+        self._cpu = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = dict.fromkeys(self.PHASES, 0)
+
+    def close(self):
+        """
+        Close the file that events are written to.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def instrument(self, obj, methods, recorder):
+        """
+        Replace methods of ``obj`` with versions that record an event for
+        each call (or for one in ``sample_every`` calls).
+
+        :param obj: The object whose methods to instrument.
+        :param dict methods: A dict giving the kind of event (one of
+            ``PHASES``) for each name of a method.
+        :param ARGrecorder recorder: The recorder whose nodes and edges are
+            counted.
+        """
+        for name, kind in methods.items():
+            setattr(obj, name, self._timed(getattr(obj, name), kind, recorder))
+
+    def _timed(self, method, kind, recorder):
+        counts = self.counts
+        sample_every = self.sample_every
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            n = counts[kind]
+            counts[kind] = n + 1
+            if n % sample_every != 0:
+                return method(*args, **kwargs)
+            start = self.start(recorder)
+            out = method(*args, **kwargs)
+            self.record(kind, recorder, start)
+            return out
+
+        return timed
+
+    def start(self, recorder):
+        """
+        Note the state of an ARGrecorder at the start of a step, to be
+        passed to ``record()`` at the end.
+
+        :param ARGrecorder recorder: The recorder.
+        :return tuple: The wall and CPU times, and the numbers of nodes and
+            edges.
+        """
+        return (timer.perf_counter(), timer.process_time(),
+                recorder.node_offset + recorder.nodes.num_rows,
+                recorder.num_edges)
+
+    def record(self, kind, recorder, start):
+        """
+        Record a step that has just finished.  (This does not add to
+        ``counts``, which counts calls of instrumented methods.)
+
+        :param str kind: The kind of step, one of ``PHASES``.
+        :param ARGrecorder recorder: The recorder that did it.
+        :param tuple start: What ``start(recorder)`` returned at the start.
+        :return Event: The event recorded.
+        """
+        wall_start, cpu_start, nodes_before, edges_before = start
+        nodes_after = recorder.node_offset + recorder.nodes.num_rows
+        event = Event(kind=kind, generation=recorder.max_time,
+                      wall_time=timer.perf_counter() - wall_start,
+                      cpu_time=timer.process_time() - cpu_start,
+                      nodes_before=nodes_before, nodes_after=nodes_after,
+                      edges_before=edges_before,
+                      edges_after=recorder.num_edges)
+        self.add_event(event)
+        return event
+
+    def add_event(self, event):
+        """
+        Add an :class:`Event` to the records.
+        """
+        self.events.append(event)
+        self._wall[event.kind] += event.wall_time
+        self._cpu[event.kind] += event.cpu_time
+        if self._file is not None:
+            self._file.write(json.dumps(event._asdict()) + "\n")
+            self._file.flush()
 
     @property
     def time_prepping(self):
-        return self.__time_prepping
-
-    @time_prepping.setter
-    def time_prepping(self, val):
-        self.__time_prepping = val
+        return self._cpu['prepping']
 
     @property
     def time_simplifying(self):
-        return self.__time_simplifying
-
-    @time_simplifying.setter
-    def time_simplifying(self, val):
-        self.__time_simplifying = val
+        return self._cpu['simplifying']
 
     @property
     def time_sorting(self):
-        return self.__time_sorting
-
-    @time_sorting.setter
-    def time_sorting(self, val):
-        self.__time_sorting = val
+        return self._cpu['sorting']
 
     @property
     def time_appending(self):
-        return self.__time_appending
-
-    @time_appending.setter
-    def time_appending(self, val):
-        self.__time_appending = val
+        return self._cpu['appending']
 
     @property
     def times(self):
         """
-        A dict representing times spent in various
-        steps.
+        A dict of the total CPU time spent in each kind of step (that was
+        recorded).
+        """
+        return dict(self._cpu)
+
+    @property
+    def wall_times(self):
+        """
+        A dict of the total wall-clock time spent in each kind of step.
         """
-        return {'prepping': self.__time_prepping,
-                'sorting': self.__time_sorting,
-                'appending': self.__time_appending,
-                'simplifying': self.__time_simplifying}
+        return dict(self._wall)
+
+
+def read_events(path):
+    """
+    Read the events written by a :class:`Timings` to ``path``.
+
+    :param str path: The file of JSON lines.
+    :return list: A list of :class:`Event`.
+    """
+    with open(path, 'r') as f:
+        return [Event(**json.loads(line)) for line in f if line.strip()]
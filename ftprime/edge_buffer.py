@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 2 ** 16
+
+
+class EdgeBuffer(object):
+    '''
+    A growable buffer of edges, stored as a list of chunks of preallocated
+    numpy columns (``left``, ``right``, ``parent`` and ``child``).  Adding an
+    edge writes into the current chunk, and a new chunk is allocated only
+    when it is full, so the buffer is never copied as it grows.  The
+    buffered edges are moved into an EdgeTable with ``flush()``.
+
+    If ``max_bytes`` is given, then once the chunks that are full take up
+    more than this much memory, the oldest are moved to memory-mapped files
+    in a temporary directory (in ``spill_dir``, if given), and read back from
+    there by ``flush()``.
+    '''
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, max_bytes=None,
+                 spill_dir=None):
+        """
+        :param int chunk_size: The number of edges to allocate space for at a
+            time; ideally, about the number of edges added between flushes.
+        :param int max_bytes: The maximum memory for full chunks to use
+            before they are moved to disk.
+        :param str spill_dir: The directory to make the temporary directory
+            for chunks moved to disk in.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive.")
+        self.chunk_size = int(chunk_size)
+        # chunks that are full, as tuples of (left, right, parent, child)
+        self.chunks = []
+        self.num_rows = 0
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        # the number of chunks at the start of self.chunks that are on disk,
+        # and the directory they are in
+        self.num_spilled = 0
+        self._spill_path = None
+        self._new_chunk()
+
+    def __len__(self):
+        return self.num_rows
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the buffer's columns, in bytes (not including
+        chunks that have been moved to disk).
+        """
+        out = sum(x.nbytes for chunk in self.chunks[self.num_spilled:]
+                  for x in chunk)
+        out += sum(x.nbytes for x in (self._left, self._right,
+                                      self._parent, self._child))
+        return out
+
+    @property
+    def spilled_bytes(self):
+        """
+        The size of the chunks that have been moved to disk, in bytes.
+        """
+        return sum(x.nbytes for chunk in self.chunks[:self.num_spilled]
+                   for x in chunk)
+
+    def _spill(self):
+        # move the oldest full chunks to disk until the rest fit in max_bytes
+        if self.max_bytes is None:
+            return
+        in_memory = sum(x.nbytes for chunk in self.chunks[self.num_spilled:]
+                        for x in chunk)
+        while in_memory > self.max_bytes and self.num_spilled < len(self.chunks):
+            if self._spill_path is None:
+                self._spill_path = tempfile.mkdtemp(prefix="ftprime_edges_",
+                                                    dir=self.spill_dir)
+                self._cleanup = weakref.finalize(self, shutil.rmtree,
+                                                 self._spill_path, True)
+            k = self.num_spilled
+            chunk = []
+            for name, x in zip(("left", "right", "parent", "child"),
+                               self.chunks[k]):
+                path = os.path.join(self._spill_path,
+                                    "{}_{}.npy".format(name, k))
+                y = np.lib.format.open_memmap(path, mode='w+', dtype=x.dtype,
+                                              shape=x.shape)
+                y[:] = x
+                in_memory -= x.nbytes
+                chunk.append(y)
+            self.chunks[k] = tuple(chunk)
+            self.num_spilled += 1
+
+    def _new_chunk(self):
+        self._left = np.empty(self.chunk_size, dtype=np.float64)
+        self._right = np.empty(self.chunk_size, dtype=np.float64)
+        self._parent = np.empty(self.chunk_size, dtype=np.int32)
+        self._child = np.empty(self.chunk_size, dtype=np.int32)
+        self._fill = 0
+
+    def _close_chunk(self):
+        # move the filled part of the current chunk onto the list of chunks
+        if self._fill > 0:
+            k = self._fill
+            self.chunks.append((self._left[:k], self._right[:k],
+                                self._parent[:k], self._child[:k]))
+            self._new_chunk()
+            self._spill()
+
+    def add_row(self, left, right, parent, child):
+        """
+        Add a single edge.
+        """
+        k = self._fill
+        if k == self.chunk_size:
+            self._close_chunk()
+            k = 0
+        self._left[k] = left
+        self._right[k] = right
+        self._parent[k] = parent
+        self._child[k] = child
+        self._fill = k + 1
+        self.num_rows += 1
+
+    def append_columns(self, left, right, parent, child):
+        """
+        Add many edges at once, given as columns of equal length.
+        """
+        n = len(left)
+        k = self._fill
+        if k + n <= self.chunk_size:
+            self._left[k:k + n] = left
+            self._right[k:k + n] = right
+            self._parent[k:k + n] = parent
+            self._child[k:k + n] = child
+            self._fill = k + n
+        else:
+            self._close_chunk()
+            self.chunks.append((np.array(left, dtype=np.float64),
+                                np.array(right, dtype=np.float64),
+                                np.array(parent, dtype=np.int32),
+                                np.array(child, dtype=np.int32)))
+            self._spill()
+        self.num_rows += n
+
+    def columns(self):
+        """
+        Iterate over the buffered edges, a chunk at a time, as tuples of
+        ``(left, right, parent, child)`` arrays.
+        """
+        for chunk in self.chunks:
+            yield chunk
+        if self._fill > 0:
+            k = self._fill
+            yield (self._left[:k], self._right[:k],
+                   self._parent[:k], self._child[:k])
+
+    def flush(self, edges):
+        """
+        Append all buffered edges to an EdgeTable, and empty the buffer.
+
+        :param EdgeTable edges: The table to append to.
+        """
+        for left, right, parent, child in self.columns():
+            edges.append_columns(left=left, right=right,
+                                 parent=parent, child=child)
+        self.clear()
+
+    def remap_nodes(self, node_map):
+        """
+        Replace the parent and child of each buffered edge by their images
+        under ``node_map``, in place.
+
+        :param array node_map: An array whose ``k``-th entry is the new ID
+            of node ``k``.
+        """
+        for _, _, parent, child in self.columns():
+            parent[:] = node_map[parent]
+            child[:] = node_map[child]
+
+    def clear(self):
+        """
+        Discard all buffered edges.
+        """
+        self.chunks = []
+        self.num_rows = 0
+        self._fill = 0
+        if self._spill_path is not None:
+            self._cleanup()
+            self._spill_path = None
+        self.num_spilled = 0
@@ -0,0 +1,199 @@
+import numpy as np
+
+NULL_ID = -1
+
+
+class DenseIdMap(object):
+    '''
+    A mapping from (input) individual IDs to (output) node IDs, stored as a
+    numpy array indexed by input ID.  This is a drop-in replacement for the
+    dict ``ARGrecorder.node_ids``, suitable when input IDs are integers that
+    are (mostly) allocated in increasing order, as by simuPOP's IdTagger.
+
+    Only the window of input IDs between ``offset`` and ``offset +
+    len(self.nodes)`` is stored, so that ``self.nodes[k - offset]`` is the
+    node ID corresponding to input ID ``k``, or ``NULL_ID`` if ``k`` is not
+    recorded.  At each simplification the window is moved forwards to start
+    at the smallest input ID still alive, so its size is proportional to the
+    range of input IDs born since the last simplification rather than to the
+    total number ever seen.
+
+    As well as the usual dict methods, this supports vectorized lookup with
+    ``lookup()`` and ``contains()``.
+    '''
+
+    def __init__(self, node_ids=None):
+        """
+        :param dict node_ids: A dict (or anything with an ``items()`` method)
+            giving the initial mapping from input IDs to node IDs.
+        """
+        self.offset = 0
+        self.nodes = np.zeros(0, dtype=np.int32)
+        self.num_ids = 0
+        if node_ids is not None:
+            items = list(node_ids.items())
+            if len(items) > 0:
+                keys, values = zip(*items)
+                self.reset(keys, values)
+
+    def __len__(self):
+        return self.num_ids
+
+    def __contains__(self, input_id):
+        j = input_id - self.offset
+        return 0 <= j < len(self.nodes) and self.nodes[j] != NULL_ID
+
+    def __getitem__(self, input_id):
+        j = input_id - self.offset
+        if 0 <= j < len(self.nodes):
+            out = self.nodes[j]
+            if out != NULL_ID:
+                return int(out)
+        raise KeyError(input_id)
+
+    def __setitem__(self, input_id, node_id):
+        j = input_id - self.offset
+        if self.num_ids > 0 and 0 <= j < len(self.nodes):
+            if self.nodes[j] == NULL_ID:
+                self.num_ids += 1
+            self.nodes[j] = node_id
+        else:
+            self.assign([input_id], [node_id])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __str__(self):
+        return str(dict(self.items()))
+
+    def get(self, input_id, default=None):
+        try:
+            return self[input_id]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """
+        Return a numpy array of the input IDs that are recorded, in
+        increasing order.
+        """
+        return np.flatnonzero(self.nodes != NULL_ID) + self.offset
+
+    def values(self):
+        """
+        Return a numpy array of the recorded node IDs, in the same order as
+        ``keys()``.
+        """
+        return self.nodes[self.nodes != NULL_ID]
+
+    def items(self):
+        return zip(self.keys().tolist(), self.values().tolist())
+
+    def update(self, other):
+        """
+        Add the (input ID, node ID) pairs in ``other`` (a dict or an iterable
+        of pairs) to the map.
+        """
+        if hasattr(other, 'items'):
+            other = other.items()
+        other = list(other)
+        if len(other) > 0:
+            keys, values = zip(*other)
+            self.assign(keys, values)
+
+    def contains(self, input_ids):
+        """
+        Vectorized membership test.
+
+        :param array input_ids: Input IDs to look up.
+        :return array: A boolean array that is True where the corresponding
+            input ID is recorded.
+        """
+        return self.lookup(input_ids) != NULL_ID
+
+    def lookup(self, input_ids):
+        """
+        Vectorized lookup.
+
+        :param array input_ids: Input IDs to look up.
+        :return array: An array of the corresponding node IDs, with
+            ``NULL_ID`` for any input IDs that are not recorded.
+        """
+        j = np.asarray(input_ids, dtype=np.int64) - self.offset
+        inside = (j >= 0) & (j < len(self.nodes))
+        out = np.full(j.shape, NULL_ID, dtype=np.int32)
+        out[inside] = self.nodes[j[inside]]
+        return out
+
+    def assign(self, input_ids, node_ids):
+        """
+        Vectorized assignment: set ``self[input_ids[k]] = node_ids[k]`` for
+        each ``k``, growing the window as necessary.
+
+        :param array input_ids: Input IDs.
+        :param array node_ids: The corresponding node IDs.
+        """
+        input_ids = np.asarray(input_ids, dtype=np.int64)
+        if len(input_ids) == 0:
+            return
+        lo = int(input_ids.min())
+        hi = int(input_ids.max())
+        if self.num_ids == 0:
+            self.offset = lo
+        self._grow(lo, hi)
+        j = input_ids - self.offset
+        self.num_ids -= np.count_nonzero(self.nodes[j] != NULL_ID)
+        self.nodes[j] = node_ids
+        self.num_ids += np.count_nonzero(self.nodes[j] != NULL_ID)
+
+    def reset(self, input_ids, node_ids=None):
+        """
+        Discard the current mapping and replace it by one taking
+        ``input_ids[k]`` to ``node_ids[k]``, or to ``k`` if ``node_ids`` is
+        missing (as happens after simplification).  The window is moved to
+        start at the smallest of ``input_ids``.
+
+        :param array input_ids: Input IDs.
+        :param array node_ids: The corresponding node IDs.
+        """
+        input_ids = np.asarray(input_ids, dtype=np.int64)
+        if node_ids is None:
+            node_ids = np.arange(len(input_ids), dtype=np.int32)
+        if len(input_ids) == 0:
+            self.offset = 0
+            self.nodes = np.zeros(0, dtype=np.int32)
+            self.num_ids = 0
+            return
+        self.offset = int(input_ids.min())
+        size = int(input_ids.max()) - self.offset + 1
+        self.nodes = np.full(self._capacity(size), NULL_ID, dtype=np.int32)
+        self.nodes[input_ids - self.offset] = node_ids
+        self.num_ids = np.count_nonzero(self.nodes != NULL_ID)
+
+    def remap(self, node_map):
+        """
+        Replace each recorded node ID by its image under ``node_map``, in
+        place.
+
+        :param array node_map: An array whose ``k``-th entry is the new ID
+            of node ``k``.
+        """
+        recorded = self.nodes != NULL_ID
+        self.nodes[recorded] = node_map[self.nodes[recorded]]
+
+    def _capacity(self, size):
+        # leave room to grow, so that appending is amortized constant time
+        return max(16, size + size // 2)
+
+    def _grow(self, lo, hi):
+        # make sure the window includes lo and hi
+        if lo >= self.offset and hi < self.offset + len(self.nodes):
+            return
+        new_offset = min(lo, self.offset)
+        old_end = self.offset + len(self.nodes)
+        size = max(hi + 1, old_end) - new_offset
+        new_nodes = np.full(self._capacity(size), NULL_ID, dtype=np.int32)
+        start = self.offset - new_offset
+        new_nodes[start:start + len(self.nodes)] = self.nodes
+        self.offset = new_offset
+        self.nodes = new_nodes
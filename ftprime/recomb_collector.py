@@ -1,9 +1,19 @@
 from .argrecorder import ARGrecorder
-import random
-import time as timer
+from .recomb_parser import parse_recombs
+from . import storage
+import numpy as np
+import os
+import queue
+import threading
 from .benchmarker import Timings
 
 
+def _timings(benchmark):
+    if isinstance(benchmark, Timings):
+        return benchmark
+    return Timings() if benchmark else None
+
+
 class RecombCollector:
     '''
     Collect and parse recombination events as output by simuPOP's Recombinator,
@@ -13,6 +23,29 @@ class RecombCollector:
 
     ... coming in *pairs*.
 
+    With ``buffer_generation=True``, the output is just stored as it arrives,
+    and each generation's output is parsed and recorded all at once when the
+    generation ends (at ``increment_time()``), or when ``flush()``,
+    ``simplify()`` or ``tree_sequence()`` is called.
+
+    With ``asynchronous=True``, output is instead put on a queue, and parsed
+    and recorded by a separate thread, so that simuPOP can get on with the
+    next generation in the meantime.  Anything that needs the tables
+    (``simplify()``, ``tree_sequence()``, etc.) first waits for the queue to
+    empty, as does ``flush()``, which must be called before using ``self.args``
+    directly; call ``close()`` when finished to stop the thread.
+
+    For a population with more than one chromosome (simuPOP's
+    ``loci=[n1, n2, ...]``), give ``locus_position`` as a list of the locus
+    positions on each chromosome.  The chromosomes are laid end to end in
+    the underlying ARGrecorder, so the initial ``ts`` must have a sequence
+    length equal to the sum of their lengths.  simuPOP reports the
+    independent assortment of chromosomes as crossovers after the last
+    locus of a chromosome, and these put a breakpoint exactly at the end of
+    that chromosome, so there is free recombination between them.  To get
+    the tree sequence of a single chromosome, in its own coordinates, use
+    ``tree_sequence(samples, chromosome=k)``.
+
     This keeps track of *time* - so when used, the time must be updated -
     in simuPOP, by adding rc.increment_time() to the PreOps.  It should be in PreOps
     because if so
@@ -21,7 +54,9 @@ class RecombCollector:
         - the first generation is recorded at time 1.0
     '''
     def __init__(self, ts, node_ids, locus_position, benchmark=False,
-                 mode='text'):
+                 mode='text', simplify_policy=None, background_simplify=False,
+                 seed=None, buffer_generation=False, asynchronous=False,
+                 queue_size=16):
         """
         :param TreeSequence ts: A tree sequence describing the history of each
             chromosome in the population before the simulation starts.
@@ -32,41 +67,162 @@ class RecombCollector:
             Must specify this for every individual that may be a parent moving forward.
         :param list locus_position: A list of coordinates on the genome of the loci
             that simuPOP is keeping track of.  There must be a locus at the beginning
-            and also at the end of the chromosome.
-            :param bool benchmark: Whether to store benchmark information in the
-            ARGrecorder.
+            and also at the end of the chromosome.  With several chromosomes,
+            this is a list of such lists, one for each chromosome.
+        :param bool benchmark: Whether to store benchmark information in the
+            ARGrecorder; this may also be a :class:`ftprime.benchmarker.Timings`
+            to store it in.
         :param str mode: can be 'text or 'binary' then bstrs must be passed to
             `.collect_recombs`.
+        :param SimplifyPolicy simplify_policy: Decides when ``maybe_simplify``
+            actually simplifies.
+        :param bool background_simplify: Whether to simplify in another
+            process, while collecting continues (see ``ARGrecorder.simplify``).
+        :param int seed: The seed for the random number generator used to
+            place breakpoints between loci.
+        :param bool buffer_generation: Whether to store the output passed to
+            ``collect_recombs`` and record it a generation at a time.
+        :param bool asynchronous: Whether to parse and record output in a
+            separate thread.
+        :param int queue_size: The maximum number of chunks of output (or
+            generations, if ``buffer_generation`` is True) waiting to be
+            recorded by that thread, after which ``collect_recombs`` blocks.
 
         """
+        if len(locus_position) > 0 and np.ndim(locus_position[0]) > 0:
+            chromosomes = locus_position
+        else:
+            chromosomes = [locus_position]
+        for x in chromosomes:
+            if len(x) == 0 or x[0] != 0.0:
+                raise ValueError("locus_position (and lociPos) must include a locus\
+                                  at each end of the chromosome.")
+        lengths = [x[-1] for x in chromosomes]
+        chromosome_breaks = np.concatenate([[0.0], np.cumsum(lengths)])
+        if chromosome_breaks[-1] != ts.sequence_length:
+            raise ValueError("The chromosome lengths (the last entries of "
+                             "locus_position) must sum to ts.sequence_length.")
+        locus_position = np.concatenate(
+                [np.asarray(x, dtype=np.float64) + start
+                 for x, start in zip(chromosomes, chromosome_breaks)])
+        self._init_state(ts.sequence_length, locus_position, chromosome_breaks,
+                         mode, seed, buffer_generation)
+
+        haploid_node_ids = {self.i2c(x[0], x[1]):node_ids[(x[0], x[1])] 
+                            for x in node_ids}
+        self.args = ARGrecorder(node_ids=haploid_node_ids, ts=ts,
+                                timings=_timings(benchmark),
+                                simplify_policy=simplify_policy,
+                                background_simplify=background_simplify)
+        if self.args.timings is not None:
+            self.args.timings.instrument(self, self._TIMED_METHODS, self.args)
+
+        if asynchronous:
+            self._start_thread(queue_size)
+
+    # the methods that record an event with the ARGrecorder's Timings, if
+    # it has one, and the kind of event
+    _TIMED_METHODS = {'_parse': 'parsing'}
+
+    def _init_state(self, sequence_length, locus_position, chromosome_breaks,
+                    mode, seed, buffer_generation):
         if mode == 'text':
             self.split = '\n'
         elif mode == 'binary':
             self.split = b'\n'
         else:
             raise ValueError("mode must be 'str' or 'binary'")
-        self.sequence_length = ts.sequence_length
-        self.locus_position = locus_position
+        self.sequence_length = sequence_length
+        self.locus_position = np.array(locus_position, dtype=np.float64)
+        # chromosome k is [chromosome_breaks[k], chromosome_breaks[k+1])
+        self.chromosome_breaks = np.array(chromosome_breaks, dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
         self.last_child = -1
         self.time = 0.0
-
-        if locus_position[0] != 0.0 or locus_position[-1] != self.sequence_length:
-            raise ValueError("locus_position (and lociPos) must include a locus\
-                              at each end of the chromosome.")
-
-        haploid_node_ids = {self.i2c(x[0], x[1]):node_ids[(x[0], x[1])] 
-                            for x in node_ids}
-        if not benchmark:
-            self.args = ARGrecorder(node_ids=haploid_node_ids, ts=ts)
-        else:
-            self.args = ARGrecorder(node_ids=haploid_node_ids, ts=ts,
-                                    timings=Timings())
-
+        self.buffer_generation = buffer_generation
+        # chunks of output waiting to be recorded
+        self.buffer = []
+        self.queue = None
+        self._thread = None
+        self._error = None
         # will record IDs of diploid samples here when they are chosen
         # but note we don't keep anything else about them here (time, location)
         # as this is recorded by the ARGrecorder
         self.diploid_samples = None
 
+    def _start_thread(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._consume,
+                                        name="RecombCollector")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def save(self, path):
+        """
+        Save the state of the collector, including its ARGrecorder, to the
+        directory ``path``, so that it can be restored with
+        ``RecombCollector.load(path)``.  Any output waiting to be recorded is
+        recorded first.
+
+        :param str path: The directory to save to.
+        """
+        self.flush()
+        self.args.save(path)
+        np.save(os.path.join(path, "locus_position.npy"), self.locus_position)
+        np.save(os.path.join(path, "chromosome_breaks.npy"),
+                self.chromosome_breaks)
+        state = {
+            'sequence_length': self.sequence_length,
+            'mode': self.mode,
+            'time': self.time,
+            'last_child': self.last_child,
+            'buffer_generation': self.buffer_generation,
+            'rng_state': self.rng.bit_generator.state,
+        }
+        storage.save_state(state, path, "collector.json")
+
+    @classmethod
+    def load(cls, path, benchmark=False, simplify_policy=None,
+             background_simplify=False, asynchronous=False, queue_size=16,
+             mmap=False):
+        """
+        Restore a collector saved with ``save(path)``, which carries on
+        exactly where it left off, including the random number generator.
+        The remaining arguments are as for ``RecombCollector()``, and
+        ``ARGrecorder.load``.
+
+        :param str path: The directory the collector was saved to.
+        :return RecombCollector: The restored collector.
+        """
+        state = storage.load_state(path, "collector.json")
+        out = cls.__new__(cls)
+        breaks_path = os.path.join(path, "chromosome_breaks.npy")
+        if os.path.exists(breaks_path):
+            chromosome_breaks = np.load(breaks_path)
+        else:
+            chromosome_breaks = [0.0, state['sequence_length']]
+        out._init_state(state['sequence_length'],
+                        np.load(os.path.join(path, "locus_position.npy")),
+                        chromosome_breaks, state['mode'], None,
+                        state['buffer_generation'])
+        out.time = state['time']
+        out.last_child = state['last_child']
+        out.rng.bit_generator.state = state['rng_state']
+        out.args = ARGrecorder.load(path,
+                                    timings=_timings(benchmark),
+                                    simplify_policy=simplify_policy,
+                                    background_simplify=background_simplify,
+                                    mmap=mmap)
+        if out.args.timings is not None:
+            out.args.timings.instrument(out, cls._TIMED_METHODS, out.args)
+        if asynchronous:
+            out._start_thread(queue_size)
+        return out
+
+    @property
+    def num_chromosomes(self):
+        return len(self.chromosome_breaks) - 1
+
     @property
     def mode(self):
         if self.split == '\n':
@@ -98,16 +254,76 @@ class RecombCollector:
 
         :return int: The node ID for this chromosome in the output tables.
         """
+        self.flush()
+        self.args.wait()
         return self.args.node_ids[self.i2c(k,p)]
 
     def increment_time(self):
+        self._flush_buffer()
         self.time += 1.0
 
+    def flush(self):
+        """
+        Parse and record any output stored by ``collect_recombs``, if
+        ``buffer_generation`` is True, and wait until all output has been
+        recorded, if ``asynchronous`` is True.
+        """
+        self._flush_buffer()
+        if self.queue is not None:
+            self.queue.join()
+            self._check_error()
+
+    def close(self):
+        """
+        Record any remaining output, and stop the thread that records it,
+        if ``asynchronous`` is True.
+        """
+        self.flush()
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self.queue = None
+
+    def _flush_buffer(self):
+        if len(self.buffer) > 0:
+            lines = self.split.join(self.buffer)
+            self.buffer = []
+            self._record(lines)
+
+    def _record(self, lines):
+        if self.queue is None:
+            self._collect(lines, self.time)
+        else:
+            self._check_error()
+            self.queue.put((lines, self.time))
+
+    def _consume(self):
+        # run by the recording thread, until it gets None
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._collect(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self.queue.task_done()
+
+    def _check_error(self):
+        # pass on an error from the recording thread; after this nothing
+        # more is recorded, as the tables may be incomplete
+        if self._error is not None:
+            raise self._error
+
     def collect_recombs(self, lines):
         """
         Collects recombinations arriving in text form from simuPOP.
 
-        :param str lines: Recombination data from simuPOP.
+        :param str lines: Recombination data from simuPOP (bytes, if
+            ``mode`` is ``'binary'``).
 
         :details
 
@@ -118,70 +334,108 @@ class RecombCollector:
         in *pairs* for (paternal, maternal) chromosomes, as output by
         ``simuPOP.Recombinator()``. A parental chromosome inherited without a
         crossover would be recorded with no recombinations.
+
+        The whole block is parsed at once by ``parse_recombs``, and the
+        resulting nodes and edges are recorded in bulk.  If
+        ``buffer_generation`` is True, this is put off until ``flush()``, and
+        if ``asynchronous`` is True, it is done by another thread.
         """
-        if self.args.timings is not None:
-            before = timer.process_time()
-        for line in lines.strip().split(self.split):
-            # print("A: "+line)
-            # child, parent, ploid,*rec = [int(x) for x in line.split()]
-            linex = [int(x) for x in line.split()]
-            child = linex[0]
-            parent = linex[1]
-            ploid = linex[2]
-            rec = linex[3:]
-            # lines come in pairs: maternal/paternal.
-            if child == self.last_child:
-                child_p = 1
-            else:
-                child_p = 0
-                self.last_child = child
-            # if self.ind_to_time(child) > self.ind_to_time(parent):
-            #     raise ValueError(str(child)+" at "+
-            #            str(self.ind_to_time(child))+'
-            #            " does not come after " + str(parent)+
-            #            " at "+str(self.ind_to_time(parent)))
-
-            start = 0.0
-            child_chrom = self.i2c(child, child_p)
-            # print("  existing parent:",parent, ploid,"-i2c->",
-            # self.i2c(parent, ploid))
-
-            # print("  adding child:",child, child_p,"-i2c->",child_chrom,
-            # self.time)
-            self.args.add_individual(child_chrom, self.time)
-            for r in rec:
-                # do this check to avoid a simuPOP bug
-                if r < len(self.locus_position) - 1:
-                    breakpoint = random.uniform(self.locus_position[r],
-                                                self.locus_position[r + 1])
-                    # print("--- ",start, self.locus_position[r],
-                    #       "< = ",breakpoint,"<=",self.locus_position[r+1])
-                    self.args.add_record(
-                            left=start,
-                            right=breakpoint,
-                            parent=self.i2c(parent, ploid),
-                            children=(child_chrom,))
-                    start = breakpoint
-                    ploid = ((ploid + 1) % 2)
-            # print("--- ",start, self.sequence_length," |")
-            self.args.add_record(
-                    left=start,
-                    right=self.sequence_length,
-                    parent=self.i2c(parent, ploid),
-                    children=(child_chrom,))
+        if self.buffer_generation:
+            self.buffer.append(lines)
+        else:
+            self._record(lines)
 
-        if self.args.timings is not None:
-            self.args.timings.time_appending += timer.process_time() - before
+    def _parse(self, lines):
+        return parse_recombs(lines)
+
+    def _collect(self, lines, time):
+        recombs = self._parse(lines)
+        if len(recombs.child) > 0:
+            self.record_recombs(recombs, time)
 
-    def tree_sequence(self, samples):
+    def record_recombs(self, recombs, time=None):
+        """
+        Record the meioses described by a RecombData, as returned by
+        ``parse_recombs``: each line gives a new chromosome, and the edges
+        from the segments of the parent's chromosomes that it inherits.
+
+        :param RecombData recombs: The parsed recombination data.
+        :param float time: The birth time of the new chromosomes (defaults to
+            ``self.time``).
+        """
+        if time is None:
+            time = self.time
+        child = recombs.child
+        parent = recombs.parent
+        ploidy = recombs.ploidy
+        num_lines = len(child)
+        if np.any((ploidy != 0) & (ploidy != 1)):
+            raise ValueError("Chromosome ID must be 0 (paternal) or 1 (maternal).")
+        # lines come in pairs: maternal/paternal.
+        child_p = np.empty(num_lines, dtype=np.int64)
+        child_p[0] = (child[0] == self.last_child)
+        child_p[1:] = (child[1:] == child[:-1])
+        self.last_child = int(child[-1])
+        child_chrom = 2 * child + child_p
+        self.args.add_individuals(child_chrom, time)
+        # do this check to avoid a simuPOP bug
+        rec = recombs.crossovers
+        rec_line = np.repeat(np.arange(num_lines), np.diff(recombs.offsets))
+        use = rec < len(self.locus_position) - 1
+        rec = rec[use]
+        rec_line = rec_line[use]
+        breakpoints = self.rng.uniform(self.locus_position[rec],
+                                       self.locus_position[rec + 1])
+        # each line gives one more edge than it has crossovers,
+        # switching parental chromosome at each crossover
+        num_edges = np.bincount(rec_line, minlength=num_lines) + 1
+        edge_end = np.cumsum(num_edges)
+        edge_start = edge_end - num_edges
+        edge_line = np.repeat(np.arange(num_lines), num_edges)
+        switches = np.arange(edge_end[-1]) - edge_start[edge_line]
+        is_first = np.zeros(edge_end[-1], dtype=bool)
+        is_first[edge_start] = True
+        lefts = np.zeros(edge_end[-1], dtype=np.float64)
+        lefts[~is_first] = breakpoints
+        rights = np.full(edge_end[-1], self.sequence_length, dtype=np.float64)
+        rights[np.flatnonzero(~is_first) - 1] = breakpoints
+        self.args.add_records(
+                lefts=lefts,
+                rights=rights,
+                parents=2 * parent[edge_line] + (ploidy[edge_line] + switches) % 2,
+                children=child_chrom[edge_line])
+
+    def tree_sequence(self, samples, chromosome=None):
             """
             Returns a tree sequence, that retains only information relevant
             to the diploid individuals listed in `samples`.
 
             :param list samples: A list of diploid input individual IDs.
+            :param int chromosome: If given, return the tree sequence of only
+                this chromosome, with coordinates starting from zero at its
+                beginning; otherwise, that of all chromosomes, end to end.
             """
+            self.flush()
             haploid_ids = [self.i2c(i,p) for i in samples for p in (0,1)]
-            return self.args.tree_sequence(haploid_ids)
+            ts = self.args.tree_sequence(haploid_ids)
+            if chromosome is None:
+                return ts
+            if not 0 <= chromosome < self.num_chromosomes:
+                raise ValueError("No chromosome " + str(chromosome) + ".")
+            start = self.chromosome_breaks[chromosome]
+            end = self.chromosome_breaks[chromosome + 1]
+            tables = ts.dump_tables()
+            tables.keep_intervals([[start, end]], simplify=False)
+            edges = tables.edges
+            edges.set_columns(left=edges.left - start, right=edges.right - start,
+                              parent=edges.parent, child=edges.child)
+            sites = tables.sites
+            sites.set_columns(position=sites.position - start,
+                              ancestral_state=sites.ancestral_state,
+                              ancestral_state_offset=sites.ancestral_state_offset)
+            tables.sequence_length = end - start
+            tables.simplify(samples=np.arange(ts.num_samples, dtype=np.int32))
+            return tables.tree_sequence()
 
     def simplify(self, samples):
         """
@@ -190,9 +444,27 @@ class RecombCollector:
 
         :param list samples: A list of diploid input individual IDs.
         """
+        self.flush()
         haploid_ids = [self.i2c(i,p) for i in samples for p in (0,1)]
         self.args.simplify(haploid_ids)
 
+    def maybe_simplify(self, samples):
+        """
+        Simplify the underlying tree sequence as in ``simplify``, but only if
+        the ``simplify_policy`` says it is time to.  Call this every
+        generation.
+
+        :param list samples: A list of diploid input individual IDs.
+        :return bool: Whether the tables were simplified.
+        """
+        if self.args.simplify_policy is None:
+            raise ValueError("maybe_simplify() needs a simplify_policy.")
+        self.flush()
+        if self.args.simplify_policy.should_simplify(self.args):
+            self.simplify(samples)
+            return True
+        return False
+
     def add_locations(self, input_ids, locations):
         """
         Assign the `population` field of each individual in `input_ids` to the corresponding
@@ -201,12 +473,7 @@ class RecombCollector:
         :param list input_ids: A list of input diploid individual IDs.
         :param list locations: A list of population IDs.
         """
-        populations = self.args.nodes.population
-        for i, loc in zip([int(j) for j in input_ids], locations):
-            for p in (0,1):
-                h = self.i2c(i, p)
-                node_id = self.args.node_ids[h]
-                populations[node_id] = int(loc)
-        self.args.nodes.set_columns(flags=self.args.nodes.flags,
-                                    time=self.args.nodes.time,
-                                    population=populations)
+        self.flush()
+        input_ids = [int(j) for j in input_ids]
+        self.args.set_populations([self.i2c(i, p) for i in input_ids for p in (0,1)],
+                                  [int(loc) for loc in locations for p in (0,1)])
@@ -0,0 +1,195 @@
+import numpy as np
+from .recomb_parser import RecombData
+
+_ZERO = ord('0')
+_SPACE = ord(' ')
+_NEWLINE = ord('\n')
+_POWERS = 10 ** np.arange(1, 19, dtype=np.int64)
+# the digits of 0000 to 9999, four bytes in each entry
+_DIGITS = np.frombuffer("".join("{:04d}".format(k) for k in range(10000))
+                        .encode('ascii'), dtype=np.uint32)
+
+
+def format_recombs(recombs, binary=False):
+    """
+    Write out a RecombData as simuPOP's Recombinator would, as lines of
+
+        offspringID parentID startingPloidy rec1 rec2 ....
+
+    so that ``parse_recombs(format_recombs(recombs))`` gives back
+    ``recombs``.  All the digits are written at once, with numpy, rather
+    than line by line.
+
+    :param RecombData recombs: The data to write out.
+    :param bool binary: Whether to return bytes rather than a str.
+    :return str: The Recombinator output.
+    """
+    num_lines = len(recombs.child)
+    line_length = np.diff(recombs.offsets) + 3
+    num_tokens = int(np.sum(line_length))
+    if num_tokens == 0:
+        return b'' if binary else ''
+    # the tokens, in order: each line's child, parent, ploidy and crossovers
+    line_start = np.zeros(num_lines, dtype=np.int64)
+    np.cumsum(line_length[:-1], out=line_start[1:])
+    values = np.empty(num_tokens, dtype=np.int64)
+    is_rec = np.ones(num_tokens, dtype=bool)
+    for j, x in enumerate((recombs.child, recombs.parent, recombs.ploidy)):
+        values[line_start + j] = x
+        is_rec[line_start + j] = False
+    values[is_rec] = recombs.crossovers
+    if np.any(values < 0):
+        raise ValueError("Recombination data must be nonnegative.")
+    num_digits = np.searchsorted(_POWERS, values, side='right') + 1
+    # Write each token as a row of digits, most significant first, padded
+    # on the left with zeros, and followed by a space (or a newline at the
+    # end of a line); the output is then all the rows, without the padding.
+    # The digits are looked up four at a time.
+    num_chunks = -(-int(num_digits.max()) // 4)
+    width = 4 * num_chunks
+    chunks = np.empty((num_tokens, num_chunks), dtype=np.int64)
+    rest = values
+    for j in range(num_chunks - 1, -1, -1):
+        rest, chunks[:, j] = np.divmod(rest, 10000)
+    rows = np.empty((num_tokens, width + 1), dtype=np.uint8)
+    rows[:, :-1] = (_DIGITS[chunks].view(np.uint8)
+                    .reshape((num_tokens, width)))
+    rows[:, -1] = _SPACE
+    rows[line_start + line_length - 1, -1] = _NEWLINE
+    keep = np.ones(rows.shape, dtype=bool)
+    keep[:, :-1] = (np.arange(width - 1, -1, -1)
+                    < num_digits[:, np.newaxis])
+    buf = rows[keep]
+    out = buf.tobytes()
+    return out if binary else out.decode('ascii')
+
+
+class RecombGenerator(object):
+    '''
+    Generates output like that of simuPOP's Recombinator, for a randomly
+    mating population of ``N`` diploids with nonoverlapping generations, so
+    that a RecombCollector can be tested and profiled without simuPOP.  Each
+    generation, ``N`` offspring are born, with IDs following on from the
+    last, each to two distinct parents chosen at random from the previous
+    generation; the individuals of the initial generation have IDs
+    ``0, ..., N-1``.  Each offspring gives a *pair* of lines of output,
+
+        offspringID parentID startingPloidy rec1 rec2 ....
+
+    the first for the chromosome inherited from its first parent and the
+    second from its second, with a random starting ploidy, and crossovers
+    after each of the first ``num_loci - 1`` loci happening independently
+    with probability ``recomb_rate`` (as in ``Recombinator(rates=...)``).
+
+    Everything is drawn and written out a generation at a time, with numpy,
+    so that gigabytes of output can be made quickly.
+    '''
+
+    def __init__(self, N, num_loci, recomb_rate, seed=None):
+        """
+        :param int N: The number of diploid individuals in each generation.
+        :param int num_loci: The number of loci on the chromosome.
+        :param float recomb_rate: The probability of a crossover between each
+            pair of adjacent loci.
+        :param int seed: The seed for the random number generator.
+        """
+        if N < 2:
+            raise ValueError("The population must have at least two individuals.")
+        if num_loci < 1:
+            raise ValueError("There must be at least one locus.")
+        if not 0.0 <= recomb_rate <= 1.0:
+            raise ValueError("recomb_rate must be between 0 and 1.")
+        self.N = N
+        self.num_loci = num_loci
+        self.recomb_rate = recomb_rate
+        self.rng = np.random.default_rng(seed)
+        self.population = np.arange(N, dtype=np.int64)
+        self.generation = 0
+
+    @property
+    def node_ids(self):
+        """
+        The ``node_ids`` for a RecombCollector, for an initial tree sequence
+        whose samples ``2k`` and ``2k+1`` are the chromosomes of individual
+        ``k`` of the initial generation.
+        """
+        return {(k, p): 2 * k + p for k in range(self.N) for p in (0, 1)}
+
+    def _crossovers(self, num_lines):
+        # The number of crossovers of each line is binomial, and given that
+        # they are at distinct loci, chosen uniformly: draw them with
+        # replacement, and redraw repeats until there are none.
+        num_rec = self.rng.binomial(self.num_loci - 1, self.recomb_rate,
+                                    size=num_lines)
+        line = np.repeat(np.arange(num_lines, dtype=np.int64), num_rec)
+        num_intervals = max(self.num_loci - 1, 1)
+        # sort by line, then locus
+        key = line * num_intervals + self.rng.integers(0, num_intervals,
+                                                       size=len(line))
+        while True:
+            key.sort()
+            repeat = np.flatnonzero(key[1:] == key[:-1]) + 1
+            if len(repeat) == 0:
+                break
+            key[repeat] += (self.rng.integers(0, num_intervals,
+                                              size=len(repeat))
+                            - key[repeat] % num_intervals)
+        rec = key % num_intervals
+        offsets = np.zeros(num_lines + 1, dtype=np.int64)
+        np.cumsum(num_rec, out=offsets[1:])
+        return offsets, rec
+
+    def next_recombs(self):
+        """
+        Draw the next generation.
+
+        :return RecombData: The meioses that produced it, as would be given
+            by ``parse_recombs`` from the Recombinator output.
+        """
+        N = self.N
+        first_id = self.population[-1] + 1
+        offspring = np.arange(first_id, first_id + N, dtype=np.int64)
+        first = self.rng.integers(0, N, size=N)
+        second = (first + self.rng.integers(1, N, size=N)) % N
+        parents = np.column_stack([self.population[first],
+                                   self.population[second]]).ravel()
+        offsets, crossovers = self._crossovers(2 * N)
+        self.population = offspring
+        self.generation += 1
+        return RecombData(child=np.repeat(offspring, 2),
+                          parent=parents,
+                          ploidy=self.rng.integers(0, 2, size=2 * N),
+                          offsets=offsets,
+                          crossovers=crossovers)
+
+    def next_output(self, binary=False):
+        """
+        Draw the next generation, and return its Recombinator output.
+
+        :param bool binary: Whether to return bytes rather than a str.
+        :return str: The output.
+        """
+        return format_recombs(self.next_recombs(), binary=binary)
+
+    def generate(self, num_generations, binary=False):
+        """
+        Iterate over the output of the next ``num_generations`` generations,
+        one generation at a time.
+        """
+        for _ in range(num_generations):
+            yield self.next_output(binary=binary)
+
+    def write(self, f, num_generations):
+        """
+        Write the output of the next ``num_generations`` generations to a
+        file opened in binary mode.
+
+        :param file f: The file.
+        :param int num_generations: The number of generations.
+        :return int: The number of bytes written.
+        """
+        size = 0
+        for out in self.generate(num_generations, binary=True):
+            f.write(out)
+            size += len(out)
+        return size
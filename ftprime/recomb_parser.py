@@ -0,0 +1,90 @@
+import collections
+import numpy as np
+
+RecombData = collections.namedtuple("RecombData",
+                                    ["child", "parent", "ploidy",
+                                     "offsets", "crossovers"])
+RecombData.__doc__ = '''
+The contents of a block of output from simuPOP's Recombinator, one entry of
+``child``, ``parent`` and ``ploidy`` per line: the crossovers of the ``k``-th
+line are ``crossovers[offsets[k]:offsets[k + 1]]``.
+'''
+
+_ZERO = ord('0')
+_NEWLINE = ord('\n')
+# which bytes may appear: digits and whitespace
+_VALID = np.zeros(256, dtype=bool)
+_VALID[[ord(x) for x in '0123456789 \t\r\n']] = True
+_MAX_DIGITS = 18
+
+
+def parse_recombs(data):
+    """
+    Parse recombination events as output by simuPOP's Recombinator, which
+    are lines of whitespace-separated nonnegative integers, like
+
+        offspringID parentID startingPloidy rec1 rec2 ....
+
+    The whole block is parsed at once, with numpy, rather than line by line.
+    If ``data`` is ``bytes`` (or anything else supporting the buffer
+    protocol) it is read without copying; a ``str`` is first encoded as
+    ASCII.  Apart from the output, the memory used is a few bytes per byte
+    of input, and a few integers per number.
+
+    :param data: The Recombinator output, as a str or bytes.
+    :return RecombData: Arrays of the child, parent, starting ploidy,
+        and crossovers of each line, and the offsets of each line's
+        crossovers.
+    """
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not np.all(_VALID[buf]):
+        raise ValueError("Recombination data must consist of nonnegative "
+                         "integers separated by whitespace.")
+    # tokens are maximal runs of digits
+    is_digit = np.zeros(len(buf) + 2, dtype=bool)
+    np.less(buf - np.uint8(_ZERO), 10, out=is_digit[1:-1])
+    change = np.flatnonzero(is_digit[1:] != is_digit[:-1])
+    del is_digit
+    starts = change[::2].copy()
+    lengths = change[1::2] - starts
+    del change
+    num_tokens = len(starts)
+    if num_tokens == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return RecombData(child=empty, parent=empty, ploidy=empty,
+                          offsets=np.zeros(1, dtype=np.int64),
+                          crossovers=empty)
+    if lengths.max() > _MAX_DIGITS:
+        raise ValueError("Integer too large in recombination data.")
+    lengths = lengths.astype(np.uint8)
+    # the value of each token, one digit place at a time, for the tokens
+    # that have that many digits
+    values = buf[starts].astype(np.int64) - _ZERO
+    todo = np.flatnonzero(lengths > 1)
+    place = 1
+    while len(todo) > 0:
+        values[todo] = values[todo] * 10 + (buf[starts[todo] + place] - _ZERO)
+        place += 1
+        todo = todo[lengths[todo] > place]
+    # group the tokens into lines
+    newlines = np.flatnonzero(buf == _NEWLINE)
+    line = np.searchsorted(newlines, starts)
+    del newlines, starts
+    line_start = np.flatnonzero(np.concatenate([[True], line[1:] != line[:-1]]))
+    del line
+    line_length = np.diff(np.append(line_start, num_tokens))
+    if line_length.min() < 3:
+        raise ValueError("Each line of recombination data must have at least "
+                         "an offspring ID, a parent ID, and a starting ploidy.")
+    is_rec = np.ones(num_tokens, dtype=bool)
+    for j in range(3):
+        is_rec[line_start + j] = False
+    offsets = np.zeros(len(line_start) + 1, dtype=np.int64)
+    np.cumsum(line_length - 3, out=offsets[1:])
+    return RecombData(child=values[line_start],
+                      parent=values[line_start + 1],
+                      ploidy=values[line_start + 2],
+                      offsets=offsets,
+                      crossovers=values[is_rec])
@@ -0,0 +1,71 @@
+import time as timer
+
+
+class SimplifyPolicy(object):
+    '''
+    Decides when an :class:`ftprime.ARGrecorder` should simplify, as an
+    alternative to simplifying at a fixed interval.  A simplify is called
+    for as soon as any of the limits that are set is exceeded:
+
+        - ``max_unsimplified_edges``: the number of edges added since the
+          last simplify;
+        - ``max_bytes``: the (approximate) memory used by the recorder's
+          tables and buffers, as estimated by ``ARGrecorder.nbytes``;
+        - ``target_fraction``: the fraction of (wall-clock) time spent
+          simplifying.  The time taken by the last simplify is taken as the
+          cost of the next one, so a simplify is due once the time since the
+          last one is at least ``cost * (1 - target_fraction) /
+          target_fraction``.
+
+    To use, pass a policy to the ARGrecorder (or RecombCollector) as
+    ``simplify_policy``, and call ``maybe_simplify(samples)`` every
+    generation instead of ``simplify(samples)``.
+    '''
+
+    def __init__(self, max_unsimplified_edges=None, max_bytes=None,
+                 target_fraction=None):
+        """
+        :param int max_unsimplified_edges: The maximum number of edges to add
+            between simplifies.
+        :param int max_bytes: The maximum memory, in bytes, to let the tables
+            grow to before simplifying.
+        :param float target_fraction: The fraction of time that should be
+            spent simplifying, between 0 and 1.
+        """
+        if (max_unsimplified_edges is None and max_bytes is None
+                and target_fraction is None):
+            raise ValueError("At least one of max_unsimplified_edges, "
+                             "max_bytes, or target_fraction must be given.")
+        if target_fraction is not None and not (0 < target_fraction < 1):
+            raise ValueError("target_fraction must be between 0 and 1.")
+        self.max_unsimplified_edges = max_unsimplified_edges
+        self.max_bytes = max_bytes
+        self.target_fraction = target_fraction
+
+    def __str__(self):
+        return ("SimplifyPolicy(max_unsimplified_edges={}, max_bytes={}, "
+                "target_fraction={})".format(self.max_unsimplified_edges,
+                                             self.max_bytes,
+                                             self.target_fraction))
+
+    def should_simplify(self, recorder):
+        """
+        Whether the recorder is due to simplify.
+
+        :param ARGrecorder recorder: The recorder.
+        :return bool: True if ``recorder`` should simplify now.
+        """
+        if (self.max_unsimplified_edges is not None and
+                recorder.num_unsimplified_edges >= self.max_unsimplified_edges):
+            return True
+        if self.max_bytes is not None and recorder.nbytes >= self.max_bytes:
+            return True
+        if self.target_fraction is not None:
+            if recorder.last_simplify_cost is None:
+                # simplify once to find out how long it takes
+                return recorder.num_unsimplified_edges > 0
+            elapsed = timer.perf_counter() - recorder.last_simplify_end
+            wait = (recorder.last_simplify_cost * (1 - self.target_fraction)
+                    / self.target_fraction)
+            return elapsed >= wait
+        return False
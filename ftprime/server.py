@@ -0,0 +1,426 @@
+import builtins
+import os
+import shutil
+import socket
+import stat
+import struct
+import tempfile
+import time as timer
+import traceback
+import msprime
+import numpy as np
+
+from .argrecorder import ARGrecorder
+
+# Messages from the client are a header (an operation code and a number of
+# rows) followed by the rows, packed as little-endian numpy columns:
+#   ADD_INDIVIDUALS: input ID (int64), time (float64), flags (uint32),
+#                    population (int32)
+#   ADD_RECORDS:     left (float64), right (float64), parent (int64),
+#                    child (int64)
+#   SIMPLIFY, TREE_SEQUENCE: samples (int64); for TREE_SEQUENCE, a number of
+#                    rows of NO_SAMPLES means to use the default samples
+#   SYNC, CLOSE:     nothing
+# The last four are answered with a reply header (a status, OK or ERROR, and
+# a length) followed by that many bytes: for TREE_SEQUENCE, the tree sequence
+# file, and for ERROR, the error message.
+OP_ADD_INDIVIDUALS = 1
+OP_ADD_RECORDS = 2
+OP_SIMPLIFY = 3
+OP_TREE_SEQUENCE = 4
+OP_SYNC = 5
+OP_CLOSE = 6
+STATUS_OK = 0
+STATUS_ERROR = 1
+NO_SAMPLES = 2 ** 64 - 1
+
+_HEADER = struct.Struct('<BQ')
+_INDIVIDUAL_COLUMNS = [np.dtype('<i8'), np.dtype('<f8'),
+                       np.dtype('<u4'), np.dtype('<i4')]
+_RECORD_COLUMNS = [np.dtype('<f8'), np.dtype('<f8'),
+                   np.dtype('<i8'), np.dtype('<i8')]
+_SAMPLE_COLUMNS = [np.dtype('<i8')]
+
+
+def _int_column(x, dtype):
+    # as for input IDs in ARGrecorder, rather than rounding or wrapping
+    # around, refuse anything that isn't an integer that fits
+    x = np.asarray(x)
+    if x.size > 0 and x.dtype.kind not in 'iu':
+        raise ValueError("IDs, flags and populations must be integers, not "
+                         + repr(x.ravel()[0]) + ".")
+    out = x.astype(dtype)
+    if np.any(out != x):
+        raise ValueError("Value out of range for " + str(dtype) + ": "
+                         + repr(x[out != x].ravel()[0]) + ".")
+    return out
+
+
+def _pack(op, columns, dtypes):
+    num_rows = len(columns[0]) if len(columns) > 0 else 0
+    out = [_HEADER.pack(op, num_rows)]
+    for x, dtype in zip(columns, dtypes):
+        if dtype.kind in 'iu':
+            x = _int_column(x, dtype)
+        out.append(np.broadcast_to(np.asarray(x, dtype=dtype),
+                                   (num_rows,)).tobytes())
+    return b''.join(out)
+
+
+def _recv_exact(sock, num_bytes):
+    buf = bytearray(num_bytes)
+    view = memoryview(buf)
+    got = 0
+    while got < num_bytes:
+        n = sock.recv_into(view[got:])
+        if n == 0:
+            raise EOFError("Connection closed.")
+        got += n
+    return buf
+
+
+def _recv_columns(sock, num_rows, dtypes):
+    row_size = sum(dtype.itemsize for dtype in dtypes)
+    buf = _recv_exact(sock, num_rows * row_size)
+    columns = []
+    offset = 0
+    for dtype in dtypes:
+        columns.append(np.frombuffer(buf, dtype=dtype, count=num_rows,
+                                     offset=offset))
+        offset += num_rows * dtype.itemsize
+    return columns
+
+
+def _dump_bytes(ts):
+    tempdir = tempfile.mkdtemp(prefix="ftprime_")
+    try:
+        path = os.path.join(tempdir, "out.trees")
+        ts.dump(path)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def _load_bytes(data):
+    tempdir = tempfile.mkdtemp(prefix="ftprime_")
+    try:
+        path = os.path.join(tempdir, "in.trees")
+        with open(path, 'wb') as f:
+            f.write(data)
+        return msprime.load(path)
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+class RecorderServer(object):
+    '''
+    Runs an :class:`ARGrecorder` in a separate process, which is sent
+    births and inheritance events over a Unix socket by a
+    :class:`RecorderClient`.  This keeps the tables (and the work of sorting
+    and simplifying them) out of the simulation's process.
+
+    The server keeps running if a client disconnects, and waits for another
+    to connect; it stops when a client calls ``close()``.  The server
+    process is forked, and detached from the process that started it (in a
+    new session), so that it keeps the recorded tables if the simulation
+    exits or crashes: a new client can connect to carry on, or to get the
+    tree sequence.  This requires a POSIX system.
+
+    If recording an event fails, the error is passed on to the client at
+    the next reply; after that nothing more is recorded, as the tables may
+    be missing events, and every request (from any client) fails with the
+    same error, except that ``close()`` still stops the server.
+
+    Example::
+
+        server = RecorderServer(path, ts=init_ts, node_ids=node_ids)
+        server.start()
+        client = RecorderClient(path)
+        client.add_individuals(...)
+        client.add_records(...)
+        client.simplify(samples)
+        ts = client.tree_sequence()
+        client.close()
+    '''
+
+    def __init__(self, path, **kwargs):
+        """
+        :param str path: The path of the Unix socket to listen on.
+        :param kwargs: Passed on to ``ARGrecorder()`` to create the recorder
+            in the server process.
+        """
+        self.path = path
+        self.recorder_args = kwargs
+        self.pid = None
+        self._error = None
+
+    def start(self):
+        """
+        Start serving in a new, detached process, returning once the socket
+        is ready for a client to connect.
+        """
+        listener = self._listen()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                os.setsid()
+                self._serve(listener)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        self.pid = pid
+        listener.close()
+
+    def join(self, timeout=None):
+        """
+        Wait for the server process to finish, if it was started by this
+        process.
+
+        :param float timeout: The number of seconds to wait for (by default,
+            for as long as it takes).
+        :return bool: Whether the server has finished.
+        """
+        if self.pid is None:
+            return True
+        start = timer.monotonic()
+        while True:
+            pid, _ = os.waitpid(self.pid, 0 if timeout is None
+                                else os.WNOHANG)
+            if pid != 0:
+                self.pid = None
+                return True
+            if timer.monotonic() - start >= timeout:
+                return False
+            timer.sleep(0.01)
+
+    def serve(self):
+        """
+        Serve in this process, until a client calls ``close()``.
+        """
+        self._serve(self._listen())
+
+    def _listen(self):
+        if os.path.exists(self.path):
+            self._remove_stale_socket()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(1)
+        return listener
+
+    def _remove_stale_socket(self):
+        # a socket left behind by a server that was killed can be reused,
+        # but not one that a server is still listening on, or another file
+        if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+            raise ValueError(self.path + " exists, and is not a socket.")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+        raise ValueError("A server is already listening on " + self.path + ".")
+
+    def _serve(self, listener):
+        recorder = ARGrecorder(**self.recorder_args)
+        try:
+            done = False
+            while not done:
+                conn, _ = listener.accept()
+                with conn:
+                    done = self._handle(conn, recorder)
+        finally:
+            listener.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _handle(self, conn, recorder):
+        # serve one client, returning True if it asks us to stop
+        while True:
+            try:
+                op, num_rows = _HEADER.unpack(_recv_exact(conn, _HEADER.size))
+            except (EOFError, ConnectionError):
+                return False
+            if op == OP_ADD_INDIVIDUALS:
+                ids, times, flags, pops = _recv_columns(conn, num_rows,
+                                                        _INDIVIDUAL_COLUMNS)
+                self._apply(recorder.add_individuals, ids, times, flags, pops)
+            elif op == OP_ADD_RECORDS:
+                lefts, rights, parents, children = _recv_columns(
+                        conn, num_rows, _RECORD_COLUMNS)
+                self._apply(recorder.add_records, lefts, rights, parents,
+                            children)
+            elif op == OP_SIMPLIFY:
+                samples, = _recv_columns(conn, num_rows, _SAMPLE_COLUMNS)
+                self._apply(recorder.simplify, samples.tolist())
+                self._reply(conn)
+            elif op == OP_TREE_SEQUENCE:
+                samples = None
+                if num_rows != NO_SAMPLES:
+                    samples, = _recv_columns(conn, num_rows, _SAMPLE_COLUMNS)
+                    samples = samples.tolist()
+                ts = self._apply(recorder.tree_sequence, samples)
+                self._reply(conn, b'' if ts is None else _dump_bytes(ts))
+            elif op == OP_SYNC:
+                self._reply(conn)
+            elif op == OP_CLOSE:
+                self._reply(conn)
+                return True
+            else:
+                # the recorder is fine, but we can't follow this client
+                self._send_error(conn, ValueError("Unknown operation "
+                                                  + str(op) + "."))
+                return False
+
+    def _apply(self, fun, *args):
+        # errors are kept to be passed on at every later reply, and nothing
+        # more is recorded after one, as the tables may be incomplete
+        if self._error is None:
+            try:
+                return fun(*args)
+            except Exception as e:
+                self._error = e
+        return None
+
+    def _reply(self, conn, payload=b''):
+        if self._error is None:
+            conn.sendall(_HEADER.pack(STATUS_OK, len(payload)) + payload)
+        else:
+            self._send_error(conn, self._error)
+
+    def _send_error(self, conn, error):
+        message = "{}: {}".format(type(error).__name__,
+                                  error).encode('utf-8')
+        conn.sendall(_HEADER.pack(STATUS_ERROR, len(message)) + message)
+
+
+class RecorderClient(object):
+    '''
+    Sends births and inheritance events to a :class:`RecorderServer`, with
+    the same methods as an :class:`ARGrecorder`.  Events are packed into a
+    buffer that is sent when it is full, or when the client needs an answer
+    from the server (``simplify``, ``tree_sequence``, ``sync`` or
+    ``close``).  An error in the server while recording is raised by the
+    next of these calls, and by every one after it.
+    '''
+
+    def __init__(self, path, buffer_size=2 ** 20):
+        """
+        :param str path: The path of the server's Unix socket.
+        :param int buffer_size: The number of bytes of events to collect
+            before sending them.
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.disconnect()
+
+    def _send(self, message):
+        self.buffer += message
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Send any buffered events to the server.
+        """
+        if len(self.buffer) > 0:
+            self.sock.sendall(self.buffer)
+            self.buffer = bytearray()
+
+    def _request(self, message):
+        self._send(message)
+        self.flush()
+        status, length = _HEADER.unpack(_recv_exact(self.sock, _HEADER.size))
+        payload = bytes(_recv_exact(self.sock, length))
+        if status != STATUS_OK:
+            name, _, message = payload.decode('utf-8').partition(": ")
+            error = getattr(builtins, name, None)
+            if not (isinstance(error, type) and issubclass(error, Exception)):
+                error = RuntimeError
+            raise error(message)
+        return payload
+
+    def add_individual(self, input_id, time, flags=msprime.NODE_IS_SAMPLE,
+                       population=msprime.NULL_POPULATION):
+        """
+        As ``ARGrecorder.add_individual``.
+        """
+        self.add_individuals([input_id], time, flags, population)
+
+    def add_individuals(self, input_ids, times, flags=msprime.NODE_IS_SAMPLE,
+                        populations=msprime.NULL_POPULATION):
+        """
+        As ``ARGrecorder.add_individuals``.
+        """
+        self._send(_pack(OP_ADD_INDIVIDUALS,
+                         [input_ids, times, flags, populations],
+                         _INDIVIDUAL_COLUMNS))
+
+    def add_record(self, left, right, parent, children):
+        """
+        As ``ARGrecorder.add_record``.
+        """
+        self.add_records([left] * len(children), [right] * len(children),
+                         [parent] * len(children), children)
+
+    def add_records(self, lefts, rights, parents, children):
+        """
+        As ``ARGrecorder.add_records``.
+        """
+        if not (len(lefts) == len(rights) == len(parents) == len(children)):
+            raise ValueError("lefts, rights, parents and children must all "
+                             "have the same length.")
+        self._send(_pack(OP_ADD_RECORDS, [lefts, rights, parents, children],
+                         _RECORD_COLUMNS))
+
+    def simplify(self, samples):
+        """
+        As ``ARGrecorder.simplify``.
+        """
+        self._request(_pack(OP_SIMPLIFY, [samples], _SAMPLE_COLUMNS))
+
+    def tree_sequence(self, samples=None):
+        """
+        As ``ARGrecorder.tree_sequence``.
+        """
+        if samples is None:
+            message = _HEADER.pack(OP_TREE_SEQUENCE, NO_SAMPLES)
+        else:
+            message = _pack(OP_TREE_SEQUENCE, [samples], _SAMPLE_COLUMNS)
+        return _load_bytes(self._request(message))
+
+    def sync(self):
+        """
+        Wait for the server to record all events sent so far, raising any
+        error that occurred.
+        """
+        self._request(_HEADER.pack(OP_SYNC, 0))
+
+    def disconnect(self):
+        """
+        Send any buffered events, and disconnect, leaving the server running
+        for another client.
+        """
+        self.flush()
+        self.sock.close()
+
+    def close(self):
+        """
+        Stop the server, and disconnect, raising any error that occurred.
+        """
+        try:
+            self._request(_HEADER.pack(OP_CLOSE, 0))
+        finally:
+            self.sock.close()
@@ -0,0 +1,243 @@
+import concurrent.futures
+import msprime
+import numpy as np
+
+from .argrecorder import ARGrecorder
+from .id_map import NULL_ID
+
+# Windows are simplified separately, so must not each renumber the
+# populations (or individuals, or sites) in their own way.
+_KEEP_TABLES = {'filter_populations': False, 'filter_individuals': False,
+                'filter_sites': False}
+
+
+def clip_edges(breaks, left, right):
+    """
+    Cut each of the intervals ``[left[k], right[k])`` at the window
+    boundaries in ``breaks``.
+
+    :param array breaks: The boundaries of the windows, in increasing order,
+        from 0 to the sequence length.
+    :param array left: The left ends of the intervals.
+    :param array right: The right ends of the intervals.
+    :return tuple: Arrays ``(window, index, left, right)`` with one entry per
+        piece: the window it is in, the index of the interval it came from,
+        and its ends.
+    """
+    left = np.asarray(left, dtype=np.float64)
+    right = np.asarray(right, dtype=np.float64)
+    first = np.searchsorted(breaks, left, side='right') - 1
+    last = np.searchsorted(breaks, right, side='left') - 1
+    num_pieces = np.maximum(last - first + 1, 0)
+    index = np.repeat(np.arange(len(left)), num_pieces)
+    window = (first[index] + np.arange(len(index))
+              - np.repeat(np.cumsum(num_pieces) - num_pieces, num_pieces))
+    out_left = np.maximum(left[index], breaks[window])
+    out_right = np.minimum(right[index], breaks[window + 1])
+    return window, index, out_left, out_right
+
+
+class ShardedRecorder(object):
+    '''
+    Records the history of the genome in a number of windows, with a
+    separate :class:`ARGrecorder` for each, so that they can be simplified in
+    parallel.  This has the same methods as an ARGrecorder for recording,
+    simplifying, and getting the tree sequence.
+
+    Each individual is recorded in every window, and each edge is cut up at
+    the window boundaries and given to the windows it overlaps.  Windows are
+    simplified at the same time, in a pool of processes (using
+    ``ARGrecorder.simplify(background=True)``).  To put the tree sequence
+    back together, each node keeps the order it was added in (its "origin"),
+    so that nodes that appear in more than one window can be matched up;
+    the populations of the stitched tree sequence are those of the initial
+    ``ts``.
+    '''
+
+    def __init__(self, ts, node_ids, num_windows=None, breaks=None,
+                 time=0.0, processes=None, **kwargs):
+        """
+        :param TreeSequence ts: A tree sequence describing prehistory of the
+            simulation (without sites or mutations).
+        :param dict node_ids: A dict indexed by input IDs so that
+            ``node_ids[k]`` is the node ID of the node corresponding to sample
+            ``k`` in the initial ``ts``.
+        :param int num_windows: The number of windows of equal length to
+            split the genome into.
+        :param list breaks: Alternatively, the boundaries of the windows, from
+            0 to the sequence length.
+        :param float time: The (forwards) time of the "present" at the start
+            of the simulation.
+        :param int processes: The number of processes to simplify with
+            (by default, one per window, up to the number of CPUs).
+        :param kwargs: Passed on to ``ARGrecorder()``.
+        """
+        length = ts.sequence_length
+        if breaks is None:
+            if num_windows is None:
+                raise ValueError("Either num_windows or breaks must be given.")
+            breaks = np.linspace(0, length, num_windows + 1)
+        breaks = np.array(breaks, dtype=np.float64)
+        if (breaks[0] != 0.0 or breaks[-1] != length
+                or np.any(np.diff(breaks) <= 0)):
+            raise ValueError("breaks must increase from 0 to the sequence "
+                             "length.")
+        if ts.num_sites > 0:
+            raise ValueError("ShardedRecorder does not support sites.")
+        self.breaks = breaks
+        self.sequence_length = length
+        if processes is None:
+            processes = len(breaks) - 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes)
+        tables = ts.dump_tables()
+        self.populations = tables.populations.copy()
+        edges = tables.edges
+        window, index, left, right = clip_edges(breaks, edges.left,
+                                                edges.right)
+        parent = edges.parent[index]
+        child = edges.child[index]
+        self.shards = []
+        # origins[j][k] is the order that node k of window j was added in,
+        # for the nodes there at the last simplify; the nodes added since
+        # then are in every window, and have origins from first_new_origin on
+        self.origins = []
+        for j in range(len(breaks) - 1):
+            here = (window == j)
+            edges.set_columns(left=left[here], right=right[here],
+                              parent=parent[here], child=child[here])
+            # the index is of the edges of the whole tree sequence
+            tables.drop_index()
+            shard = ARGrecorder(ts=tables.tree_sequence(), node_ids=node_ids,
+                                time=time, executor=self.executor, **kwargs)
+            shard._simplify_kwargs = _KEEP_TABLES
+            self.shards.append(shard)
+            self.origins.append(np.arange(ts.num_nodes, dtype=np.int64))
+        self.num_origins = ts.num_nodes
+        self.first_new_origin = ts.num_nodes
+
+    @property
+    def num_windows(self):
+        return len(self.shards)
+
+    def _origins(self, j, num_nodes):
+        # the origins of the first num_nodes nodes of window j
+        old = self.origins[j]
+        return np.concatenate([old, np.arange(
+            self.first_new_origin,
+            self.first_new_origin + num_nodes - len(old), dtype=np.int64)])
+
+    def close(self):
+        """
+        Shut down the pool of processes used to simplify.
+        """
+        for shard in self.shards:
+            shard.wait()
+        self.executor.shutdown()
+
+    def add_individual(self, input_id, time, flags=msprime.NODE_IS_SAMPLE,
+                       population=msprime.NULL_POPULATION):
+        """
+        As ``ARGrecorder.add_individual``.
+        """
+        self.add_individuals([input_id], time, flags, population)
+
+    def add_individuals(self, input_ids, times, flags=msprime.NODE_IS_SAMPLE,
+                        populations=msprime.NULL_POPULATION):
+        """
+        As ``ARGrecorder.add_individuals``: each individual is added to every
+        window.
+        """
+        for shard in self.shards:
+            shard.add_individuals(input_ids, times, flags, populations)
+        self.num_origins += len(input_ids)
+
+    def add_record(self, left, right, parent, children):
+        """
+        As ``ARGrecorder.add_record``.
+        """
+        self.add_records([left] * len(children), [right] * len(children),
+                         [parent] * len(children), children)
+
+    def add_records(self, lefts, rights, parents, children):
+        """
+        As ``ARGrecorder.add_records``: each edge is cut at the window
+        boundaries, and recorded in the windows it overlaps.
+        """
+        if not (len(lefts) == len(rights) == len(parents) == len(children)):
+            raise ValueError("lefts, rights, parents and children must all "
+                             "have the same length.")
+        window, index, left, right = clip_edges(self.breaks, lefts, rights)
+        parents = np.asarray(parents)[index]
+        children = np.asarray(children)[index]
+        order = np.argsort(window, kind='stable')
+        bounds = np.searchsorted(window[order],
+                                 np.arange(self.num_windows + 1))
+        for j, shard in enumerate(self.shards):
+            here = order[bounds[j]:bounds[j + 1]]
+            shard.add_records(left[here], right[here], parents[here],
+                              children[here])
+
+    def simplify(self, samples):
+        """
+        As ``ARGrecorder.simplify``: all windows are simplified at once, in
+        the pool of processes.
+        """
+        for shard in self.shards:
+            shard.simplify(samples, background=True)
+        for j, shard in enumerate(self.shards):
+            shard.wait()
+            node_map = shard.node_map
+            kept = np.flatnonzero(node_map != NULL_ID)
+            origins = np.empty(shard.nodes.num_rows, dtype=np.int64)
+            origins[node_map[kept]] = self._origins(j, len(node_map))[kept]
+            self.origins[j] = origins
+        self.first_new_origin = self.num_origins
+
+    def tree_sequence(self, samples):
+        """
+        As ``ARGrecorder.tree_sequence``: the tree sequences of the windows
+        are stitched together into one for the whole genome.
+
+        :param list samples: A list of the input IDs whose history is recorded
+            in the resulting tree sequence; ``sample[k]`` corresponds to Node
+            ID ``k``.
+        :return TreeSequence: The simplified tree sequence.
+        """
+        parts = []
+        for j, shard in enumerate(self.shards):
+            shard.wait()
+            tables, node_map = shard._simplified_tables(
+                    shard.get_nodes(samples))
+            kept = np.flatnonzero(node_map != NULL_ID)
+            origins = np.empty(tables.nodes.num_rows, dtype=np.int64)
+            origins[node_map[kept]] = self._origins(j, len(node_map))[kept]
+            parts.append((tables, origins))
+        # the samples come first, then other nodes in order of origin
+        sample_origins = parts[0][1][:len(samples)]
+        others = np.setdiff1d(np.concatenate([x[1] for x in parts]),
+                              sample_origins)
+        all_origins = np.concatenate([sample_origins, others])
+        lookup = np.argsort(all_origins)
+        sorted_origins = all_origins[lookup]
+        tables = parts[0][0].copy()
+        tables.populations.replace_with(self.populations)
+        nodes = tables.nodes
+        edges = tables.edges
+        flags = np.zeros(len(all_origins), dtype=np.uint32)
+        population = np.zeros(len(all_origins), dtype=np.int32)
+        time = np.zeros(len(all_origins), dtype=np.float64)
+        edges.clear()
+        for part, origins in parts:
+            new_id = lookup[np.searchsorted(sorted_origins, origins)]
+            new_id = new_id.astype(np.int32)
+            flags[new_id] = part.nodes.flags
+            population[new_id] = part.nodes.population
+            time[new_id] = part.nodes.time
+            edges.append_columns(left=part.edges.left, right=part.edges.right,
+                                 parent=new_id[part.edges.parent],
+                                 child=new_id[part.edges.child])
+        nodes.set_columns(flags=flags, population=population, time=time)
+        tables.sort()
+        tables.simplify(samples=np.arange(len(samples), dtype=np.int32))
+        return tables.tree_sequence()
@@ -0,0 +1,154 @@
+import json
+import os
+import numpy as np
+
+# the columns of each table that are stored, where the table has them
+TABLE_COLUMNS = {
+    'nodes': ['flags', 'time', 'population', 'individual',
+              'metadata', 'metadata_offset'],
+    'edges': ['left', 'right', 'parent', 'child',
+              'metadata', 'metadata_offset'],
+    'sites': ['position', 'ancestral_state', 'ancestral_state_offset',
+              'metadata', 'metadata_offset'],
+    'mutations': ['site', 'node', 'derived_state', 'derived_state_offset',
+                  'parent', 'time', 'metadata', 'metadata_offset'],
+    'migrations': ['left', 'right', 'node', 'source', 'dest', 'time',
+                   'metadata', 'metadata_offset'],
+    'populations': ['metadata', 'metadata_offset'],
+    'individuals': ['flags', 'location', 'location_offset', 'parents',
+                    'parents_offset', 'metadata', 'metadata_offset'],
+}
+
+
+def save_tables(tables, path):
+    """
+    Write the columns of each table in a TableCollection to ``.npy`` files in
+    the directory ``path``, with ``save_table``.
+    """
+    for name in TABLE_COLUMNS:
+        if hasattr(tables, name):
+            save_table(getattr(tables, name), name, path)
+
+
+def load_tables(tables, path, mmap=False):
+    """
+    Replace the contents of each table in a TableCollection with the columns
+    written by ``save_tables``.
+    """
+    for name in TABLE_COLUMNS:
+        if hasattr(tables, name):
+            load_table(getattr(tables, name), name, path, mmap=mmap)
+
+
+def column_path(path, name, column):
+    """
+    The file that column ``column`` of table ``name`` is stored in, in the
+    directory ``path``.
+    """
+    return os.path.join(path, name + "_" + column + ".npy")
+
+
+def save_table(table, name, path):
+    """
+    Write each column of ``table`` to a ``.npy`` file in the directory
+    ``path``, named after ``name`` (e.g., ``nodes_time.npy``).
+
+    :param table: An msprime table.
+    :param str name: The name of the table, one of ``TABLE_COLUMNS``.
+    :param str path: The directory to write to.
+    """
+    for column in TABLE_COLUMNS[name]:
+        if hasattr(table, column):
+            np.save(column_path(path, name, column), getattr(table, column))
+
+
+def load_table(table, name, path, mmap=False):
+    """
+    Replace the contents of ``table`` with the columns written by
+    ``save_table``.
+
+    :param table: An msprime table.
+    :param str name: The name of the table, one of ``TABLE_COLUMNS``.
+    :param str path: The directory to read from.
+    :param bool mmap: Whether to memory-map the files, rather than reading
+        them in first.
+    """
+    columns = {}
+    for column in TABLE_COLUMNS[name]:
+        file = column_path(path, name, column)
+        if hasattr(table, column) and os.path.exists(file):
+            columns[column] = np.load(file, mmap_mode='r' if mmap else None)
+    table.set_columns(**columns)
+
+
+def save_state(state, path, name):
+    """
+    Write a dict of (JSON-able) values to ``name`` in the directory ``path``.
+    """
+    with open(os.path.join(path, name), 'w') as f:
+        json.dump(state, f, indent=1)
+
+
+def load_state(path, name):
+    """
+    Read a dict written by ``save_state``.
+    """
+    with open(os.path.join(path, name), 'r') as f:
+        return json.load(f)
+
+
+def append_record(path, arrays, offset=None):
+    """
+    Append a record, consisting of a list of numpy arrays, to the file
+    ``path``, making sure it reaches the disk before returning.  The file is
+    only ever appended to, so a record that is interrupted while being
+    written leaves all earlier ones intact.
+
+    :param str path: The file.
+    :param list arrays: The numpy arrays.
+    :param int offset: If given, the file is first cut to this length (as
+        given by ``scan_records``), to remove an incomplete record.
+    """
+    with open(path, 'ab') as f:
+        if offset is not None:
+            f.truncate(offset)
+        np.save(f, np.array([len(arrays)], dtype=np.int64))
+        for x in arrays:
+            np.save(f, x)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def scan_records(path):
+    """
+    Read the records written to ``path`` by ``append_record``, ignoring any
+    incomplete record at the end of the file (from being interrupted while
+    writing).  The file is not changed.
+
+    :return tuple: A list of records, each a list of numpy arrays, and the
+        length of the file up to the end of the last complete record.
+    """
+    out = []
+    end = 0
+    if not os.path.exists(path):
+        return out, end
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                num_arrays = int(np.load(f)[0])
+                record = [np.load(f) for _ in range(num_arrays)]
+            except (EOFError, ValueError, OSError, IndexError):
+                break
+            out.append(record)
+            end = f.tell()
+    return out, end
+
+
+def read_records(path):
+    """
+    Read the complete records written to ``path`` by ``append_record``, as
+    ``scan_records`` does.
+
+    :return list: A list of records, each a list of numpy arrays.
+    """
+    return scan_records(path)[0]
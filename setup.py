@@ -28,12 +28,12 @@ setup(name='ftprime',
       url='https://github.com/ashander/ftprime',
       license='GPL3',
       packages=find_packages(exclude=['writeups', 'ez_setup', 'examples',
-                                      'tests']),
+                                      'tests', 'benchmarks']),
       include_package_data=True,
       zip_safe=False,
       install_requires=[
           'msprime',
-          'numpy',
+          'numpy>=1.17',
       ],
       extras_require={
           'dev': [
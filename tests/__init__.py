@@ -1,3 +1,6 @@
+import ftprime
+import msprime
+import random
 import unittest
 
 class FtprimeTestCase(unittest.TestCase):
@@ -38,3 +41,66 @@ class FtprimeTestCase(unittest.TestCase):
         self.assertEqual(len(x), len(y))
         for k in range(len(x)):
             self.assertEqual(x[k], y[k])
+
+    def new_recorder(self, N, **kwargs):
+        """
+        Seed ``random``, and return an ARGrecorder of a population of ``N``
+        individuals with input IDs ``0, ..., N-1``, whose history is a
+        coalescent tree; ``kwargs`` are passed on to ARGrecorder.
+        """
+        random.seed(self.random_seed)
+        init_ts = msprime.simulate(N, random_seed=self.random_seed)
+        return ftprime.ARGrecorder(ts=init_ts,
+                                   node_ids={k: k for k in range(N)},
+                                   **kwargs)
+
+    def record_generation(self, records, pop, next_id, t, survival=0.0,
+                          one_at_a_time=False):
+        """
+        Record one generation, at time ``t``, of a haploid Wright-Fisher
+        population: each member of ``pop`` survives with probability
+        ``survival``, and otherwise is replaced by a child with input ID
+        from ``next_id`` on, which inherits ``[0, bp)`` from one random
+        member of ``pop`` and ``[bp, 1)`` from another.  Children are
+        recorded with ``add_individuals`` and ``add_records``, or if
+        ``one_at_a_time``, with ``add_individual`` and ``add_record``.
+
+        :return tuple: The new population and the next unused input ID.
+        """
+        if survival > 0:
+            dead = [j for j in range(len(pop)) if random.random() > survival]
+        else:
+            dead = list(range(len(pop)))
+        children = list(range(next_id, next_id + len(dead)))
+        bps = [random.random() for _ in children]
+        lparents = [random.choice(pop) for _ in children]
+        rparents = [random.choice(pop) for _ in children]
+        if one_at_a_time:
+            for child, bp, lp, rp in zip(children, bps, lparents, rparents):
+                records.add_individual(child, t)
+                records.add_record(0.0, bp, lp, (child,))
+                records.add_record(bp, 1.0, rp, (child,))
+        elif len(children) > 0:
+            records.add_individuals(children, t)
+            records.add_records(lefts=[0.0] * len(children) + bps,
+                                rights=bps + [1.0] * len(children),
+                                parents=lparents + rparents,
+                                children=children + children)
+        pop = list(pop)
+        for j, child in zip(dead, children):
+            pop[j] = child
+        return pop, next_id + len(children)
+
+    def run_generations(self, records, pop, next_id, times, simplify_every=4):
+        """
+        Record a generation (with ``record_generation``) at each of
+        ``times``, simplifying whenever the time is a multiple of
+        ``simplify_every``.
+
+        :return tuple: The final population and the next unused input ID.
+        """
+        for t in times:
+            pop, next_id = self.record_generation(records, pop, next_id, t)
+            if t % simplify_every == 0:
+                records.simplify(pop)
+        return pop, next_id
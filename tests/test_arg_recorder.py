@@ -1,6 +1,12 @@
+import concurrent.futures
 import ftprime
+import numpy as np
+import random
 import msprime
+import os
+import shutil
 import six
+import tempfile
 import unittest
 
 from tests import FtprimeTestCase
@@ -32,6 +38,32 @@ class BasicTestCase(FtprimeTestCase):
             self.assertEqual(records.node_ids[input_id], node_id)
             self.assertEqual(records.edges.num_rows, self.init_ts.num_edges)
 
+    def test_ids(self):
+        for dense_ids in (False, True):
+            records = ftprime.ARGrecorder(ts=self.init_ts,
+                                          node_ids=self.init_map,
+                                          dense_ids=dense_ids)
+            records.add_individuals([5, 6], 1.0, flags=[0, 1])
+            records.check_ids(np.array([0, 6, 1]))
+            self.assertRaises(ValueError, records.check_ids, [0, 7])
+            nodes = records.get_nodes(np.array([6, 0, 5]))
+            self.assertIsInstance(nodes, np.ndarray)
+            self.assertArrayEqual(nodes, [4, 1, 3])
+            self.assertRaises(ValueError, records.get_nodes, [3])
+            samples = records.sample_ids()
+            self.assertIsInstance(samples, np.ndarray)
+            self.assertEqual(sorted(samples), [0, 1, 6])
+            # non-integer IDs are not silently truncated
+            self.assertArrayEqual(records.get_nodes([]), [])
+            for bad in ([1.7], [0, 'a'], [None]):
+                self.assertRaises(ValueError, records.get_nodes, bad)
+                self.assertRaises(ValueError, records.check_ids, bad)
+                self.assertRaises(ValueError, records.add_individuals, bad, 2.0)
+            self.assertRaises(ValueError, records.add_individual, 7.0, 2.0)
+            self.assertRaises(ValueError, records.simplify, [0.5, 1])
+        self.assertRaises(ValueError, ftprime.ARGrecorder, ts=self.init_ts,
+                          node_ids={0.5: 0, 1: 1, 2: 2})
+
     def test_add_individual(self):
         records = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.init_map)
         records.add_individual(5, 2.0, population=2)
@@ -59,6 +91,42 @@ class BasicTestCase(FtprimeTestCase):
         # try adding record with parent who doesn't exist
         self.assertRaises(ValueError, records.add_record, 0.0, 0.5, 8, (0,1))
 
+    def test_add_individuals(self):
+        records_a = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.init_map)
+        records_b = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.init_map)
+        for k, t in [(4, 2.0), (5, 2.0), (7, 3.0)]:
+            records_a.add_individual(k, t, population=2)
+        records_b.add_individuals([4, 5, 7], [2.0, 2.0, 3.0], populations=2)
+        self.assertEqual(records_a.node_ids, records_b.node_ids)
+        self.assertEqual(records_a.max_time, records_b.max_time)
+        self.assertArrayEqual(records_a.nodes.time, records_b.nodes.time)
+        self.assertArrayEqual(records_a.nodes.flags, records_b.nodes.flags)
+        self.assertArrayEqual(records_a.nodes.population,
+                              records_b.nodes.population)
+        self.assertRaises(ValueError, records_b.add_individuals, [8, 1], 1.5)
+        self.assertRaises(ValueError, records_b.add_individuals, [8, 8], 1.5)
+        self.assertEqual(records_b.nodes.num_rows, self.init_ts.num_nodes+3)
+
+    def test_add_records(self):
+        records_a = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.init_map)
+        records_b = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.init_map)
+        for r in (records_a, records_b):
+            r.add_individuals([4, 5], 2.0, populations=2)
+        records_a.add_record(0.0, 0.5, 0, (4, 5))
+        records_a.add_record(0.5, 1.0, 1, (4,))
+        records_b.add_records(lefts=[0.0, 0.0, 0.5], rights=[0.5, 0.5, 1.0],
+                              parents=[0, 0, 1], children=[4, 5, 4])
+        for col in ('left', 'right', 'parent', 'child'):
+            self.assertArrayEqual(getattr(records_a.edges, col),
+                                  getattr(records_b.edges, col))
+        self.assertRaises(ValueError, records_b.add_records,
+                          [0.0], [0.5], [8], [4])
+        self.assertRaises(ValueError, records_b.add_records,
+                          [0.0], [0.5], [0], [8])
+        self.assertRaises(ValueError, records_b.add_records,
+                          [0.0, 0.5], [0.5], [0], [4])
+        self.assertEqual(records_b.edges.num_rows, 5)
+
     def test_update_times(self):
         records_a = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.init_map)
         # check doing update_times along the way doesn't change things
@@ -336,3 +404,462 @@ class ExplicitTestCase(FtprimeTestCase):
         print(arg)
         tss = arg.tree_sequence(self.sample_input_ids)
         self.check_trees(tss, self.true_tss)
+
+
+class SortTestCase(FtprimeTestCase):
+    """
+    Test that sorting only the newly added edges gives the same answer as
+    sorting everything.
+    """
+
+    def check_sort(self, records):
+        records.flush_edges()
+        tables = records.table_collection.copy()
+        tables.sort()
+        records.sort_tables()
+        self.assertEqual(records.num_sorted_edges, records.edges.num_rows)
+        for col in ('left', 'right', 'parent', 'child'):
+            self.assertArrayEqual(getattr(tables.edges, col),
+                                  getattr(records.edges, col))
+
+    def run_sim(self, survival, reverse):
+        N = 8
+        records = self.new_recorder(N)
+        pop = list(range(N))
+        next_id = N
+        for t in range(1, 16):
+            dead = [j for j in range(N) if random.random() > survival]
+            births = []
+            pop_next = []
+            for j in dead:
+                child = next_id
+                next_id += 1
+                bp = random.random()
+                records.add_individual(child, t)
+                births.append((0.0, bp, random.choice(pop), child))
+                births.append((bp, 1.0, random.choice(pop), child))
+                pop_next.append((j, child))
+            if reverse:
+                births.reverse()
+            for left, right, parent, child in births:
+                records.add_record(left, right, parent, (child,))
+            for j, child in pop_next:
+                pop[j] = child
+            records.update_times()
+            if t % 5 == 0:
+                self.check_sort(records)
+            if t % 3 == 0:
+                records.simplify(pop)
+        return records
+
+    def test_sorted_prefix(self):
+        records = self.run_sim(survival=0.0, reverse=False)
+        self.assertEqual(records.num_sorted_edges, records.edges.num_rows)
+
+    def test_unsorted_tail(self):
+        self.run_sim(survival=0.0, reverse=True)
+
+    def test_overlapping_generations(self):
+        # survivors may be older than parents in the sorted edges,
+        # so new edges must be merged in
+        self.run_sim(survival=0.7, reverse=True)
+
+    def test_renumbered_samples(self):
+        # simplify renumbers the samples, so its output may not be in
+        # order of parent ID
+        N = 8
+        records = self.new_recorder(N)
+        pop = list(range(N))
+        next_id = N
+        for t in range(1, 16):
+            pop, next_id = self.record_generation(records, pop, next_id, t,
+                                                  survival=0.6,
+                                                  one_at_a_time=True)
+            if t % 3 == 0:
+                records.mark_samples(pop[:2])
+            if t % 5 == 0 or t % 7 == 0:
+                records.update_times()
+                self.check_sort(records)
+            if t % 5 == 0:
+                records.simplify(pop)
+
+    def test_sort_every_generation(self):
+        # sort_tables must not count edges to new nodes, which still have
+        # forwards times, as sorted
+        N = 8
+        records = self.new_recorder(N)
+        pop = list(range(N))
+        next_id = N
+        for t in range(1, 10):
+            pop, next_id = self.record_generation(records, pop, next_id, t)
+            records.sort_tables()
+            if t % 4 == 0:
+                records.simplify(pop)
+        self.check_sort(records)
+        records.simplify(pop)
+
+
+class RelativeTimesTestCase(FtprimeTestCase):
+    """
+    Test that storing node times relative to the start gives the same
+    answers.
+    """
+
+    def run_sim(self, relative_times):
+        N = 6
+        records = self.new_recorder(N, time=2.0, relative_times=relative_times)
+        pop, _ = self.run_generations(records, list(range(N)), N, range(3, 20))
+        return records, pop
+
+    def test_relative_times(self):
+        records_a, pop = self.run_sim(relative_times=False)
+        records_b, _ = self.run_sim(relative_times=True)
+        self.assertArrayEqual(records_a.node_times(), records_b.node_times())
+        self.assertArrayEqual(records_b.nodes.time[records_b.get_nodes(pop)],
+                              [2.0 - 19.0] * len(pop))
+        tsa = records_a.tree_sequence(pop)
+        tsb = records_b.tree_sequence(pop)
+        self.check_trees(tsa, tsb)
+        self.assertArrayEqual(tsa.dump_tables().nodes.time,
+                              tsb.dump_tables().nodes.time)
+
+    def test_update_times_tail(self):
+        # update_times with no time passed only touches the new rows
+        records, pop = self.run_sim(relative_times=False)
+        records.add_individual(-1, records.max_time)
+        records.update_times()
+        self.assertEqual(records.nodes.time[records.node_ids[-1]], 0.0)
+        self.assertArrayEqual(records.nodes.time[records.get_nodes(pop)],
+                              [0.0] * len(pop))
+
+
+class BackgroundSimplifyTestCase(FtprimeTestCase):
+    """
+    Test that simplifying in the background gives the same answers as
+    simplifying in the foreground.
+    """
+
+    def run_sim(self, background, dense_ids=False):
+        N = 6
+        records = self.new_recorder(N, dense_ids=dense_ids,
+                                    background_simplify=background)
+        pop, _ = self.run_generations(records, list(range(N)), N, range(1, 15))
+        return records, pop
+
+    def check_background(self, dense_ids):
+        records_a, pop = self.run_sim(background=False, dense_ids=dense_ids)
+        records_b, _ = self.run_sim(background=True, dense_ids=dense_ids)
+        records_b.wait()
+        self.assertEqual(records_a.num_simplifies, records_b.num_simplifies)
+        self.assertDictEqual(dict(records_a.node_ids.items()),
+                             dict(records_b.node_ids.items()))
+        self.assertArrayEqual(records_a.node_times(), records_b.node_times())
+        self.check_trees(records_a.tree_sequence(pop),
+                         records_b.tree_sequence(pop))
+
+    def test_background_simplify(self):
+        self.check_background(dense_ids=False)
+
+    def test_background_dense_ids(self):
+        self.check_background(dense_ids=True)
+
+    def test_pending(self):
+        records, pop = self.run_sim(background=True)
+        records.simplify(pop)
+        # only the samples are left to be parents while simplifying
+        self.assertEqual(records.num_unsimplified_edges, 0)
+        self.assertEqual(sorted(records.node_ids.keys()), sorted(pop))
+        records.wait()
+        self.assertArrayEqual(records.get_nodes(pop), list(range(len(pop))))
+        self.assertEqual(records.last_update_node, records.nodes.num_rows)
+
+
+class MarkSamplesTestCase(FtprimeTestCase):
+    """
+    Test that mark_samples keeps track of which nodes are flagged.
+    """
+
+    def check_flags(self, records, samples):
+        records.mark_samples(samples)
+        is_sample = (records.nodes.flags & msprime.NODE_IS_SAMPLE) != 0
+        self.assertArrayEqual(np.flatnonzero(is_sample),
+                              np.sort(records.get_nodes(samples)))
+
+    def run_sim(self, background):
+        N = 6
+        records = self.new_recorder(N, background_simplify=background)
+        self.check_flags(records, [0, 2])
+        pop = list(range(N))
+        next_id = N
+        for t in range(1, 10):
+            children = list(range(next_id, next_id + N))
+            next_id += N
+            tracked = records._sample_nodes
+            records.add_individuals(children[:-1], t)
+            records.add_individual(children[-1], t, flags=0)
+            # new nodes are not tracked one by one
+            self.assertIs(records._sample_nodes, tracked)
+            records.add_records(lefts=[0.0] * N, rights=[1.0] * N,
+                                parents=[random.choice(pop)
+                                         for _ in range(N)],
+                                children=children)
+            if t % 3 == 0:
+                records.simplify(children)
+            if t % 2 == 0:
+                self.check_flags(records, children[:3] + children[4:5])
+            pop = children
+        self.check_flags(records, pop)
+        self.check_flags(records, pop)
+
+    def test_mark_samples(self):
+        for background in (False, True):
+            self.run_sim(background)
+
+    def test_mark_rows(self):
+        # update the flags one row at a time
+        cost = ftprime.argrecorder._ROW_UPDATE_COST
+        ftprime.argrecorder._ROW_UPDATE_COST = 0
+        try:
+            self.run_sim(background=False)
+        finally:
+            ftprime.argrecorder._ROW_UPDATE_COST = cost
+
+
+class SnapshotTestCase(FtprimeTestCase):
+    """
+    Test that tree_sequence leaves the tables alone, and keeps its results.
+    """
+
+    def test_snapshots(self):
+        N = 6
+        init_ts = msprime.simulate(N, random_seed=self.random_seed)
+        records = ftprime.ARGrecorder(ts=init_ts,
+                                      node_ids={k: k for k in range(N)},
+                                      snapshot_cache_size=2)
+        records.add_individuals(range(N, 2 * N), 1.0)
+        records.add_records([0.0] * N, [1.0] * N, list(range(N))[::-1],
+                            range(N, 2 * N))
+        flags = records.nodes.flags
+        times = records.nodes.time
+        num_edges = records.table_collection.edges.num_rows
+        ts = records.tree_sequence(range(N, 2 * N))
+        self.assertArrayEqual(records.nodes.flags, flags)
+        self.assertArrayEqual(records.nodes.time, times)
+        self.assertEqual(records.table_collection.edges.num_rows, num_edges)
+        self.assertEqual(records.edge_buffer.num_rows, N)
+        self.assertIs(records.tree_sequence(range(N, 2 * N)), ts)
+        ts2 = records.tree_sequence([N, N + 1])
+        self.assertEqual(ts2.num_samples, 2)
+        self.assertIs(records.tree_sequence(range(N, 2 * N)), ts)
+        # only the two most recently used are kept
+        records.tree_sequence([N])
+        self.assertIsNot(records.tree_sequence([N, N + 1]), ts2)
+        # anything new is recorded in later tree sequences
+        records.add_individual(2 * N, 2.0)
+        records.add_record(0.0, 1.0, N, (2 * N,))
+        ts3 = records.tree_sequence(range(N + 1, 2 * N + 1))
+        self.assertIsNot(ts3, ts)
+        self.assertEqual(ts3.num_samples, N)
+        self.check_trees(ts3, records.tree_sequence(range(N + 1, 2 * N + 1)))
+        records.simplify(range(N + 1, 2 * N + 1))
+        self.check_trees(ts3, records.tree_sequence(range(N + 1, 2 * N + 1)))
+
+
+class SaveLoadTestCase(FtprimeTestCase):
+    """
+    Test that a recorder restored with load() carries on just as the one
+    that was saved.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check_save_load(self, **kwargs):
+        N = 6
+        records = self.new_recorder(N, time=1.0, **kwargs)
+        pop, next_id = self.run_generations(records, list(range(N)), N,
+                                            range(2, 11))
+        records.save(self.tempdir)
+        for mmap in (False, True):
+            loaded = ftprime.ARGrecorder.load(self.tempdir, mmap=mmap)
+            self.assertEqual(loaded.max_time, records.max_time)
+            self.assertEqual(loaded.last_update_node, records.last_update_node)
+            self.assertEqual(loaded.num_simplifies, records.num_simplifies)
+            self.assertDictEqual(dict(loaded.node_ids.items()),
+                                 dict(records.node_ids.items()))
+            state = random.getstate()
+            pop_a, _ = self.run_generations(records, pop, next_id,
+                                            range(11, 15))
+            random.setstate(state)
+            pop_b, _ = self.run_generations(loaded, pop, next_id,
+                                            range(11, 15))
+            self.assertArrayEqual(records.node_times(), loaded.node_times())
+            self.check_trees(records.tree_sequence(pop_a),
+                             loaded.tree_sequence(pop_b))
+            records = ftprime.ARGrecorder.load(self.tempdir)
+
+    def test_save_load(self):
+        self.check_save_load()
+
+    def test_save_load_dense(self):
+        self.check_save_load(dense_ids=True, relative_times=True)
+
+    def test_options(self):
+        # a restored recorder carries on spilling edges, and so on
+        spill_dir = os.path.join(self.tempdir, "spill")
+        os.mkdir(spill_dir)
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        try:
+            N = 6
+            records = self.new_recorder(N, expected_edges_per_generation=4,
+                                        max_edge_bytes=0, spill_dir=spill_dir,
+                                        snapshot_cache_size=2,
+                                        executor=executor)
+            pop, next_id = self.run_generations(records, list(range(N)), N,
+                                                range(1, 6))
+            records.save(os.path.join(self.tempdir, "saved"))
+            records.checkpoint(os.path.join(self.tempdir, "checkpoints"))
+            for loaded in (
+                    ftprime.ARGrecorder.load(
+                        os.path.join(self.tempdir, "saved"), executor=executor),
+                    ftprime.ARGrecorder.restore(
+                        os.path.join(self.tempdir, "checkpoints"),
+                        executor=executor)):
+                self.assertEqual(loaded.edge_buffer.chunk_size, 4)
+                self.assertEqual(loaded.edge_buffer.max_bytes, 0)
+                self.assertEqual(loaded.edge_buffer.spill_dir, spill_dir)
+                self.assertEqual(loaded.snapshot_cache_size, 2)
+                self.assertIs(loaded.executor, executor)
+                loaded.add_individuals(range(100, 100 + 3 * N), 6)
+                loaded.add_records([0.0] * 3 * N, [1.0] * 3 * N,
+                                   pop * 3, range(100, 100 + 3 * N))
+                self.assertGreater(loaded.edge_buffer.num_spilled, 0)
+                loaded.simplify(range(100, 100 + 3 * N), background=True)
+                loaded.wait()
+                self.assertEqual(loaded.num_simplifies,
+                                 records.num_simplifies + 1)
+        finally:
+            executor.shutdown()
+
+
+class CheckpointTestCase(FtprimeTestCase):
+    """
+    Test that a recorder restored from incremental checkpoints is the same as
+    the one that wrote them.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check_same(self, records, restored):
+        self.assertEqual(restored.max_time, records.max_time)
+        self.assertEqual(restored.last_update_node, records.last_update_node)
+        self.assertEqual(restored.num_sorted_edges, records.num_sorted_edges)
+        self.assertDictEqual(dict(restored.node_ids.items()),
+                             dict(records.node_ids.items()))
+        for col in ('flags', 'time', 'population'):
+            self.assertArrayEqual(getattr(records.nodes, col),
+                                  getattr(restored.nodes, col))
+        for col in ('left', 'right', 'parent', 'child'):
+            self.assertArrayEqual(getattr(records.edges, col),
+                                  getattr(restored.edges, col))
+
+    def run_sim(self, survival, **kwargs):
+        N = 8
+        records = self.new_recorder(N, **kwargs)
+        pop = list(range(N))
+        next_id = N
+        num_deltas = 0
+        for t in range(1, 16):
+            pop, next_id = self.record_generation(records, pop, next_id, t,
+                                                  survival=survival,
+                                                  one_at_a_time=True)
+            if t % 3 == 0:
+                records.mark_samples(pop[:2])
+            if t % 7 == 0:
+                records.tree_sequence(pop)
+            if t % 5 == 0:
+                records.simplify(pop)
+            records.checkpoint(self.tempdir)
+            num_deltas = len(ftprime.storage.read_records(
+                                os.path.join(self.tempdir, "base", "deltas")))
+            restored = ftprime.ARGrecorder.restore(self.tempdir)
+            self.check_same(records, restored)
+            if t == 8:
+                # carry on from the restored copy
+                records = restored
+        return num_deltas
+
+    def test_checkpoint(self):
+        num_deltas = self.run_sim(survival=0.0, relative_times=True)
+        # the last simplify was at generation 15
+        self.assertEqual(num_deltas, 0)
+
+    def test_overlapping_generations(self):
+        self.run_sim(survival=0.6, relative_times=True, dense_ids=True)
+
+    def test_absolute_times(self):
+        self.run_sim(survival=0.5)
+
+    def test_deltas(self):
+        self.run_sim(survival=0.0, relative_times=True)
+        records = ftprime.ARGrecorder.restore(self.tempdir)
+        for t in range(16, 19):
+            records.add_individual(1000 + t, t)
+            records.add_record(0.0, 1.0, records.sample_ids()[0], (1000 + t,))
+            records.checkpoint(self.tempdir)
+        deltas = os.path.join(self.tempdir, "base", "deltas")
+        self.assertEqual(len(ftprime.storage.read_records(deltas)), 3)
+        # an interrupted write leaves the earlier deltas readable
+        with open(deltas, 'ab') as f:
+            f.write(b'\x93NUMPY')
+        with open(deltas, 'rb') as f:
+            contents = f.read()
+        restored = ftprime.ARGrecorder.restore(self.tempdir)
+        self.check_same(records, restored)
+        # restoring leaves the checkpoint alone, so can be done again
+        with open(deltas, 'rb') as f:
+            self.assertEqual(f.read(), contents)
+        self.check_same(records, ftprime.ARGrecorder.restore(self.tempdir))
+        # and the next checkpoint replaces the incomplete delta
+        restored.add_individual(1019, 19)
+        restored.add_record(0.0, 1.0, 1018, (1019,))
+        restored.checkpoint(self.tempdir)
+        self.assertEqual(len(ftprime.storage.read_records(deltas)), 4)
+        self.check_same(restored, ftprime.ARGrecorder.restore(self.tempdir))
+
+    def test_interrupted_base(self):
+        self.run_sim(survival=0.0)
+        records = ftprime.ARGrecorder.restore(self.tempdir)
+        base = os.path.join(self.tempdir, "base")
+        new_base = os.path.join(self.tempdir, "base.new")
+        old_base = os.path.join(self.tempdir, "base.old")
+
+        def partial(x):
+            os.mkdir(x)
+            with open(os.path.join(x, "junk"), 'wb') as f:
+                f.write(b'\x93NUMPY')
+
+        # while writing the new base
+        partial(new_base)
+        self.check_same(records, ftprime.ARGrecorder.restore(self.tempdir))
+        self.assertFalse(os.path.exists(new_base))
+        # after moving the old base aside
+        os.rename(base, new_base)
+        partial(old_base)
+        self.check_same(records, ftprime.ARGrecorder.restore(self.tempdir))
+        # while deleting the old base
+        partial(old_base)
+        self.check_same(records, ftprime.ARGrecorder.restore(self.tempdir))
+        self.assertFalse(os.path.exists(old_base))
+        self.assertFalse(os.path.exists(new_base))
+        # before the first base was moved into place
+        os.rename(base, new_base)
+        self.assertRaises(ValueError, ftprime.ARGrecorder.restore,
+                          self.tempdir)
@@ -3,13 +3,15 @@ import msprime
 import six
 import random
 import math
+import shutil
+import tempfile
 
 from tests import FtprimeTestCase
 
 
 class RecombCollectorTest(FtprimeTestCase):
 
-    def simple_ex(self):
+    def simple_ex(self, mode='text', seed=None, **kwargs):
         # this will begin with a single diploid indiv
         nodes = six.StringIO("""\
         id      is_sample   population      time
@@ -28,8 +30,9 @@ class RecombCollectorTest(FtprimeTestCase):
         locus_position = [0.0, 1.0, 2.0, 3.0]
         rc = ftprime.RecombCollector(ts=init_ts, node_ids=node_ids, 
                                      locus_position=locus_position,
-                                     benchmark=True)
-        assert rc.mode == 'text'
+                                     benchmark=True, mode=mode, seed=seed,
+                                     **kwargs)
+        assert rc.mode == mode
         rc2 = ftprime.RecombCollector(ts=init_ts, node_ids=node_ids, 
                                      locus_position=locus_position,
                                      benchmark=True, mode='binary')
@@ -79,9 +82,9 @@ class RecombCollectorTest(FtprimeTestCase):
         --1-- --2-- --0-- --3--  --0-- --3-- --1-- --2--  --0-- --3-- --1-- --2--  --0-- --3-- --1-- --2--
                                0.5                     1.5
         """
-        rc, node_ids = self.simple_ex()
-        self.assertListEqual(rc.locus_position, 
-                             [0.0, 1.0, 2.0, 3.0])
+        rc, node_ids = self.simple_ex(seed=self.random_seed)
+        self.assertArrayEqual(rc.locus_position,
+                              [0.0, 1.0, 2.0, 3.0])
         # Input is pairs of
         #     offspringID parentID startingPloidy rec1 rec2 ....
         # in pairs of offpsring chromosomes
@@ -211,6 +214,128 @@ class RecombCollectorTest(FtprimeTestCase):
         self.assertArrayEqual(true_lefts, obs_lefts)
         self.assertArrayEqual(true_rights, obs_rights)
 
+    def test_binary(self):
+        rc = self.bigger_ex()
+        # with the same seed, whatever else uses random
+        random.random()
+        rc2, _ = self.simple_ex(mode='binary', seed=self.random_seed)
+        for lines in [b"1 0 1\n1 0 0\n2 0 1 0\n2 0 0 1\n3 0 0 0\n3 0 1 1\n",
+                      b"4 2 0 0 1\n4 1 1 0\n5 1 1 0\n5 2 0 0 1 2\n"]:
+            rc2.increment_time()
+            rc2.collect_recombs(lines)
+        for col in ('left', 'right', 'parent', 'child'):
+            self.assertArrayEqual(getattr(rc.args.edges, col),
+                                  getattr(rc2.args.edges, col))
+
+    def test_buffer_generation(self):
+        rc = self.bigger_ex()
+        rc2, _ = self.simple_ex(seed=self.random_seed)
+        rc2.buffer_generation = True
+        # nothing is recorded until the end of each generation
+        for num_edges, lines in [
+                (2, ["1 0 1\n", "1 0 0\n2 0 1 0", "2 0 0 1\n3 0 0 0\n3 0 1 1"]),
+                (12, ["4 2 0 0 1\n4 1 1 0\n", "5 1 1 0\n5 2 0 0 1 2\n"])]:
+            rc2.increment_time()
+            for chunk in lines:
+                rc2.collect_recombs(chunk)
+                self.assertEqual(rc2.args.num_edges, num_edges)
+        self.assertEqual(len(rc2.buffer), 2)
+        rc2.flush()
+        self.assertEqual(len(rc2.buffer), 0)
+        for col in ('left', 'right', 'parent', 'child'):
+            self.assertArrayEqual(getattr(rc.args.edges, col),
+                                  getattr(rc2.args.edges, col))
+        self.assertArrayEqual(rc.args.node_times(), rc2.args.node_times())
+
+    def test_asynchronous(self):
+        rc = self.bigger_ex()
+        for buffer_generation in (False, True):
+            rc2, _ = self.simple_ex(seed=self.random_seed,
+                                    buffer_generation=buffer_generation,
+                                    asynchronous=True, queue_size=1)
+            for lines in [["1 0 1\n", "1 0 0\n2 0 1 0", "2 0 0 1\n3 0 0 0\n3 0 1 1"],
+                          ["4 2 0 0 1\n4 1 1 0\n", "5 1 1 0\n5 2 0 0 1 2\n"]]:
+                rc2.increment_time()
+                for chunk in lines:
+                    rc2.collect_recombs(chunk)
+            rc2.flush()
+            self.assertTrue(rc2.queue.empty())
+            self.assertArrayEqual(rc.args.edges.left, rc2.args.edges.left)
+            self.assertArrayEqual(rc.args.edges.child, rc2.args.edges.child)
+            self.assertArrayEqual(rc.args.node_times(), rc2.args.node_times())
+            rc2.close()
+            self.assertIsNone(rc2.queue)
+
+    def test_asynchronous_error(self):
+        rc2, _ = self.simple_ex(asynchronous=True)
+        rc2.increment_time()
+        # parent 7 does not exist
+        rc2.collect_recombs("1 7 0\n")
+        self.assertRaises(ValueError, rc2.flush)
+        self.assertRaises(ValueError, rc2.collect_recombs, "1 0 0\n")
+
+    def test_save_load(self):
+        tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+        try:
+            rc, _ = self.simple_ex(seed=self.random_seed)
+            rc.increment_time()
+            rc.collect_recombs("1 0 1\n1 0 0\n2 0 1 0\n2 0 0 1\n")
+            rc.save(tempdir)
+            rc2 = ftprime.RecombCollector.load(tempdir)
+            self.assertEqual(rc2.time, rc.time)
+            self.assertEqual(rc2.last_child, 2)
+            self.assertEqual(rc2.mode, 'text')
+            self.assertArrayEqual(rc2.locus_position, rc.locus_position)
+            for x in (rc, rc2):
+                x.collect_recombs("3 0 0 0\n3 0 1 1\n")
+                x.increment_time()
+                x.collect_recombs("4 2 0 0 1\n4 1 1 0\n5 1 1 0\n5 2 0 0 1 2\n")
+            for col in ('left', 'right', 'parent', 'child'):
+                self.assertArrayEqual(getattr(rc.args.edges, col),
+                                      getattr(rc2.args.edges, col))
+            self.assertArrayEqual(rc.args.node_times(), rc2.args.node_times())
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_multiple_chromosomes(self):
+        nodes = six.StringIO("""\
+        id      is_sample   population      time
+        0       0           -1              1.00000000000000
+        1       1           -1              0.00000000000000
+        2       1           -1              0.00000000000000
+        """)
+        edges = six.StringIO("""\
+        id      left            right           parent  child
+        0       0.00000000      5.00000000      0       1
+        1       0.00000000      5.00000000      0       2
+        """)
+        init_ts = msprime.load_text(nodes=nodes, edges=edges, strict=False)
+        rc = ftprime.RecombCollector(ts=init_ts, node_ids={(0,0):1, (0,1):2},
+                                     locus_position=[[0.0, 1.0, 2.0, 3.0],
+                                                     [0.0, 1.0, 2.0]],
+                                     seed=self.random_seed)
+        self.assertEqual(rc.num_chromosomes, 2)
+        self.assertArrayEqual(rc.chromosome_breaks, [0.0, 3.0, 5.0])
+        self.assertArrayEqual(rc.locus_position,
+                              [0.0, 1.0, 2.0, 3.0, 3.0, 4.0, 5.0])
+        rc.increment_time()
+        # the maternal chromosome switches parent between chromosomes
+        rc.collect_recombs("1 0 0 3\n1 0 1\n")
+        self.assertArrayEqual(rc.args.edges.left[2:], [0.0, 3.0, 0.0])
+        self.assertArrayEqual(rc.args.edges.right[2:], [3.0, 5.0, 5.0])
+        ts = rc.tree_sequence([1])
+        self.assertEqual(ts.sequence_length, 5.0)
+        for chrom, length, tmrca in [(0, 3.0, 2.0), (1, 2.0, 1.0)]:
+            chrom_ts = rc.tree_sequence([1], chromosome=chrom)
+            self.assertEqual(chrom_ts.sequence_length, length)
+            self.assertEqual(chrom_ts.num_trees, 1)
+            self.assertEqual(chrom_ts.first().tmrca(0, 1), tmrca)
+        self.assertRaises(ValueError, rc.tree_sequence, [1], chromosome=2)
+        # chromosome lengths must add up to the sequence length
+        with self.assertRaisesRegex(ValueError, "sum to ts.sequence_length"):
+            ftprime.RecombCollector(ts=init_ts, node_ids={(0,0):1, (0,1):2},
+                                    locus_position=[[0.0, 3.0], [0.0, 1.0]])
+
     def test_i2c(self):
         rc = self.bigger_ex()
         self.assertEqual(rc.i2c(0, 0), 0)
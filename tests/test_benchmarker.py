@@ -0,0 +1,189 @@
+import ftprime
+import json
+import msprime
+import os
+import shutil
+import tempfile
+
+from benchmarks import compare, run_benchmarks
+from ftprime.benchmarker import Timings, read_events
+from tests import FtprimeTestCase
+
+
+class TimingsTestCase(FtprimeTestCase):
+    """
+    Test that the steps of work are recorded.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def run_sim(self, timings):
+        N = 6
+        records = self.new_recorder(N, timings=timings)
+        pop, _ = self.run_generations(records, list(range(N)), N, range(1, 7),
+                                      simplify_every=3)
+        records.tree_sequence(pop)
+        return records
+
+    def test_events(self):
+        timings = Timings()
+        self.run_sim(timings)
+        kinds = [e.kind for e in timings.events]
+        self.assertEqual(kinds[0], 'prepping')
+        self.assertEqual(kinds.count('appending'), 6)
+        self.assertEqual(kinds.count('sorting'), 2)
+        self.assertEqual(kinds.count('simplifying'), 2)
+        self.assertEqual(kinds[-1], 'exporting')
+        self.assertEqual(timings.counts['simplifying'], 2)
+        for e in timings.events:
+            self.assertGreaterEqual(e.wall_time, 0.0)
+            self.assertGreaterEqual(e.cpu_time, 0.0)
+            if e.kind == 'appending':
+                self.assertEqual(e.edges_after, e.edges_before + 12)
+            elif e.kind == 'simplifying':
+                self.assertLessEqual(e.nodes_after, e.nodes_before)
+                self.assertIn(e.generation, (3.0, 6.0))
+        for kind, total in timings.times.items():
+            self.assertAlmostEqual(total, sum(e.cpu_time for e in timings.events
+                                              if e.kind == kind))
+        self.assertEqual(timings.time_sorting, timings.times['sorting'])
+
+    def test_max_events(self):
+        timings = Timings(max_events=3)
+        self.run_sim(timings)
+        self.assertEqual(len(timings.events), 3)
+        self.assertEqual(timings.events[-1].kind, 'exporting')
+        self.assertEqual(timings.counts['appending'], 6)
+
+    def test_file(self):
+        path = os.path.join(self.tempdir, "events.jsonl")
+        timings = Timings(max_events=3, path=path)
+        self.run_sim(timings)
+        timings.close()
+        events = read_events(path)
+        # every step, including setting up the recorder
+        self.assertEqual(len(events), sum(timings.counts.values()) + 1)
+        self.assertEqual(events[-3:], list(timings.events))
+
+    def test_sample_every(self):
+        timings = Timings(sample_every=4)
+        self.run_sim(timings)
+        self.assertEqual(timings.counts['appending'], 6)
+        kinds = [e.kind for e in timings.events]
+        self.assertEqual(kinds.count('appending'), 2)
+        self.assertEqual(kinds.count('simplifying'), 1)
+        self.assertRaises(ValueError, Timings, sample_every=0)
+
+    def test_uninstrumented(self):
+        records = self.run_sim(None)
+        self.assertNotIn('add_records', vars(records))
+        records = self.run_sim(Timings())
+        self.assertIn('add_records', vars(records))
+
+    def test_recomb_collector(self):
+        timings = Timings()
+        init_ts = msprime.simulate(2, length=3.0, random_seed=self.random_seed)
+        rc = ftprime.RecombCollector(ts=init_ts, node_ids={(0,0): 0, (0,1): 1},
+                                     locus_position=[0.0, 1.0, 2.0, 3.0],
+                                     benchmark=timings)
+        self.assertIs(rc.args.timings, timings)
+        rc.increment_time()
+        rc.collect_recombs("1 0 1\n1 0 0 1\n")
+        self.assertEqual([e.kind for e in timings.events][-2:],
+                         ['parsing', 'appending'])
+
+
+class RunBenchmarksTestCase(FtprimeTestCase):
+    """
+    Test that the benchmark suite runs and saves its results.
+    """
+
+    def test_run(self):
+        tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+        path = os.path.join(tempdir, "results.json")
+        try:
+            run_benchmarks.main(["-N", "5", "-T", "4", "-G", "2", "-l", "10",
+                                 "-r", "0.1", "-n", "2", "-o", path])
+            with open(path, 'r') as f:
+                out = json.load(f)
+        finally:
+            shutil.rmtree(tempdir)
+        self.assertEqual(out['repeats'], 2)
+        benchmarks = [r['benchmark'] for r in out['results']]
+        self.assertEqual(benchmarks, ['recording', 'wf', 'parsing', 'parsing',
+                                      'simplify'])
+        for result in out['results']:
+            self.assertEqual(result['params']['N'], 5)
+            for times in result['phases'].values():
+                self.assertEqual(len(times), 2)
+                for x in times:
+                    self.assertGreaterEqual(x, 0.0)
+        simplify = out['results'][-1]['phases']
+        for phase in Timings.PHASES + ('update_times', 'total'):
+            self.assertIn(phase, simplify)
+
+
+class CompareTestCase(FtprimeTestCase):
+    """
+    Test the comparison of benchmark results with a baseline.
+    """
+
+    def results(self, simplifying):
+        return {'environment': {'msprime': '1.0'}, 'repeats': 3,
+                'results': [{'benchmark': 'simplify', 'params': {'N': 10},
+                             'phases': {'sorting': [1.0, 1.1, 0.9],
+                                        'simplifying': simplifying},
+                             'sizes': {}},
+                            {'benchmark': 'wf', 'params': {'N': 10},
+                             'phases': {'sorting': [1.0, 1.0, 1.0]},
+                             'sizes': {}}]}
+
+    def test_compare_phase(self):
+        base, cur, ratio, noise, status = compare.compare_phase(
+                [1.0, 1.1, 0.9], [2.0, 2.2, 1.8])
+        self.assertEqual((base, cur), (1.0, 2.0))
+        self.assertAlmostEqual(ratio, 2.0)
+        self.assertGreater(noise, 0.0)
+        self.assertEqual(status, 'regressed')
+        self.assertEqual(compare.compare_phase([2.0] * 3, [1.0] * 3)[-1],
+                         'improved')
+        # within the threshold
+        self.assertEqual(compare.compare_phase([1.0] * 3, [1.05] * 3)[-1],
+                         'same')
+        # within the noise of repeated runs
+        self.assertEqual(compare.compare_phase([1.0, 2.0, 1.5],
+                                               [2.0, 1.0, 1.8])[-1], 'same')
+        # too small to matter
+        self.assertEqual(compare.compare_phase([0.001] * 3, [0.002] * 3)[-1],
+                         'same')
+        self.assertEqual(compare.compare_phase([0.0] * 3, [0.0] * 3)[2], 1.0)
+
+    def test_main(self):
+        tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+        try:
+            paths = {}
+            for name, simplifying in [('base', [1.0, 1.1, 0.9]),
+                                      ('same', [1.0, 0.95, 1.05]),
+                                      ('slow', [2.0, 2.1, 1.9])]:
+                paths[name] = os.path.join(tempdir, name + ".json")
+                with open(paths[name], 'w') as f:
+                    json.dump(self.results(simplifying), f)
+            comparisons = compare.compare(compare.load_results(paths['base']),
+                                          compare.load_results(paths['slow']))
+            self.assertEqual([(c.benchmark, c.phase, c.status)
+                              for c in comparisons],
+                             [('simplify', 'sorting', 'same'),
+                              ('simplify', 'simplifying', 'regressed'),
+                              ('wf', 'sorting', 'same')])
+            self.assertEqual(compare.main([paths['base'], paths['same']]), 0)
+            self.assertEqual(compare.main([paths['base'], paths['slow']]), 1)
+            self.assertEqual(compare.main([paths['base'], paths['slow'],
+                                           "--phases", "sorting"]), 0)
+            self.assertEqual(compare.main([paths['base'], paths['slow'],
+                                           "--threshold", "2.0"]), 0)
+        finally:
+            shutil.rmtree(tempdir)
@@ -0,0 +1,113 @@
+import ftprime
+import msprime
+import numpy as np
+import os
+
+from tests import FtprimeTestCase
+
+
+class EdgeBufferTestCase(FtprimeTestCase):
+    """
+    Test that edges go through an EdgeBuffer unchanged.
+    """
+
+    def random_edges(self, n):
+        rng = np.random.RandomState(self.random_seed)
+        left = rng.uniform(size=n)
+        right = left + rng.uniform(size=n)
+        parent = rng.randint(0, 100, size=n)
+        child = rng.randint(0, 100, size=n)
+        return left, right, parent, child
+
+    def check_flush(self, buf, left, right, parent, child):
+        self.assertEqual(buf.num_rows, len(left))
+        edges = msprime.EdgeTable()
+        buf.flush(edges)
+        self.assertEqual(buf.num_rows, 0)
+        self.assertArrayEqual(edges.left, left)
+        self.assertArrayEqual(edges.right, right)
+        self.assertArrayEqual(edges.parent, parent)
+        self.assertArrayEqual(edges.child, child)
+
+    def test_add_row(self):
+        left, right, parent, child = self.random_edges(50)
+        for chunk_size in (1, 7, 50, 1000):
+            buf = ftprime.EdgeBuffer(chunk_size=chunk_size)
+            for x in zip(left, right, parent, child):
+                buf.add_row(*x)
+            self.check_flush(buf, left, right, parent, child)
+
+    def test_append_columns(self):
+        left, right, parent, child = self.random_edges(50)
+        for chunk_size in (1, 7, 50, 1000):
+            buf = ftprime.EdgeBuffer(chunk_size=chunk_size)
+            buf.add_row(left[0], right[0], parent[0], child[0])
+            for a, b in [(1, 3), (3, 20), (20, 21), (21, 50)]:
+                buf.append_columns(left[a:b], right[a:b],
+                                   parent[a:b], child[a:b])
+            self.check_flush(buf, left, right, parent, child)
+            # and reuse after flushing
+            buf.append_columns(left, right, parent, child)
+            self.check_flush(buf, left, right, parent, child)
+
+    def test_remap_nodes(self):
+        left, right, parent, child = self.random_edges(50)
+        node_map = np.arange(100)[::-1]
+        buf = ftprime.EdgeBuffer(chunk_size=20)
+        buf.append_columns(left[:30], right[:30], parent[:30], child[:30])
+        buf.append_columns(left[30:], right[30:], parent[30:], child[30:])
+        buf.remap_nodes(node_map)
+        self.check_flush(buf, left, right, node_map[parent], node_map[child])
+
+    def test_spill(self):
+        left, right, parent, child = self.random_edges(50)
+        buf = ftprime.EdgeBuffer(chunk_size=7, max_bytes=100)
+        for x in zip(left[:30], right[:30], parent[:30], child[:30]):
+            buf.add_row(*x)
+        buf.append_columns(left[30:], right[30:], parent[30:], child[30:])
+        self.assertGreater(buf.num_spilled, 0)
+        self.assertGreater(buf.spilled_bytes, 0)
+        full_chunks = sum(x.nbytes for chunk in buf.chunks[buf.num_spilled:]
+                          for x in chunk)
+        self.assertLessEqual(full_chunks, 100)
+        spill_path = buf._spill_path
+        self.assertTrue(os.path.exists(spill_path))
+        node_map = np.arange(100)[::-1]
+        buf.remap_nodes(node_map)
+        self.check_flush(buf, left, right, node_map[parent], node_map[child])
+        self.assertFalse(os.path.exists(spill_path))
+        self.assertEqual(buf.num_spilled, 0)
+
+    def test_recorder_spills_edges(self):
+        init_ts = msprime.simulate(4, random_seed=self.random_seed)
+        records = ftprime.ARGrecorder(ts=init_ts, node_ids={k: k for k in range(4)},
+                                      expected_edges_per_generation=2,
+                                      max_edge_bytes=0)
+        records.add_individuals([4, 5, 6, 7, 8], 1.0)
+        records.add_records([0.0] * 3, [1.0] * 3, [0, 1, 2], [4, 5, 6])
+        records.add_record(0.0, 1.0, 3, (7, 8))
+        self.assertEqual(records.edge_buffer.num_spilled, 1)
+        ts = records.tree_sequence([4, 5, 6, 7, 8])
+        self.assertEqual(ts.num_samples, 5)
+        # tree_sequence leaves the recorded edges where they are
+        self.assertEqual(records.edge_buffer.num_spilled, 1)
+        records.simplify([4, 5, 6, 7, 8])
+        self.assertEqual(records.edge_buffer.num_spilled, 0)
+
+    def test_bad_chunk_size(self):
+        self.assertRaises(ValueError, ftprime.EdgeBuffer, 0)
+
+    def test_recorder_buffers_edges(self):
+        init_ts = msprime.simulate(4, random_seed=self.random_seed)
+        records = ftprime.ARGrecorder(ts=init_ts, node_ids={k: k for k in range(4)},
+                                      expected_edges_per_generation=3)
+        num_init = init_ts.num_edges
+        records.add_individuals([4, 5], 1.0)
+        records.add_record(0.0, 0.5, 0, (4, 5))
+        records.add_records([0.5, 0.5], [1.0, 1.0], [1, 2], [4, 5])
+        self.assertEqual(records.table_collection.edges.num_rows, num_init)
+        self.assertEqual(records.num_edges, num_init + 4)
+        self.assertEqual(records.edges.num_rows, num_init + 4)
+        self.assertEqual(records.edge_buffer.num_rows, 0)
+        self.assertArrayEqual(records.edges.child[num_init:],
+                              [records.node_ids[u] for u in (4, 5, 4, 5)])
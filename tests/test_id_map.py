@@ -0,0 +1,107 @@
+import ftprime
+import msprime
+import numpy as np
+import random
+
+from tests import FtprimeTestCase
+
+
+class DenseIdMapTestCase(FtprimeTestCase):
+    """
+    Test that DenseIdMap behaves like the dict it replaces.
+    """
+
+    def check_same(self, dense, d):
+        self.assertEqual(len(dense), len(d))
+        self.assertEqual(dict(dense.items()), d)
+        for k in d:
+            self.assertTrue(k in dense)
+            self.assertEqual(dense[k], d[k])
+
+    def test_init(self):
+        d = {5: 0, 7: 1, 6: 2}
+        dense = ftprime.DenseIdMap(d)
+        self.check_same(dense, d)
+        self.assertFalse(4 in dense)
+        self.assertFalse(8 in dense)
+        self.assertFalse(-1 in dense)
+        self.assertRaises(KeyError, dense.__getitem__, 4)
+        self.assertRaises(KeyError, dense.__getitem__, 1000)
+        self.check_same(ftprime.DenseIdMap(), {})
+
+    def test_setitem(self):
+        random.seed(self.random_seed)
+        d = {}
+        dense = ftprime.DenseIdMap()
+        for j, k in enumerate(random.sample(range(10, 200), 100)):
+            d[k] = j
+            dense[k] = j
+            self.check_same(dense, d)
+
+    def test_lookup(self):
+        d = {5: 0, 7: 1, 6: 2, 20: 3}
+        dense = ftprime.DenseIdMap(d)
+        out = dense.lookup([7, 8, 20, 1, 5, 100])
+        self.assertArrayEqual(out, [1, ftprime.NULL_ID, 3, ftprime.NULL_ID,
+                                    0, ftprime.NULL_ID])
+        self.assertArrayEqual(dense.contains([6, 4, 20]), [True, False, True])
+
+    def test_assign(self):
+        dense = ftprime.DenseIdMap({5: 0})
+        dense.assign(np.arange(10, 20), np.arange(1, 11))
+        dense.assign([2], [11])
+        d = {5: 0, 2: 11}
+        d.update({10 + j: 1 + j for j in range(10)})
+        self.check_same(dense, d)
+
+    def test_reset(self):
+        dense = ftprime.DenseIdMap({5: 0, 6: 1})
+        dense.reset([40, 32, 35])
+        self.check_same(dense, {40: 0, 32: 1, 35: 2})
+        self.assertEqual(dense.offset, 32)
+        dense.reset([])
+        self.check_same(dense, {})
+
+    def test_remap(self):
+        dense = ftprime.DenseIdMap({5: 0, 9: 2, 7: 3})
+        dense.remap(np.array([4, -1, 1, 0]))
+        self.check_same(dense, {5: 4, 9: 1, 7: 0})
+
+
+class DenseRecorderTestCase(FtprimeTestCase):
+    """
+    Test that ARGrecorder gives the same answers with dense_ids.
+    """
+
+    def test_wf(self):
+        random.seed(self.random_seed)
+        N = 10
+        init_ts = msprime.simulate(N, recombination_rate=1.0,
+                                   random_seed=self.random_seed)
+        node_ids = {k: u for k, u in enumerate(init_ts.samples())}
+        records_a = ftprime.ARGrecorder(ts=init_ts, node_ids=node_ids)
+        records_b = ftprime.ARGrecorder(ts=init_ts, node_ids=node_ids,
+                                        dense_ids=True)
+        pop = list(range(N))
+        next_id = N
+        for t in range(1, 21):
+            children = list(range(next_id, next_id + N))
+            next_id += N
+            parents = [random.choice(pop) for _ in range(2 * N)]
+            bps = [random.random() for _ in range(N)]
+            for r in (records_a, records_b):
+                r.add_individuals(children, t)
+                r.add_records(lefts=[0.0] * N + bps,
+                              rights=bps + [1.0] * N,
+                              parents=parents,
+                              children=children + children)
+            pop = children
+            if t % 5 == 0:
+                records_a.simplify(pop)
+                records_b.simplify(pop)
+                self.assertEqual(dict(records_b.node_ids.items()),
+                                 records_a.node_ids)
+        self.assertArrayEqual(records_a.get_nodes(pop),
+                              records_b.get_nodes(pop))
+        self.check_trees(records_a.tree_sequence(pop),
+                         records_b.tree_sequence(pop))
@@ -0,0 +1,117 @@
+import ftprime
+import io
+import msprime
+import numpy as np
+
+from tests import FtprimeTestCase
+
+
+class FormatRecombsTestCase(FtprimeTestCase):
+    """
+    Test that format_recombs writes what parse_recombs reads.
+    """
+
+    def test_format(self):
+        recombs = ftprime.RecombData(child=np.array([0, 0, 1000]),
+                                     parent=np.array([9, 8, 10 ** 12]),
+                                     ploidy=np.array([0, 1, 1]),
+                                     offsets=np.array([0, 0, 3, 4]),
+                                     crossovers=np.array([0, 10, 9999, 99]))
+        text = "0 9 0\n0 8 1 0 10 9999\n1000 1000000000000 1 99\n"
+        self.assertEqual(ftprime.format_recombs(recombs), text)
+        self.assertEqual(ftprime.format_recombs(recombs, binary=True),
+                         text.encode('ascii'))
+
+    def test_round_trip(self):
+        rng = np.random.RandomState(self.random_seed)
+        lines = []
+        for k in range(100):
+            rec = sorted(rng.randint(0, 10 ** rng.randint(1, 9),
+                                     size=rng.randint(0, 5)))
+            lines.append([10 ** 12 + k // 2, rng.randint(0, 10 ** 6),
+                          rng.randint(0, 2)] + rec)
+        text = "".join(" ".join(str(y) for y in x) + "\n" for x in lines)
+        recombs = ftprime.parse_recombs(text)
+        self.assertEqual(ftprime.format_recombs(recombs), text)
+
+    def test_empty(self):
+        recombs = ftprime.parse_recombs("")
+        self.assertEqual(ftprime.format_recombs(recombs), "")
+        self.assertEqual(ftprime.format_recombs(recombs, binary=True), b"")
+
+
+class RecombGeneratorTestCase(FtprimeTestCase):
+    """
+    Test that RecombGenerator makes output like simuPOP's Recombinator.
+    """
+
+    def test_generations(self):
+        N, num_loci = 20, 50
+        gen = ftprime.RecombGenerator(N, num_loci, 0.1, seed=self.random_seed)
+        parents = np.arange(N)
+        for t in range(1, 4):
+            recombs = ftprime.parse_recombs(gen.next_output())
+            offspring = np.arange(t * N, (t + 1) * N)
+            self.assertArrayEqual(recombs.child, np.repeat(offspring, 2))
+            self.assertArrayEqual(gen.population, offspring)
+            self.assertEqual(gen.generation, t)
+            self.assertTrue(np.all(np.isin(recombs.parent, parents)))
+            self.assertTrue(np.all(recombs.parent[::2]
+                                   != recombs.parent[1::2]))
+            self.assertTrue(np.all(np.isin(recombs.ploidy, [0, 1])))
+            for k in range(2 * N):
+                rec = recombs.crossovers[recombs.offsets[k]:
+                                         recombs.offsets[k + 1]]
+                self.assertTrue(np.all(np.diff(rec) > 0))
+                self.assertTrue(np.all(rec < num_loci - 1))
+            parents = offspring
+
+    def test_seed(self):
+        a = ftprime.RecombGenerator(10, 100, 0.05, seed=self.random_seed)
+        b = ftprime.RecombGenerator(10, 100, 0.05, seed=self.random_seed)
+        self.assertEqual(list(a.generate(3)),
+                         [x.decode('ascii')
+                          for x in b.generate(3, binary=True)])
+
+    def test_crossovers(self):
+        # crossovers are independent, with probability recomb_rate
+        gen = ftprime.RecombGenerator(5000, 5, 0.5, seed=self.random_seed)
+        recombs = gen.next_recombs()
+        freq = np.bincount(recombs.crossovers, minlength=4) / 10000
+        self.assertTrue(np.all(abs(freq - 0.5) < 0.02))
+        gen = ftprime.RecombGenerator(10, 5, 1.0, seed=self.random_seed)
+        recombs = gen.next_recombs()
+        self.assertArrayEqual(recombs.crossovers, np.tile(np.arange(4), 20))
+        gen = ftprime.RecombGenerator(10, 1, 1.0, seed=self.random_seed)
+        self.assertEqual(len(gen.next_recombs().crossovers), 0)
+
+    def test_write(self):
+        gen = ftprime.RecombGenerator(10, 100, 0.05, seed=self.random_seed)
+        f = io.BytesIO()
+        size = gen.write(f, 4)
+        self.assertEqual(size, len(f.getvalue()))
+        recombs = ftprime.parse_recombs(f.getvalue())
+        self.assertEqual(len(recombs.child), 80)
+        self.assertEqual(gen.generation, 4)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, ftprime.RecombGenerator, 1, 10, 0.1)
+        self.assertRaises(ValueError, ftprime.RecombGenerator, 10, 0, 0.1)
+        self.assertRaises(ValueError, ftprime.RecombGenerator, 10, 10, 1.5)
+
+    def test_recomb_collector(self):
+        N, num_loci = 10, 20
+        gen = ftprime.RecombGenerator(N, num_loci, 0.1, seed=self.random_seed)
+        init_ts = msprime.simulate(2 * N, length=num_loci - 1,
+                                   random_seed=self.random_seed)
+        rc = ftprime.RecombCollector(ts=init_ts, node_ids=gen.node_ids,
+                                     locus_position=list(range(num_loci)),
+                                     mode='binary', seed=self.random_seed)
+        for out in gen.generate(5, binary=True):
+            rc.increment_time()
+            rc.collect_recombs(out)
+        ts = rc.tree_sequence(gen.population)
+        self.assertEqual(ts.num_samples, 2 * N)
+        self.assertEqual(ts.sequence_length, num_loci - 1)
+        for tree in ts.trees():
+            self.assertEqual(tree.num_samples(), 2 * N)
@@ -0,0 +1,68 @@
+import ftprime
+import numpy as np
+import tracemalloc
+
+from tests import FtprimeTestCase
+
+
+class ParseRecombsTestCase(FtprimeTestCase):
+    """
+    Test that parse_recombs agrees with parsing line by line.
+    """
+
+    def random_lines(self, num_lines):
+        rng = np.random.RandomState(self.random_seed)
+        lines = []
+        for k in range(num_lines):
+            rec = sorted(rng.randint(0, 1000, size=rng.randint(0, 5)))
+            lines.append([10 ** 12 + k // 2, rng.randint(0, 10 ** 6),
+                          rng.randint(0, 2)] + rec)
+        return lines
+
+    def check_parse(self, lines, data):
+        recombs = ftprime.parse_recombs(data)
+        self.assertArrayEqual(recombs.child, [x[0] for x in lines])
+        self.assertArrayEqual(recombs.parent, [x[1] for x in lines])
+        self.assertArrayEqual(recombs.ploidy, [x[2] for x in lines])
+        self.assertEqual(len(recombs.offsets), len(lines) + 1)
+        for k, x in enumerate(lines):
+            a, b = recombs.offsets[k], recombs.offsets[k + 1]
+            self.assertArrayEqual(recombs.crossovers[a:b], x[3:])
+
+    def test_parse(self):
+        lines = self.random_lines(50)
+        text = "\n".join(" ".join(str(y) for y in x) for x in lines)
+        self.check_parse(lines, text)
+        self.check_parse(lines, text.encode('ascii'))
+
+    def test_whitespace(self):
+        text = "\n  1\t0  1 \r\n\n1 0 0 7 8\n\n"
+        self.check_parse([[1, 0, 1], [1, 0, 0, 7, 8]], text)
+
+    def test_empty(self):
+        self.check_parse([], "")
+        self.check_parse([], b" \n \n")
+
+    def test_errors(self):
+        for text in ["1 0", "1 0 1\n2", "1 0 -1", "1 0 1 x"]:
+            self.assertRaises(ValueError, ftprime.parse_recombs, text)
+
+    def test_long_integers(self):
+        big = 10 ** 18 - 1
+        self.check_parse([[big, 7, 1, big]], "{0} 7 1 {0}\n".format(big))
+        self.assertRaises(ValueError, ftprime.parse_recombs,
+                          "{} 7 1\n".format(10 ** 18))
+
+    def test_memory(self):
+        # the working memory is a small multiple of the size of the input
+        lines = self.random_lines(4000)
+        data = "\n".join(" ".join(str(y) for y in x)
+                         for x in lines).encode('ascii')
+        tracemalloc.start()
+        try:
+            recombs = ftprime.parse_recombs(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(recombs.child), 4000)
+        self.assertLess(peak, 12 * len(data))
@@ -0,0 +1,52 @@
+import ftprime
+import msprime
+
+from tests import FtprimeTestCase
+
+
+class SimplifyPolicyTestCase(FtprimeTestCase):
+    """
+    Test that ARGrecorder.maybe_simplify simplifies when it should.
+    """
+
+    def run_sim(self, policy, N=10, ngens=30):
+        records = self.new_recorder(N, simplify_policy=policy)
+        pop = list(range(N))
+        next_id = N
+        unsimplified = []
+        for t in range(1, ngens + 1):
+            pop, next_id = self.record_generation(records, pop, next_id, t)
+            unsimplified.append(records.num_unsimplified_edges)
+            if records.maybe_simplify(pop):
+                self.assertEqual(records.num_unsimplified_edges, 0)
+        return records, unsimplified
+
+    def test_max_edges(self):
+        policy = ftprime.SimplifyPolicy(max_unsimplified_edges=100)
+        records, unsimplified = self.run_sim(policy)
+        # each generation adds 20 edges
+        self.assertEqual(records.num_simplifies, 30 // 5)
+        self.assertTrue(max(unsimplified) <= 100)
+
+    def test_max_bytes(self):
+        policy = ftprime.SimplifyPolicy(max_bytes=1)
+        records, _ = self.run_sim(policy, ngens=5)
+        self.assertEqual(records.num_simplifies, 5)
+        policy = ftprime.SimplifyPolicy(max_bytes=10 ** 12)
+        records, _ = self.run_sim(policy, ngens=5)
+        self.assertEqual(records.num_simplifies, 0)
+
+    def test_target_fraction(self):
+        policy = ftprime.SimplifyPolicy(target_fraction=0.99999)
+        records, _ = self.run_sim(policy, ngens=5)
+        self.assertTrue(records.num_simplifies >= 1)
+        self.assertTrue(records.last_simplify_cost is not None)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, ftprime.SimplifyPolicy)
+        self.assertRaises(ValueError, ftprime.SimplifyPolicy,
+                          target_fraction=1.5)
+        init_ts = msprime.simulate(4, random_seed=self.random_seed)
+        records = ftprime.ARGrecorder(ts=init_ts,
+                                      node_ids={k: k for k in range(4)})
+        self.assertRaises(ValueError, records.maybe_simplify, [0, 1])
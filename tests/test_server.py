@@ -0,0 +1,160 @@
+import ftprime
+import msprime
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import tempfile
+import time
+
+from tests import FtprimeTestCase
+
+
+class RecorderServerTestCase(FtprimeTestCase):
+    """
+    Test that recording through a RecorderServer gives the same answers as
+    recording directly.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix="ftprime_test_")
+        self.path = os.path.join(self.tempdir, "recorder.sock")
+        self.N = 6
+        self.init_ts = msprime.simulate(self.N, random_seed=self.random_seed)
+        self.node_ids = {k: k for k in range(self.N)}
+
+    def tearDown(self):
+        # servers are detached, so must be stopped even if a test failed
+        try:
+            ftprime.RecorderClient(self.path).close()
+        except Exception:
+            # no server, or one that stopped recording after an error
+            pass
+        shutil.rmtree(self.tempdir)
+
+    def start_server(self):
+        server = ftprime.RecorderServer(self.path, ts=self.init_ts,
+                                        node_ids=self.node_ids)
+        server.start()
+        return server
+
+    def run_sim(self, records, ngens):
+        N = self.N
+        pop = list(range(N))
+        next_id = N
+        for t in range(1, ngens):
+            # in batches, and one at a time
+            pop, next_id = self.record_generation(records, pop, next_id, t,
+                                                  one_at_a_time=(t % 2 == 0))
+            if t % 4 == 0:
+                records.simplify(pop)
+        return pop
+
+    def test_server(self):
+        random.seed(self.random_seed)
+        records = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.node_ids)
+        pop = self.run_sim(records, 10)
+        server = self.start_server()
+        client = ftprime.RecorderClient(self.path, buffer_size=100)
+        random.seed(self.random_seed)
+        self.run_sim(client, 10)
+        self.check_trees(records.tree_sequence(pop), client.tree_sequence(pop))
+        self.assertEqual(records.tree_sequence().num_nodes,
+                         client.tree_sequence().num_nodes)
+        client.close()
+        server.join()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_errors(self):
+        server = self.start_server()
+        with ftprime.RecorderClient(self.path) as client:
+            client.add_individual(self.N, 1.0)
+            client.sync()
+            client.add_record(0.0, 1.0, -5, (self.N,))
+            self.assertRaises(ValueError, client.sync)
+            # later events are not recorded on top of the missing ones
+            client.add_individual(self.N + 1, 2.0)
+            client.add_record(0.0, 1.0, self.N, (self.N + 1,))
+            self.assertRaises(ValueError, client.sync)
+            self.assertRaises(ValueError, client.tree_sequence)
+        # and for another client
+        client = ftprime.RecorderClient(self.path)
+        self.assertRaises(ValueError, client.simplify, [0, 1])
+        # but it can still stop the server
+        self.assertRaises(ValueError, client.close)
+        self.assertTrue(server.join(timeout=5))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_non_integers(self):
+        # are refused by the client, rather than recorded as someone else
+        server = self.start_server()
+        client = ftprime.RecorderClient(self.path)
+        self.assertRaises(ValueError, client.add_individual, 3.7, 1.0)
+        self.assertRaises(ValueError, client.add_individuals, [6, 7.5], 1.0)
+        self.assertRaises(ValueError, client.add_individual, self.N, 1.0,
+                          population=0.5)
+        self.assertRaises(ValueError, client.add_individual, self.N, 1.0,
+                          population=2 ** 40)
+        self.assertRaises(ValueError, client.add_record, 0.0, 1.0, 2.5,
+                          (self.N,))
+        self.assertRaises(ValueError, client.add_records, [0.0], [1.0], [0],
+                          [6.2])
+        self.assertRaises(ValueError, client.simplify, [0, 1.5])
+        self.assertRaises(ValueError, client.tree_sequence, [0.5])
+        client.add_individual(self.N, 1.0)
+        client.add_record(0.0, 1.0, 2, (self.N,))
+        ts = client.tree_sequence([0, self.N])
+        self.assertEqual(ts.num_samples, 2)
+        client.close()
+        server.join()
+
+    def wait_for_exit(self):
+        # the server removes its socket when it stops
+        for _ in range(500):
+            if not os.path.exists(self.path):
+                return
+            time.sleep(0.01)
+        self.fail("The server did not stop.")
+
+    def test_simulation_crash(self):
+        random.seed(self.random_seed)
+        records = ftprime.ARGrecorder(ts=self.init_ts, node_ids=self.node_ids)
+        pop = self.run_sim(records, 10)
+
+        def simulate():
+            self.start_server()
+            client = ftprime.RecorderClient(self.path)
+            random.seed(self.random_seed)
+            self.run_sim(client, 10)
+            client.sync()
+            raise RuntimeError("The simulation crashed.")
+
+        context = multiprocessing.get_context('fork')
+        process = context.Process(target=simulate)
+        process.start()
+        process.join()
+        self.assertNotEqual(process.exitcode, 0)
+        # the server still has everything that was recorded
+        client = ftprime.RecorderClient(self.path)
+        self.check_trees(records.tree_sequence(pop), client.tree_sequence(pop))
+        client.close()
+        self.wait_for_exit()
+
+    def test_stale_socket(self):
+        # as left by a server that was killed
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        server = self.start_server()
+        client = ftprime.RecorderClient(self.path)
+        self.assertEqual(client.tree_sequence().num_samples, self.N)
+        # but not one in use
+        self.assertRaises(ValueError, self.start_server)
+        client.close()
+        self.assertTrue(server.join(timeout=5))
+        self.assertFalse(os.path.exists(self.path))
+        with open(self.path, 'w') as f:
+            f.write("not a socket")
+        self.assertRaises(ValueError, self.start_server)
+
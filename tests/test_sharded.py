@@ -0,0 +1,150 @@
+import ftprime
+import random
+import msprime
+import numpy as np
+
+from tests import FtprimeTestCase
+
+class ClipEdgesTestCase(FtprimeTestCase):
+    """
+    Test cutting edges up at window boundaries.
+    """
+
+    def test_clip_edges(self):
+        breaks = np.array([0.0, 0.25, 0.5, 1.0])
+        window, index, left, right = ftprime.clip_edges(
+                breaks, [0.0, 0.1, 0.25, 0.3], [1.0, 0.2, 0.5, 0.75])
+        self.assertArrayEqual(window, [0, 1, 2, 0, 1, 1, 2])
+        self.assertArrayEqual(index, [0, 0, 0, 1, 2, 3, 3])
+        self.assertArrayEqual(left, [0.0, 0.25, 0.5, 0.1, 0.25, 0.3, 0.5])
+        self.assertArrayEqual(right, [0.25, 0.5, 1.0, 0.2, 0.5, 0.5, 0.75])
+
+
+class ShardedTestCase(FtprimeTestCase):
+    """
+    Test that a ShardedRecorder gives the same tree sequence as an
+    ARGrecorder.
+    """
+
+    def run_sim(self, records, N):
+        random.seed(self.random_seed)
+        pop, _ = self.run_generations(records, list(range(N)), N, range(1, 15))
+        return pop
+
+    def check_sharded(self, recombination_rate=0.0, **kwargs):
+        N = 6
+        init_ts = msprime.simulate(N, recombination_rate=recombination_rate,
+                                   random_seed=self.random_seed)
+        records = ftprime.ARGrecorder(ts=init_ts,
+                                      node_ids={k: k for k in range(N)})
+        pop = self.run_sim(records, N)
+        sharded = ftprime.ShardedRecorder(ts=init_ts,
+                                          node_ids={k: k for k in range(N)},
+                                          **kwargs)
+        try:
+            self.assertEqual(pop, self.run_sim(sharded, N))
+            self.check_trees(records.tree_sequence(pop),
+                             sharded.tree_sequence(pop))
+        finally:
+            sharded.close()
+
+    def test_one_window(self):
+        self.check_sharded(num_windows=1)
+
+    def test_windows(self):
+        self.check_sharded(num_windows=3)
+
+    def test_breaks(self):
+        self.check_sharded(breaks=[0.0, 0.1, 0.15, 0.7, 1.0], processes=2)
+
+    def test_recombining_init(self):
+        self.check_sharded(num_windows=4, recombination_rate=2.0)
+        for seed in range(1, 6):
+            init_ts = msprime.simulate(10, recombination_rate=2.0,
+                                       random_seed=seed)
+            self.assertGreater(init_ts.num_trees, 1)
+            sharded = ftprime.ShardedRecorder(ts=init_ts,
+                                              node_ids={k: k for k in range(10)},
+                                              num_windows=4)
+            sharded.close()
+
+    def check_mrcas(self, tsa, tsb):
+        # survivors are older than others, so the nodes may be in a
+        # different order: compare the time and population of each MRCA
+        samples = list(tsa.samples())
+        self.assertEqual(samples, list(tsb.samples()))
+        for x in np.linspace(0, tsa.sequence_length, 20, endpoint=False):
+            ta, tb = tsa.at(x), tsb.at(x)
+            for u in samples:
+                for v in samples:
+                    a, b = tsa.node(ta.mrca(u, v)), tsb.node(tb.mrca(u, v))
+                    self.assertEqual((a.time, a.population),
+                                     (b.time, b.population))
+
+    def test_populations(self):
+        # windows lose the nodes of the initial populations at different
+        # times, so simplifying them separately would number the
+        # populations differently
+        N = 10
+        init_ts = msprime.simulate(
+                population_configurations=[
+                    msprime.PopulationConfiguration(N // 2),
+                    msprime.PopulationConfiguration(N // 2)],
+                migration_matrix=[[0, 1], [1, 0]], recombination_rate=1.0,
+                random_seed=1)
+        records = ftprime.ARGrecorder(ts=init_ts,
+                                      node_ids={k: k for k in range(N)})
+        sharded = ftprime.ShardedRecorder(ts=init_ts,
+                                          node_ids={k: k for k in range(N)},
+                                          num_windows=3)
+        try:
+            random.seed(self.random_seed)
+            pop = list(range(N))
+            next_id = N
+            for t in range(1, 16):
+                parents = list(pop)
+                for j in range(N):
+                    if random.random() > 0.5:
+                        continue
+                    bp = random.random()
+                    lp, rp = random.choice(parents), random.choice(parents)
+                    for r in (records, sharded):
+                        r.add_individual(next_id, t)
+                        r.add_record(0.0, bp, lp, (next_id,))
+                        r.add_record(bp, 1.0, rp, (next_id,))
+                    pop[j] = next_id
+                    next_id += 1
+                if t % 4 == 0:
+                    records.simplify(pop)
+                    sharded.simplify(pop)
+                tsa = records.tree_sequence(pop)
+                tsb = sharded.tree_sequence(pop)
+                self.assertEqual(tsa.num_populations, tsb.num_populations)
+                self.check_mrcas(tsa, tsb)
+        finally:
+            sharded.close()
+
+    def test_origins(self):
+        # adding individuals does not copy the origins of every window
+        N = 6
+        init_ts = msprime.simulate(N, random_seed=self.random_seed)
+        sharded = ftprime.ShardedRecorder(ts=init_ts,
+                                          node_ids={k: k for k in range(N)},
+                                          num_windows=3)
+        try:
+            pop = self.run_sim(sharded, N)
+            self.assertEqual(sharded.num_origins, init_ts.num_nodes + 14 * N)
+            origins = list(sharded.origins)
+            sharded.add_individual(1000, 15)
+            sharded.add_individuals([1001, 1002], 15)
+            for old, new in zip(origins, sharded.origins):
+                self.assertIs(old, new)
+            self.assertEqual(sharded.tree_sequence(pop).num_samples, N)
+        finally:
+            sharded.close()
+
+    def test_bad_breaks(self):
+        init_ts = msprime.simulate(4, random_seed=self.random_seed)
+        for breaks in ([0.0, 0.5], [0.1, 1.0], [0.0, 0.5, 0.5, 1.0]):
+            with self.assertRaises(ValueError):
+                ftprime.ShardedRecorder(ts=init_ts, node_ids={}, breaks=breaks)
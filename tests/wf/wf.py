@@ -10,7 +10,7 @@ from .breakpoints import (
 
 
 def wf(N, ngens, nsamples, survival=0.0, mutation_rate=0.0, simplify_interval=10,
-       debug=False, seed=None) :
+       debug=False, seed=None, timings=None) :
     '''
     SIMPLE simulation of a bisexual, haploid Wright-Fisher population of size N
     for ngens generations, in which each individual survives with probability
@@ -19,7 +19,8 @@ def wf(N, ngens, nsamples, survival=0.0, mutation_rate=0.0, simplify_interval=10
     mutations/Morgan/generation.
 
     Outputs an ARGrecorder object for the simulation.  In the final generation,
-    a random set of individuals are chosen to be samples.
+    a random set of individuals are chosen to be samples.  If ``timings`` (a
+    ftprime.benchmarker.Timings) is given, the recorder records its steps there.
     '''
     if seed is not None:
         random.seed(seed)
@@ -28,7 +29,8 @@ def wf(N, ngens, nsamples, survival=0.0, mutation_rate=0.0, simplify_interval=10
     # initial population
     init_ts = msprime.simulate(N, recombination_rate=1.0)
     init_samples = init_ts.samples()
-    records = ARGrecorder(ts=init_ts, node_ids={k:init_samples[k] for k in range(N)})
+    records = ARGrecorder(ts=init_ts, node_ids={k:init_samples[k] for k in range(N)},
+                          timings=timings)
 
     for t in range(1, 1+ngens) :
         if debug: